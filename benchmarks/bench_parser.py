@@ -0,0 +1,97 @@
+"""
+Benchmark `ConsoleParser` over a server log.
+
+Pass a recorded log with `--log-file`, otherwise a synthetic log mixing
+player events with plenty of noise is generated.
+
+    python benchmarks/bench_parser.py --server-type java --size-mb 8
+"""
+import random
+import time
+from argparse import ArgumentParser
+from collections import Counter
+from pathlib import Path
+
+from craftlink.parser import ConsoleParser
+
+
+JAVA_LINES = (
+    b"[12:00:00] [Server thread/INFO]: Steve joined the game\n",
+    b"[12:00:01] [Server thread/INFO]: <Steve> hello there\n",
+    b"[12:00:02] [Server thread/INFO]: Steve was slain by Zombie\n",
+    b"[12:00:03] [Server thread/INFO]: Steve has made the advancement"
+    b" [Stone Age]\n",
+    b"[12:00:04] [Server thread/WARN]: Can't keep up! Is the server"
+    b" overloaded? Running 2503ms or 50 ticks behind\n",
+    b"[12:00:05] [Server thread/INFO]: Steve left the game\n",
+)
+JAVA_NOISE = (
+    b"[12:00:06] [Server thread/WARN]: Steve moved too quickly!"
+    b" 12.5,0.0,3.1\n",
+    b"[12:00:07] [Worker-Main-3/INFO]: Preparing spawn area: 42%\n",
+    b"\tat net.minecraft.server.MinecraftServer.run(SourceFile:123)\n",
+)
+BEDROCK_LINES = (
+    b"[2024-01-01 12:00:00:000 INFO] Player connected: Steve,"
+    b" xuid: 2535400000000000\n",
+    b"[2024-01-01 12:00:05:000 INFO] Player disconnected: Steve,"
+    b" xuid: 2535400000000000, pfid: abcdef\n",
+)
+BEDROCK_NOISE = (
+    b"[2024-01-01 12:00:06:000 INFO] Running AutoCompaction...\n",
+    b"NO LOG FILE! - setting up server logging...\n",
+    b"Quit correctly\n",
+)
+
+
+def synthetic_log(server_type: str, size_mb: float) -> list[bytes]:
+    """Build a log of roughly `size_mb`, about one line in ten an event."""
+    if server_type == "java":
+        events, noise = JAVA_LINES, JAVA_NOISE
+    else:
+        events, noise = BEDROCK_LINES, BEDROCK_NOISE
+    rng = random.Random(0)
+    lines = []
+    size = 0
+    while size < size_mb * 1024 * 1024:
+        if rng.random() < 0.1:
+            line = rng.choice(events)
+        else:
+            line = rng.choice(noise)
+        lines.append(line)
+        size += len(line)
+    return lines
+
+
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("--server-type", default="java")
+    parser.add_argument("--log-file", default="")
+    parser.add_argument("--size-mb", type=float, default=8.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    options = parser.parse_args()
+    if options.log_file:
+        lines = Path(options.log_file).read_bytes().splitlines(keepends=True)
+    else:
+        lines = synthetic_log(options.server_type, options.size_mb)
+    size_mb = sum(len(i) for i in lines) / 1024 / 1024
+    best = None
+    for _ in range(options.repeat):
+        console_parser = ConsoleParser(options.server_type)
+        events = Counter()
+        start = time.perf_counter()
+        for line in lines:
+            event = console_parser.parse(line)
+            if event is not None:
+                events[type(event).__name__] += 1
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{len(lines)} lines, {size_mb:.1f} MB, best of {options.repeat}:")
+    print(f"  {best:.3f}s, {len(lines) / best:,.0f} lines/s,")
+    print(f"  {size_mb / best:.1f} MB/s")
+    for event_name, count in events.most_common():
+        print(f"  {event_name}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+End-to-end benchmark of relaying server output to Discord.
+
+Runs `CraftBot` with one server, started by `CraftCommander` as usual but
+running `fake_server.py`, and a fake Discord channel in place of the real
+one. The channel records what is sent and, like Discord, rejects sends
+over the channel rate limit with a 429. Runs offline.
+
+Reports relay throughput, latency from the server writing a line to it
+being sent to Discord, messages sent per 1k lines, peak memory and event
+loop lag. With `--baseline`, exits non-zero if a result is worse than the
+baseline's by more than `--tolerance`, to use as a regression gate in CI.
+
+    python benchmarks/bench_relay.py --rate 5000 --burst-size 500
+    python benchmarks/bench_relay.py --save-baseline baseline.json
+    python benchmarks/bench_relay.py --baseline baseline.json
+"""
+import asyncio
+import gzip
+import json
+import random
+import re
+import resource
+import shlex
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from collections import deque
+from pathlib import Path
+
+import discord
+
+from craftlink.bot import CraftBot
+from craftlink.config import build_server_config
+
+
+FAKE_SERVER = Path(__file__).parent / "fake_server.py"
+END_MARKER = b"BENCHMARK-END"
+LINE_STAMP = re.compile(r"seq=(\d+) t=([\d.]+)")
+CHANNEL_ID = 1
+# Results where higher is better, the rest are better lower.
+HIGHER_IS_BETTER = ("lines_per_second",)
+# Results compared against the baseline.
+GATED_RESULTS = (
+    "lines_per_second",
+    "latency_p50",
+    "latency_p99",
+    "messages_per_1k_lines",
+    "loop_lag_p99",
+)
+
+
+class FakeMessage():
+    def __init__(self, channel: "FakeChannel") -> None:
+        self.channel = channel
+
+    async def delete(self) -> None:
+        self.channel.deletes += 1
+
+
+class FakeChannel():
+    """
+    Stands in for a Discord text channel. Sends take `send_delay` seconds
+    and are rejected with `discord.RateLimited` beyond `rate_limit` sends
+    per `period` seconds, or at random with `reject_chance`.
+    """
+    def __init__(
+        self,
+        rate_limit: int,
+        period: float,
+        send_delay: float,
+        reject_chance: float,
+    ) -> None:
+        self.id = CHANNEL_ID
+        self.rate_limit = rate_limit
+        self.period = period
+        self.send_delay = send_delay
+        self.reject_chance = reject_chance
+        self.rng = random.Random(0)
+        self.sent_times = deque()
+        self.sends = 0
+        self.files = 0
+        self.rejects = 0
+        self.deletes = 0
+        # Delivery latency of each line, by sequence number.
+        self.latencies = {}
+        self.ended = asyncio.Event()
+
+    async def send(self, content=None, embed=None, file=None) -> FakeMessage:
+        await asyncio.sleep(self.send_delay)
+        now = time.monotonic()
+        while self.sent_times and now - self.sent_times[0] > self.period:
+            self.sent_times.popleft()
+        if (
+            len(self.sent_times) >= self.rate_limit
+            or self.rng.random() < self.reject_chance
+        ):
+            self.rejects += 1
+            if self.sent_times:
+                retry_after = self.period - (now - self.sent_times[0])
+            else:
+                retry_after = self.period
+            raise discord.RateLimited(max(retry_after, 0.1))
+        self.sent_times.append(now)
+        self.sends += 1
+        texts = [content or ""]
+        if embed is not None:
+            texts.append(embed.description or "")
+        if file is not None:
+            self.files += 1
+            texts.append(_read_file(file))
+        for text in texts:
+            self._record(text, now)
+        return FakeMessage(self)
+
+    def _record(self, text: str, now: float) -> None:
+        for match in LINE_STAMP.finditer(text):
+            sequence = int(match.group(1))
+            # Session logs are re-uploaded, only count a line's first send.
+            if sequence not in self.latencies:
+                self.latencies[sequence] = now - float(match.group(2))
+        if END_MARKER.decode() in text:
+            self.ended.set()
+
+
+def _read_file(file: discord.File) -> str:
+    data = file.fp.read()
+    if file.filename.endswith(".gz"):
+        data = gzip.decompress(data)
+    elif file.filename.endswith(".zst"):
+        import zstandard
+        data = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data.decode(errors="replace")
+
+
+class LoopLagMonitor():
+    """Measures how late the event loop wakes up from short sleeps."""
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+        self.lags = []
+        self.task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(loop.time() - start - self.interval)
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        self.task.cancel()
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[round((len(samples) - 1) * fraction)]
+
+
+def make_server_dir(root: Path, options) -> Path:
+    """Server directory running the fake server in place of the real one."""
+    server_dir = root / "server"
+    server_dir.mkdir()
+    command = shlex.join([
+        sys.executable, str(FAKE_SERVER.absolute()),
+        "--server-type", options.server_type,
+        "--lines", str(options.lines),
+        "--rate", str(options.rate),
+        "--burst-size", str(options.burst_size),
+    ])
+    launcher = server_dir / "bedrock_server"
+    launcher.write_text(f"#!/bin/sh\nexec {command}\n")
+    launcher.chmod(0o755)
+    (server_dir / "server.jar").touch()
+    (server_dir / "server.properties").write_text("level-name=world\n")
+    return server_dir
+
+
+async def run(options) -> dict:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        server_dir = make_server_dir(Path(temp_dir), options)
+        server = build_server_config(
+            server_dir=str(server_dir),
+            channel_id=CHANNEL_ID,
+            server_type=options.server_type,
+            auto_restart=False,
+            # Java servers are launched with java, run the fake server.
+            java_path=str(server_dir / "bedrock_server"),
+            # The fake server's lines mostly differ only by numbers.
+            dedup_window=options.dedup_window,
+        )
+        bot = CraftBot("benchmark", [server])
+        channel = FakeChannel(
+            options.channel_rate_limit,
+            options.channel_period,
+            options.send_delay,
+            options.reject_chance,
+        )
+        bot.channels[CHANNEL_ID] = channel
+
+        async def ready() -> None:
+            pass
+
+        # Not logged in to Discord, there's nothing to wait for.
+        bot.wait_until_ready = ready
+        commander = bot.commanders[CHANNEL_ID]
+        monitor = LoopLagMonitor()
+        async with bot:
+            monitor.start()
+            start = time.monotonic()
+            await commander.start_server()
+            try:
+                await asyncio.wait_for(channel.ended.wait(), options.timeout)
+            except asyncio.TimeoutError:
+                print("Timed out waiting for the output to be relayed.")
+            elapsed = time.monotonic() - start
+            monitor.stop()
+            lines_read = commander.metrics.lines_read
+            lines_filtered = sum(
+                commander.message_filter.exclude_hits.values()
+            )
+            lines_collapsed = commander.metrics.lines_collapsed
+    latencies = list(channel.latencies.values())
+    return {
+        "lines": options.lines,
+        # Collapsed lines are relayed only as a count.
+        "lines_expected": options.lines - lines_filtered - lines_collapsed,
+        "lines_collapsed": lines_collapsed,
+        "lines_read": lines_read,
+        "lines_delivered": len(latencies),
+        "seconds": elapsed,
+        "lines_per_second": len(latencies) / elapsed,
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p90": percentile(latencies, 0.9),
+        "latency_p99": percentile(latencies, 0.99),
+        "latency_max": max(latencies, default=0.0),
+        "messages": channel.sends,
+        "messages_per_1k_lines": 1000 * channel.sends / max(lines_read, 1),
+        "files": channel.files,
+        "rate_limited": channel.rejects,
+        # Kilobytes on Linux.
+        "peak_rss_mb": resource.getrusage(
+            resource.RUSAGE_SELF
+        ).ru_maxrss / 1024,
+        "loop_lag_p99": percentile(monitor.lags, 0.99),
+        "loop_lag_max": max(monitor.lags, default=0.0),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Describe each gated result worse than the baseline's."""
+    regressions = []
+    for name in GATED_RESULTS:
+        if name not in baseline:
+            continue
+        value, expected = results[name], baseline[name]
+        if name in HIGHER_IS_BETTER:
+            worse = value < expected * (1 - tolerance)
+        else:
+            # Ignore differences too small to measure reliably.
+            worse = (
+                value > expected * (1 + tolerance)
+                and value - expected > 0.005
+            )
+        if worse:
+            regressions.append(f"{name}: {value:.4g}, baseline {expected:.4g}")
+    return regressions
+
+
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("--server-type", default="bedrock")
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--rate", type=float, default=2000.0)
+    parser.add_argument("--burst-size", type=int, default=1)
+    parser.add_argument("--channel-rate-limit", type=int, default=5)
+    parser.add_argument("--channel-period", type=float, default=5.0)
+    parser.add_argument("--send-delay", type=float, default=0.05)
+    parser.add_argument("--reject-chance", type=float, default=0.0)
+    parser.add_argument("--dedup-window", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--baseline", default="")
+    parser.add_argument("--save-baseline", default="")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    options = parser.parse_args()
+    results = asyncio.run(run(options))
+    print(
+        f"{results['lines_delivered']}/{results['lines_expected']} lines"
+        " delivered"
+        f" in {results['seconds']:.2f}s,"
+        f" {results['lines_per_second']:,.0f} lines/s"
+    )
+    print(
+        "  Latency: " + ", ".join(
+            f"{i} {results[f'latency_{i}'] * 1000:.0f}ms"
+            for i in ("p50", "p90", "p99", "max")
+        )
+    )
+    print(
+        f"  Messages: {results['messages']}"
+        f" ({results['messages_per_1k_lines']:.2f} per 1k lines),"
+        f" {results['files']} files, {results['rate_limited']} rate limited,"
+        f" {results['lines_collapsed']} repeats collapsed"
+    )
+    print(f"  Peak RSS: {results['peak_rss_mb']:.0f} MB")
+    print(
+        f"  Loop lag: p99 {results['loop_lag_p99'] * 1000:.1f}ms,"
+        f" max {results['loop_lag_max'] * 1000:.1f}ms"
+    )
+    if options.save_baseline:
+        Path(options.save_baseline).write_text(json.dumps(results, indent=2))
+    exit_code = 0
+    if results["lines_delivered"] < results["lines_expected"]:
+        print("Not every line was delivered.")
+        exit_code = 1
+    if options.baseline:
+        baseline = json.loads(Path(options.baseline).read_text())
+        regressions = compare(results, baseline, options.tolerance)
+        for regression in regressions:
+            print(f"Regression, {regression}")
+        if regressions:
+            exit_code = 1
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
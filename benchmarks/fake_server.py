@@ -0,0 +1,79 @@
+"""
+Stand-in Minecraft server for benchmarks, writing synthetic console output.
+
+Writes `--lines` lines at `--rate` lines per second, in bursts of
+`--burst-size` lines if given, then a final end marker, and keeps running
+until it reads `stop` like a real server. Each line carries its sequence
+number and the `time.monotonic()` it was written at, so the benchmark can
+measure latency from the server writing a line to it reaching Discord.
+
+    python benchmarks/fake_server.py --server-type java --rate 2000
+"""
+import random
+import sys
+import time
+from argparse import ArgumentParser
+
+
+END_MARKER = "BENCHMARK-END"
+
+JAVA_PREFIX = "[12:00:00] [Server thread/INFO]: "
+JAVA_MESSAGES = (
+    "{player} joined the game",
+    "<{player}> hello there, anyone up for the nether?",
+    "{player} was slain by Zombie",
+    "{player} has made the advancement [Stone Age]",
+    "{player} left the game",
+    "{player} moved too quickly! 12.5,0.0,3.1",
+    "Saving chunks for level 'ServerLevel[world]'/minecraft:overworld",
+)
+BEDROCK_PREFIX = "[2024-01-01 12:00:00:000 INFO] "
+BEDROCK_MESSAGES = (
+    "Player connected: {player}, xuid: 2535400000000000",
+    "Player disconnected: {player}, xuid: 2535400000000000, pfid: abcdef",
+    "Player Spawned: {player} xuid: 2535400000000000, pfid: abcdef",
+    "Running AutoCompaction...",
+)
+PLAYERS = ("Steve", "Alex", "Notch", "Herobrine", "Jeb_")
+
+
+def main() -> None:
+    parser = ArgumentParser()
+    parser.add_argument("--server-type", default="bedrock")
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--rate", type=float, default=2000.0)
+    parser.add_argument("--burst-size", type=int, default=1)
+    options = parser.parse_args()
+    if options.server_type == "java":
+        prefix, messages = JAVA_PREFIX, JAVA_MESSAGES
+        print(f"{prefix}Starting minecraft server version 1.20.4", flush=True)
+    else:
+        prefix, messages = BEDROCK_PREFIX, BEDROCK_MESSAGES
+        print(f"{prefix}Starting Server", flush=True)
+    rng = random.Random(0)
+    out = sys.stdout
+    burst_interval = options.burst_size / options.rate
+    start = time.monotonic()
+    for burst_start in range(0, options.lines, options.burst_size):
+        # Sleep until this burst is due, so the average rate holds even
+        # if writing falls behind for a while.
+        delay = start + burst_start / options.burst_size * burst_interval
+        delay -= time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        burst_end = min(burst_start + options.burst_size, options.lines)
+        for sequence in range(burst_start, burst_end):
+            message = rng.choice(messages).format(player=rng.choice(PLAYERS))
+            out.write(
+                f"{prefix}{message} seq={sequence} t={time.monotonic():.6f}\n"
+            )
+        out.flush()
+    print(f"{prefix}{END_MARKER} lines={options.lines}", flush=True)
+    for line in sys.stdin:
+        if line.strip() == "stop":
+            print(f"{prefix}Stopping server...", flush=True)
+            break
+
+
+if __name__ == "__main__":
+    main()
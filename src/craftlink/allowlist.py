@@ -0,0 +1,140 @@
+from __future__ import annotations
+import asyncio
+import json
+import logging
+from pathlib import Path
+
+from craftlink.files import FILE_IO, atomic_write_text, file_stamp
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class AllowlistStore():
+    """
+    Cached view of the server's allowlist.json (or whitelist.json).
+    Entries are indexed by name and by xuid/uuid for O(1) lookups. The file
+    is only re-read if its modification time changes, and writes are atomic,
+    optionally delayed so a burst of changes is written once. File access
+    goes through `FILE_IO`, call `refresh` before reading or changing
+    entries to pick up changes made on disk.
+    """
+    def __init__(
+        self,
+        allowlist_file: Path,
+        server_type: str,
+        write_delay: float = 0.0,
+    ) -> None:
+        self.allowlist_file = allowlist_file
+        self.server_type = server_type
+        if server_type == "bedrock":
+            self.id_name = "xuid"
+        else:
+            self.id_name = "uuid"
+        self.write_delay = write_delay
+        self._entries = {}
+        self._ids = {}
+        self._file_stamp = None
+        self._dirty = False
+        self._flush_task = None
+
+    async def refresh(self) -> None:
+        """Reload the file if it changed on disk since it was last read."""
+        stamp = await FILE_IO.file_stamp(self.allowlist_file)
+        if stamp == self._file_stamp:
+            return
+        if self._dirty:
+            LOGGER.warning(
+                f"{self.allowlist_file.name} changed on disk with unsaved"
+                " changes pending, keeping the pending changes."
+            )
+            return
+        if stamp is None:
+            entries = []
+        else:
+            entries = json.loads(
+                await FILE_IO.read_text(self.allowlist_file)
+            )
+        self._entries = {}
+        self._ids = {}
+        for entry in entries:
+            self._index(entry)
+        self._file_stamp = stamp
+
+    def _index(self, entry: dict) -> None:
+        self._entries[entry["name"]] = entry
+        user_id = entry.get(self.id_name)
+        if user_id:
+            self._ids[user_id] = entry["name"]
+
+    def __contains__(self, user_name: str) -> bool:
+        return user_name in self._entries
+
+    @property
+    def names(self) -> list[str]:
+        return list(self._entries)
+
+    def add(self, user_name: str, user_id: str) -> bool:
+        """Add a user, returning False if the name or id is already listed."""
+        if user_name in self._entries or user_id in self._ids:
+            return False
+        if self.server_type == "bedrock":
+            entry = {
+                "ignoresPlayerLimit": False,
+                "name": user_name,
+                self.id_name: user_id,
+            }
+        else:
+            entry = {"name": user_name, self.id_name: user_id}
+        self._index(entry)
+        self._dirty = True
+        return True
+
+    def remove(self, user_name: str) -> bool:
+        """Remove a user, returning False if they weren't listed."""
+        entry = self._entries.pop(user_name, None)
+        if entry is None:
+            return False
+        self._ids.pop(entry.get(self.id_name), None)
+        self._dirty = True
+        return True
+
+    async def save(self) -> None:
+        """Write pending changes now, or after `write_delay` if set."""
+        if not self._dirty:
+            return
+        if not self.write_delay:
+            await self.flush()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.write_delay)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Write pending changes to disk."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if not self._dirty:
+            return
+        entries = list(self._entries.values())
+        # Changes made while writing mark it dirty again.
+        self._dirty = False
+        try:
+            async with FILE_IO.lock(self.allowlist_file):
+                await FILE_IO.run_unlocked(
+                    self.allowlist_file,
+                    atomic_write_text,
+                    self.allowlist_file,
+                    json.dumps(entries),
+                )
+                self._file_stamp = await FILE_IO.run_unlocked(
+                    self.allowlist_file, file_stamp, self.allowlist_file
+                )
+        except BaseException:
+            self._dirty = True
+            raise
+        LOGGER.info(f"Saved {len(entries)} entries to {self.allowlist_file}.")
@@ -0,0 +1,335 @@
+from __future__ import annotations
+import asyncio
+import gzip
+import logging
+import mmap
+import re
+import struct
+import time
+from functools import partial
+from pathlib import Path
+
+from craftlink.constants import (
+    ARCHIVE_BLOCK_SIZE,
+    ARCHIVE_BLOOM_BITS,
+    ARCHIVE_BLOOM_HASHES,
+    ARCHIVE_FLUSH_SECONDS,
+    ARCHIVE_SEGMENT_SIZE,
+)
+from craftlink.files import FILE_IO
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Index entry for each block of a segment: the time of its first line, and
+# its offset and length in the segment.
+INDEX_RECORD = struct.Struct("<dQI")
+# Multipliers hashing trigrams into the bloom filter, one per hash.
+BLOOM_MULTIPLIERS = (0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D, 0x27D4EB2F)
+SEGMENT_GLOB = "console-*.log.gz"
+DURATION_PATTERN = re.compile(r"(\d+)([smhdw])")
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+class ConsoleArchive():
+    """
+    Keeps every line of console output, filtered or not, on disk for later
+    searching. Lines are stamped with the time they were read and written
+    in blocks, each compressed as its own gzip member, to segment files of
+    up to `ARCHIVE_SEGMENT_SIZE` bytes. Alongside each segment is an index
+    of when each block starts and where it is, searched memory-mapped to
+    find where a time range starts, and a bloom filter of the trigrams in
+    its lines, so searches for text skip segments that can't contain it.
+    Segments older than `keep_days` are deleted.
+    """
+    def __init__(self, archive_dir: Path, keep_days: float) -> None:
+        self.archive_dir = archive_dir
+        self.keep_days = keep_days
+        self.segment = None
+        self.segment_size = 0
+        self.bloom = None
+        self._pending = []
+        self._pending_size = 0
+        self._flush_task = None
+        self._flushing = None
+        # Blocks are written one at a time, in order.
+        self._lock = asyncio.Lock()
+
+    def append(self, line: bytes) -> None:
+        """Add a line of output, written out with the next block."""
+        line = line.rstrip(b"\r\n")
+        self._pending.append(b"%d\t%s\n" % (time.time() * 1000, line))
+        self._pending_size += len(line) + 16
+        if self._pending_size >= ARCHIVE_BLOCK_SIZE:
+            if self._flushing is None:
+                self._flushing = asyncio.create_task(self.flush())
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(ARCHIVE_FLUSH_SECONDS)
+        self._flush_task = None
+        if self._flushing is None:
+            self._flushing = asyncio.create_task(self.flush())
+
+    async def flush(self) -> None:
+        """Write the pending lines as a block."""
+        try:
+            async with self._lock:
+                while self._pending:
+                    if self._flush_task is not None:
+                        self._flush_task.cancel()
+                        self._flush_task = None
+                    block = b"".join(self._pending)
+                    first_time = int(block[:block.index(b"\t")]) / 1000
+                    self._pending = []
+                    self._pending_size = 0
+                    await self._write_block(block, first_time)
+        finally:
+            if self._flushing is asyncio.current_task():
+                self._flushing = None
+
+    async def _write_block(self, block: bytes, first_time: float) -> None:
+        if self.segment is None:
+            await FILE_IO.run_unlocked(
+                self.archive_dir,
+                partial(self.archive_dir.mkdir, parents=True, exist_ok=True),
+            )
+            self.segment = (
+                self.archive_dir / f"console-{int(first_time * 1000)}.log.gz"
+            )
+            self.segment_size = 0
+            self.bloom = bytearray(ARCHIVE_BLOOM_BITS // 8)
+        self.segment_size = await FILE_IO.run(
+            self.segment,
+            append_block,
+            self.segment,
+            block,
+            first_time,
+            self.bloom,
+        )
+        if self.segment_size >= ARCHIVE_SEGMENT_SIZE:
+            await self.end_segment()
+            await self.prune()
+
+    async def end_segment(self) -> None:
+        """Finish the current segment, saving its bloom filter."""
+        if self.segment is None:
+            return
+        segment, bloom = self.segment, self.bloom
+        self.segment = None
+        self.bloom = None
+        await FILE_IO.run(
+            segment, segment.with_suffix(".bloom").write_bytes, bytes(bloom)
+        )
+
+    async def prune(self) -> None:
+        """Delete segments older than `keep_days`."""
+        if not self.keep_days:
+            return
+        cutoff = time.time() - self.keep_days * 86400
+        segments = await self.segments()
+        # A segment ends when the next starts.
+        for segment, next_segment in zip(segments, segments[1:]):
+            if _segment_start(next_segment) >= cutoff:
+                break
+            for path in _segment_files(segment):
+                await FILE_IO.run(path, partial(path.unlink, missing_ok=True))
+
+    async def segments(self) -> list[Path]:
+        """Segments, oldest first."""
+        segments = await FILE_IO.run_unlocked(
+            self.archive_dir, _list_segments, self.archive_dir
+        )
+        return sorted(segments, key=_segment_start)
+
+    async def search(
+        self,
+        since: float | None = None,
+        pattern: re.Pattern | None = None,
+        literal: str | None = None,
+        limit: int = 1000,
+    ) -> tuple[list[tuple[float, bytes]], bool]:
+        """
+        Find the newest lines read since a time, matching a bytes regex if
+        given. `literal` is text every match contains, used to skip
+        segments that don't. Returns up to `limit` lines and their times,
+        oldest first, and whether there were more.
+        """
+        await self.flush()
+        trigrams = _trigrams(literal.lower().encode()) if literal else set()
+        segments = await self.segments()
+        found = []
+        next_start = None
+        for segment in reversed(segments):
+            if since is not None and next_start is not None:
+                # Ended before the time range started.
+                if next_start < since:
+                    break
+            next_start = _segment_start(segment)
+            # The current segment's bloom filter is still in memory.
+            bloom = self.bloom if segment == self.segment else None
+            lines = await FILE_IO.run(
+                segment,
+                search_segment,
+                segment,
+                since,
+                pattern,
+                trigrams,
+                bloom,
+                limit + 1 - len(found),
+            )
+            found.extend(lines)
+            if len(found) > limit:
+                break
+        more = len(found) > limit
+        found = found[:limit]
+        found.reverse()
+        return found, more
+
+    async def close(self) -> None:
+        await self.flush()
+        await self.end_segment()
+
+
+def append_block(
+    segment: Path,
+    block: bytes,
+    first_time: float,
+    bloom: bytearray,
+) -> int:
+    """Append a block of lines to a segment, returning the segment's size."""
+    compressed = gzip.compress(block, mtime=0)
+    with open(segment, "ab") as segment_file:
+        offset = segment_file.tell()
+        segment_file.write(compressed)
+    # Only index whole blocks, in case writing one is cut short.
+    with open(segment.with_suffix(".idx"), "ab") as index_file:
+        index_file.write(INDEX_RECORD.pack(first_time, offset, len(compressed)))
+    _bloom_add(bloom, _trigrams(block.lower()))
+    return offset + len(compressed)
+
+
+def search_segment(
+    segment: Path,
+    since: float | None,
+    pattern: re.Pattern | None,
+    trigrams: set[bytes],
+    bloom: bytearray | None,
+    limit: int,
+) -> list[tuple[float, bytes]]:
+    """
+    Search a segment, newest lines first. Only blocks from the one
+    containing `since` on are decompressed, and none at all if the
+    segment's bloom filter lacks any of the `trigrams`.
+    """
+    if trigrams:
+        if bloom is None:
+            try:
+                bloom = segment.with_suffix(".bloom").read_bytes()
+            except FileNotFoundError:
+                # Not finished cleanly, it may contain anything.
+                pass
+        if bloom is not None and not _bloom_contains(bloom, trigrams):
+            return []
+    found = []
+    since_ms = since * 1000 if since is not None else None
+    with open(segment.with_suffix(".idx"), "rb") as index_file, \
+            open(segment, "rb") as segment_file:
+        count = index_file.seek(0, 2) // INDEX_RECORD.size
+        if not count:
+            return []
+        with mmap.mmap(
+            index_file.fileno(), 0, access=mmap.ACCESS_READ
+        ) as index:
+            first = 0
+            if since is not None:
+                first = _find_block(index, count, since)
+            for i in range(count - 1, first - 1, -1):
+                _, offset, length = INDEX_RECORD.unpack_from(
+                    index, i * INDEX_RECORD.size
+                )
+                segment_file.seek(offset)
+                block = gzip.decompress(segment_file.read(length))
+                if pattern is not None and not pattern.search(block):
+                    continue
+                for line in reversed(block.splitlines()):
+                    stamp, _, text = line.partition(b"\t")
+                    if since_ms is not None and int(stamp) < since_ms:
+                        return found
+                    if pattern is None or pattern.search(text):
+                        found.append((int(stamp) / 1000, text))
+                        if len(found) >= limit:
+                            return found
+    return found
+
+
+def _find_block(index: mmap.mmap, count: int, since: float) -> int:
+    """Binary search for the last block starting at or before `since`."""
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        start, _, _ = INDEX_RECORD.unpack_from(
+            index, middle * INDEX_RECORD.size
+        )
+        if start <= since:
+            low = middle + 1
+        else:
+            high = middle
+    return max(low - 1, 0)
+
+
+def _trigrams(text: bytes) -> set[bytes]:
+    """Trigrams within each word of some text."""
+    return {
+        word[i:i + 3]
+        for word in set(text.split())
+        for i in range(len(word) - 2)
+    }
+
+
+def _bloom_positions(trigram: bytes):
+    value = int.from_bytes(trigram, "little")
+    for multiplier in BLOOM_MULTIPLIERS[:ARCHIVE_BLOOM_HASHES]:
+        yield (value * multiplier & 0xFFFFFFFF) % ARCHIVE_BLOOM_BITS
+
+
+def _bloom_add(bloom: bytearray, trigrams: set[bytes]) -> None:
+    for trigram in trigrams:
+        for position in _bloom_positions(trigram):
+            bloom[position >> 3] |= 1 << (position & 7)
+
+
+def _bloom_contains(bloom: bytes, trigrams: set[bytes]) -> bool:
+    return all(
+        bloom[position >> 3] & 1 << (position & 7)
+        for trigram in trigrams
+        for position in _bloom_positions(trigram)
+    )
+
+
+def _list_segments(archive_dir: Path) -> list[Path]:
+    return list(archive_dir.glob(SEGMENT_GLOB))
+
+
+def _segment_start(segment: Path) -> float:
+    return int(segment.name.split("-", 1)[1].split(".", 1)[0]) / 1000
+
+
+def _segment_files(segment: Path) -> list[Path]:
+    return [
+        segment,
+        segment.with_suffix(".idx"),
+        segment.with_suffix(".bloom"),
+    ]
+
+
+def parse_duration(text: str) -> float | None:
+    """Parse a duration like "10m" or "1h30m" to seconds."""
+    text = text.strip().lower()
+    if not text or DURATION_PATTERN.sub("", text):
+        return None
+    return sum(
+        int(amount) * DURATION_UNITS[unit]
+        for amount, unit in DURATION_PATTERN.findall(text)
+    )
@@ -0,0 +1,71 @@
+from __future__ import annotations
+import gzip
+import io
+import logging
+
+from craftlink.constants import ATTACHMENT_SIZE_LIMIT, COMPRESS_ATTACHMENTS_OVER
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Attachment():
+    """
+    A text file to be uploaded, kept as the pieces it was built from so it
+    can be encoded without first joining everything into one string.
+    """
+    def __init__(self, filename: str, pieces: list[str | bytes]) -> None:
+        self.filename = filename
+        self.pieces = pieces
+
+
+def encode_attachment(
+    filename: str,
+    pieces: list[str | bytes],
+) -> tuple[str, io.BytesIO]:
+    """
+    Stream text pieces into a bytes buffer, compressing large files with
+    zstd if `zstandard` is installed, otherwise gzip. Returns the filename,
+    with any compression suffix added, and the buffer ready to be read.
+    """
+    size_hint = sum(len(i) for i in pieces)
+    buffer = io.BytesIO()
+    if size_hint < COMPRESS_ATTACHMENTS_OVER:
+        writer = buffer
+    elif zstandard is not None:
+        filename = f"{filename}.zst"
+        compressor = zstandard.ZstdCompressor()
+        writer = compressor.stream_writer(buffer, closefd=False)
+    else:
+        filename = f"{filename}.gz"
+        writer = gzip.GzipFile(fileobj=buffer, mode="wb", mtime=0)
+    for piece in pieces:
+        if isinstance(piece, str):
+            piece = piece.encode("utf-8")
+        writer.write(piece)
+    if writer is not buffer:
+        writer.close()
+    buffer.seek(0)
+    return filename, buffer
+
+
+def fit_attachment(
+    filename: str,
+    pieces: list[str | bytes],
+) -> tuple[str, io.BytesIO] | None:
+    """
+    Encode an attachment within Discord's upload limit, dropping the oldest
+    pieces until it fits. Returns None if even the last piece is too large.
+    """
+    while pieces:
+        filename_out, buffer = encode_attachment(filename, pieces)
+        if buffer.getbuffer().nbytes <= ATTACHMENT_SIZE_LIMIT:
+            return filename_out, buffer
+        LOGGER.warning(f"Attachment {filename_out} too large, trimming it.")
+        pieces = pieces[len(pieces) // 2:] if len(pieces) > 1 else []
+    return None
@@ -0,0 +1,469 @@
+"""
+Incremental world backups into a content-addressed store.
+
+Files are split into chunks of `BACKUP_CHUNK_SIZE`, each stored once,
+gzipped, under the SHA-256 of its contents, and each backup is a manifest
+mapping the world's files to their chunks. Files with the same size and
+modification time as in the previous backup aren't read again, and of
+those that are only chunks not already stored are written, so a write to
+part of a large region file only stores the chunks it touched.
+"""
+from __future__ import annotations
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from craftlink.constants import (
+    BACKUP_CHUNK_SIZE,
+    BACKUP_SAVE_QUERY_INTERVAL,
+    BACKUP_SAVE_TIMEOUT,
+    BACKUP_WORKERS,
+)
+from craftlink.files import FILE_IO
+from craftlink.jobs import report_progress
+from craftlink.parser import ConsoleEvent
+from craftlink.rcon import RconError
+
+if TYPE_CHECKING:
+    from craftlink.command import CraftCommander
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Files listed by Bedrock's `save query`, as "path:length".
+SAVE_QUERY_FILE = re.compile(r"(.+?):(\d+)(?:, |$)")
+# Java holds this open while the server runs, it has nothing to restore.
+SKIPPED_FILES = ("session.lock",)
+
+
+class BackupError(Exception):
+    """Raised when the server can't be brought to a consistent state."""
+
+
+def store_file(
+    objects_dir: str,
+    file_path: str,
+    length: int | None,
+) -> tuple[list[str], int, int]:
+    """
+    Store a file's chunks, reading at most `length` bytes. Returns the
+    chunks' hashes, the bytes read and the bytes of chunks newly stored.
+    Runs in a worker process.
+    """
+    chunks = []
+    size = 0
+    stored = 0
+    with open(file_path, "rb") as source:
+        while length is None or size < length:
+            read_size = BACKUP_CHUNK_SIZE
+            if length is not None:
+                read_size = min(read_size, length - size)
+            chunk = source.read(read_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            digest = hashlib.sha256(chunk).hexdigest()
+            chunks.append(digest)
+            object_path = os.path.join(objects_dir, digest[:2], digest)
+            # Unchanged parts of the file are already stored.
+            if os.path.exists(object_path):
+                continue
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            file_descriptor, temp_name = tempfile.mkstemp(
+                dir=objects_dir, suffix=".tmp"
+            )
+            try:
+                with os.fdopen(file_descriptor, "wb") as target:
+                    target.write(gzip.compress(chunk, 6, mtime=0))
+                os.replace(temp_name, object_path)
+            finally:
+                if os.path.exists(temp_name):
+                    os.unlink(temp_name)
+            stored += len(chunk)
+    return chunks, size, stored
+
+
+def restore_file(
+    objects_dir: str,
+    chunks: list[str],
+    file_path: str,
+    mtime: int,
+) -> None:
+    """
+    Write a file back from its chunks, with its modification time as
+    backed up so the next backup knows it's unchanged. Runs in a worker
+    process.
+    """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "wb") as target:
+        for digest in chunks:
+            object_path = os.path.join(objects_dir, digest[:2], digest)
+            with gzip.open(object_path, "rb") as source:
+                shutil.copyfileobj(source, target, BACKUP_CHUNK_SIZE)
+    os.utime(file_path, ns=(mtime, mtime))
+
+
+def _scan_files(
+    server_path: Path,
+    world_dirs: list[str],
+) -> dict[str, tuple[int, int]]:
+    """Map files in the world directories to their size and mtime."""
+    files = {}
+    for world_dir in world_dirs:
+        for dir_path, _, file_names in os.walk(server_path / world_dir):
+            for file_name in file_names:
+                if file_name in SKIPPED_FILES:
+                    continue
+                file_path = Path(dir_path, file_name)
+                stat = file_path.stat()
+                relative_path = file_path.relative_to(server_path).as_posix()
+                files[relative_path] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def _existing_dirs(server_path: Path, names: tuple[str]) -> list[str]:
+    return [i for i in names if (server_path / i).is_dir()]
+
+
+def _list_snapshots(snapshots_dir: Path) -> list[str]:
+    if not snapshots_dir.is_dir():
+        return []
+    return sorted(i.stem for i in snapshots_dir.glob("*.json"))
+
+
+def _set_aside(world_path: Path) -> None:
+    """Rename a world to keep it, replacing any world kept before."""
+    if not world_path.exists():
+        return
+    kept_path = world_path.with_name(f"{world_path.name}.pre-restore")
+    if kept_path.exists():
+        shutil.rmtree(kept_path)
+    world_path.rename(kept_path)
+
+
+class BackupManager():
+    """
+    Takes, lists, prunes and restores backups of a server's world.
+    While a backup runs the server is asked to stop writing to the world,
+    via `save hold` on Bedrock or `save-off` on Java, and to resume after.
+    """
+    def __init__(
+        self,
+        commander: CraftCommander,
+        backup_dir: Path,
+        keep: int,
+    ) -> None:
+        self.commander = commander
+        self.backup_dir = backup_dir
+        self.objects_dir = backup_dir / "objects"
+        self.snapshots_dir = backup_dir / "snapshots"
+        self.keep = keep
+        self.lock = asyncio.Lock()
+        self.pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self.pool is None:
+            # Spawn rather than fork, forking the running event loop's
+            # process isn't safe.
+            self.pool = ProcessPoolExecutor(
+                max_workers=min(BACKUP_WORKERS, os.cpu_count() or 1),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self.pool
+
+    async def world_dirs(self) -> list[str]:
+        """World directories to back up, relative to the server directory."""
+        await self.commander.properties.refresh()
+        level_name = self.commander.properties.get("level-name")
+        if self.commander.server_type == "bedrock":
+            return [f"worlds/{level_name or 'Bedrock level'}"]
+        level_name = level_name or "world"
+        # Paper and Spigot keep the other dimensions in their own worlds.
+        server_path = self.commander.server_path
+        return await FILE_IO.run(server_path, _existing_dirs, server_path, (
+            level_name, f"{level_name}_nether", f"{level_name}_the_end"
+        ))
+
+    async def snapshots(self) -> list[str]:
+        """Backup IDs, oldest first."""
+        return await FILE_IO.run(
+            self.snapshots_dir, _list_snapshots, self.snapshots_dir
+        )
+
+    async def read_manifest(self, snapshot_id: str) -> dict:
+        manifest_file = self.snapshots_dir / f"{snapshot_id}.json"
+        return json.loads(await FILE_IO.read_text(manifest_file))
+
+    async def backup(self) -> str:
+        """Back up the world, holding saves if the server is running."""
+        if self.lock.locked():
+            return "A backup is already running."
+        async with self.lock:
+            start = time.monotonic()
+            try:
+                if not await self.commander.server_running:
+                    manifest = await self._snapshot(None)
+                    held_for = None
+                elif self.commander.server_type == "bedrock":
+                    manifest, held_for = await self._backup_bedrock()
+                else:
+                    manifest, held_for = await self._backup_java()
+            except (BackupError, RconError) as error:
+                LOGGER.warning(f"Backup failed: {error}")
+                return f"Backup failed: {error}"
+            report_progress("Pruning old backups.")
+            pruned = await self.prune()
+        stats = manifest["stats"]
+        message = (
+            f"Backed up {len(manifest['files'])} files"
+            f" ({stats['bytes'] / 1024 / 1024:.1f} MB) as"
+            f" `{manifest['id']}` in {time.monotonic() - start:.1f}s,"
+            f" {stats['changed']} changed"
+            f" ({stats['changed_bytes'] / 1024 / 1024:.1f} MB read,"
+            f" {stats['stored_bytes'] / 1024 / 1024:.1f} MB new)."
+        )
+        if held_for is not None:
+            message += f" Saves were held for {held_for:.1f}s."
+        if pruned:
+            message += f" Pruned {pruned} old backup(s)."
+        return message
+
+    async def _backup_bedrock(self) -> tuple[dict, float]:
+        """
+        Hold saves, wait for `save query` to list the files and the lengths
+        that are safe to copy, then copy them and resume saving.
+        """
+        report_progress("Waiting for the server to finish saving.")
+        await self.commander.query_server("save hold")
+        held = time.monotonic()
+        try:
+            deadline = held + BACKUP_SAVE_TIMEOUT
+            while True:
+                reply = await self.commander.query_server("save query")
+                if reply and "Data saved" in reply:
+                    break
+                if time.monotonic() > deadline:
+                    raise BackupError("The server didn't finish saving.")
+                await asyncio.sleep(BACKUP_SAVE_QUERY_INTERVAL)
+            file_list = reply.splitlines()[-1]
+            lengths = {
+                f"worlds/{path}": int(length)
+                for path, length in SAVE_QUERY_FILE.findall(file_list)
+            }
+            if not lengths:
+                raise BackupError("The server didn't list any files to copy.")
+            manifest = await self._snapshot(lengths)
+        finally:
+            await self.commander.query_server("save resume")
+        return manifest, time.monotonic() - held
+
+    async def _backup_java(self) -> tuple[dict, float]:
+        """Turn off autosave, flush the world to disk, copy, turn it on."""
+        saved = asyncio.get_running_loop().create_future()
+
+        def on_event(event: ConsoleEvent) -> None:
+            if "Saved the game" in event.message and not saved.done():
+                saved.set_result(None)
+
+        report_progress("Waiting for the server to finish saving.")
+        await self.commander.query_server("save-off")
+        held = time.monotonic()
+        self.commander.subscribe(on_event)
+        try:
+            reply = await self.commander.query_server("save-all flush")
+            # Over RCON the reply only comes once saving is done.
+            if not reply or "Saved the game" not in reply:
+                try:
+                    await asyncio.wait_for(saved, BACKUP_SAVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    raise BackupError("The server didn't finish saving.")
+            manifest = await self._snapshot(None)
+        finally:
+            self.commander.unsubscribe(on_event)
+            await self.commander.query_server("save-on")
+        return manifest, time.monotonic() - held
+
+    async def _snapshot(self, lengths: dict[str, int] | None) -> dict:
+        """
+        Store the world's files, given the lengths to copy of each or None
+        to copy every file in the world directories, and write a manifest.
+        """
+        loop = asyncio.get_running_loop()
+        server_path = self.commander.server_path
+        world_dirs = await self.world_dirs()
+        files = await FILE_IO.run(
+            server_path, _scan_files, server_path, world_dirs
+        )
+        if lengths is not None:
+            files = {
+                path: (length, files[path][1])
+                for path, length in lengths.items() if path in files
+            }
+        if not files:
+            raise BackupError("No world files found to back up.")
+        previous = {}
+        snapshot_ids = await self.snapshots()
+        if snapshot_ids:
+            previous = (await self.read_manifest(snapshot_ids[-1]))["files"]
+        await FILE_IO.run(self.objects_dir, partial(
+            self.objects_dir.mkdir, parents=True, exist_ok=True
+        ))
+        entries = {}
+        changed = {}
+        for path, (size, mtime) in files.items():
+            entry = previous.get(path)
+            if entry and entry["size"] == size and entry["mtime"] == mtime:
+                entries[path] = entry
+            else:
+                changed[path] = size if lengths is not None else None
+        pool = self._get_pool()
+        copies = [
+            loop.run_in_executor(
+                pool,
+                store_file,
+                str(self.objects_dir),
+                str(server_path / path),
+                length,
+            )
+            for path, length in changed.items()
+        ]
+        copied = 0
+
+        def count_copy(_) -> None:
+            nonlocal copied
+            copied += 1
+            report_progress(
+                f"Copied {copied} of {len(copies)} changed files."
+            )
+
+        for copy in copies:
+            copy.add_done_callback(count_copy)
+        results = await asyncio.gather(*copies)
+        for path, (chunks, size, _) in zip(changed, results):
+            entries[path] = {
+                "chunks": chunks, "size": size, "mtime": files[path][1]
+            }
+        snapshot_id = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+        if snapshot_ids and snapshot_id <= snapshot_ids[-1]:
+            snapshot_id = f"{snapshot_ids[-1]}-1"
+        manifest = {
+            "id": snapshot_id,
+            "created": time.time(),
+            "world_dirs": world_dirs,
+            "files": entries,
+            "stats": {
+                "bytes": sum(i["size"] for i in entries.values()),
+                "changed": len(changed),
+                "changed_bytes": sum(i[1] for i in results),
+                "stored_bytes": sum(i[2] for i in results),
+            },
+        }
+        await FILE_IO.run(self.snapshots_dir, partial(
+            self.snapshots_dir.mkdir, parents=True, exist_ok=True
+        ))
+        await FILE_IO.write_text(
+            self.snapshots_dir / f"{snapshot_id}.json", json.dumps(manifest)
+        )
+        LOGGER.info(
+            f"Backed up {self.commander.name} server as {snapshot_id},"
+            f" {len(changed)} of {len(entries)} files changed."
+        )
+        return manifest
+
+    async def prune(self) -> int:
+        """
+        Delete all but the newest `keep` backups and any stored chunks only
+        they used. Returns the number of backups deleted.
+        """
+        snapshot_ids = await self.snapshots()
+        expired = snapshot_ids[:-self.keep] if self.keep else []
+        if not expired:
+            return 0
+        for snapshot_id in expired:
+            manifest_file = self.snapshots_dir / f"{snapshot_id}.json"
+            await FILE_IO.run(manifest_file, manifest_file.unlink)
+        referenced = set()
+        for snapshot_id in snapshot_ids[len(expired):]:
+            manifest = await self.read_manifest(snapshot_id)
+            for entry in manifest["files"].values():
+                referenced.update(entry["chunks"])
+        removed = await FILE_IO.run(
+            self.objects_dir, self._remove_unreferenced, referenced
+        )
+        LOGGER.info(
+            f"Pruned {len(expired)} backups and {removed} unused chunks."
+        )
+        return len(expired)
+
+    def _remove_unreferenced(self, referenced: set[str]) -> int:
+        removed = 0
+        for object_path in self.objects_dir.glob("*/*"):
+            if object_path.name not in referenced:
+                object_path.unlink()
+                removed += 1
+        return removed
+
+    async def restore(self, snapshot_id: str) -> str:
+        """
+        Restore a backup over the world, which must not be running. The
+        current world is kept with a `.pre-restore` suffix until the next
+        restore.
+        """
+        if await self.commander.server_running:
+            return "Stop the server before restoring a backup."
+        if snapshot_id not in await self.snapshots():
+            return f"No backup *\"{snapshot_id}\"*, see `!backup list`."
+        async with self.lock:
+            manifest = await self.read_manifest(snapshot_id)
+            server_path = self.commander.server_path
+            for world_dir in manifest["world_dirs"]:
+                world_path = server_path / world_dir
+                await FILE_IO.run(world_path, _set_aside, world_path)
+            loop = asyncio.get_running_loop()
+            pool = self._get_pool()
+            report_progress(f"Restoring {len(manifest['files'])} files.")
+            await asyncio.gather(*(
+                loop.run_in_executor(
+                    pool,
+                    restore_file,
+                    str(self.objects_dir),
+                    entry["chunks"],
+                    str(server_path / path),
+                    entry["mtime"],
+                )
+                for path, entry in manifest["files"].items()
+            ))
+        return (
+            f"Restored backup `{snapshot_id}`, the previous world was kept"
+            " with a `.pre-restore` suffix."
+        )
+
+    async def list_backups(self) -> str:
+        snapshot_ids = await self.snapshots()
+        if not snapshot_ids:
+            return "No backups yet."
+        lines = [f"**{self.commander.name} Server Backups**"]
+        for snapshot_id in snapshot_ids:
+            stats = (await self.read_manifest(snapshot_id))["stats"]
+            lines.append(
+                f"- `{snapshot_id}`: {stats['bytes'] / 1024 / 1024:.1f} MB,"
+                f" {stats['changed']} files changed"
+            )
+        return "\n".join(lines)
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.pool = None
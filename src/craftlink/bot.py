@@ -1,54 +1,131 @@
 from __future__ import annotations
 import asyncio
-import io
 import logging
-from collections import deque
+from functools import partial
 from pathlib import Path
 
 import discord
 
+from craftlink.attachments import Attachment
 from craftlink.command import CraftCommander
-from craftlink.constants import CMD_PREFIX
+from craftlink.constants import (
+    CMD_PREFIX,
+    MESSAGE_QUEUE_SIZE,
+    PERMISSIONS_FILE,
+    RELAY_BATCH_SIZE,
+    RELAY_LINGER_SECONDS,
+)
+from craftlink.files import FILE_IO
+from craftlink.jobs import Job
+from craftlink.metrics import MetricsServer, render_prometheus
+from craftlink.permissions import PermissionIndex
+from craftlink.sender import MessageSender
+from craftlink.slash import build_command_tree, send_reply
 
 
 LOGGER = logging.getLogger(__name__)
 
 
 class CraftBot(discord.Client):
+    """
+    Discord client relaying one or more Minecraft servers, each bound to its
+    own channel. All servers share one gateway connection, one outbound
+    sender and one event loop.
+    """
     def __init__(
-        self, token: str,
-        server_dir: str,
-        channel_id: str,
-        server_type: str,
-        java_mem_range: tuple[int],
-        use_box64: bool,
+        self,
+        token: str,
+        servers: list[dict],
+        metrics_port: int = 0,
+        prefix_commands: bool = True,
+        permissions_file: str = PERMISSIONS_FILE,
     ) -> None:
         self.token = token
-        self.server_type = server_type
-        server_path = Path(server_dir)
-        self.server_message_queue = deque([])
-        self.commander = CraftCommander(
-            server_path,
-            self.server_message_queue,
-            server_type,
-            java_mem_range,
-            use_box64,
-        )
-        self.channel_id = int(channel_id)
+        # Command tiers of members, shared by all servers.
+        self.permissions = PermissionIndex(Path(permissions_file))
+        # Also accept commands as messages starting with `CMD_PREFIX`.
+        self.prefix_commands = prefix_commands
+        # Commanders and Discord channels, keyed by channel ID.
+        self.commanders = {}
+        self.channels = {}
+        for server in servers:
+            commander = CraftCommander(
+                Path(server["server_dir"]),
+                asyncio.Queue(MESSAGE_QUEUE_SIZE),
+                server["server_type"],
+                (server["java_memory_min"], server["java_memory_max"]),
+                server["is_arm64"],
+                filter_file=server["filter_file"],
+                name=server["name"],
+                response_timeout=server["response_timeout"],
+                transport=server["transport"],
+                rcon_address=(server["rcon_host"], server["rcon_port"]),
+                rcon_password=server["rcon_password"],
+                auto_restart=server["auto_restart"],
+                host_socket=server["host_socket"],
+                backup_dir=server["backup_dir"],
+                backup_keep=server["backup_keep"],
+                idle_timeout=server["idle_timeout"],
+                wake_on_connect=server["wake_on_connect"],
+                java_profile=server["java_profile"],
+                java_path=server["java_path"],
+                java_args=server["java_args"],
+                server_args=server["server_args"],
+                archive_dir=server["archive_dir"],
+                archive_days=server["archive_days"],
+                dedup_window=server["dedup_window"],
+                permissions=self.permissions,
+            )
+            commander.lifecycle_handlers.append(
+                partial(self.say, server["channel_id"])
+            )
+            commander.jobs.handlers.append(
+                partial(self.report_job, server["channel_id"])
+            )
+            self.commanders[server["channel_id"]] = commander
+        # Progress messages of running jobs, by channel and job ID.
+        self.job_messages = {}
+        self.sender = None
+        self.relay_tasks = []
+        self.metrics_server = None
+        if metrics_port:
+            self.metrics_server = MetricsServer(
+                self.render_metrics, metrics_port
+            )
         intents = discord.Intents.default()
-        intents.message_content = True
+        # Only needed to read prefixed commands, slash commands work without.
+        intents.message_content = prefix_commands
         intents.members = True
         intents.guilds = True
-        super().__init__(intents=intents)
+        # Don't ping anyone mentioned in relayed output or replies.
+        super().__init__(
+            intents=intents,
+            allowed_mentions=discord.AllowedMentions.none(),
+        )
+        self.tree = build_command_tree(self)
 
     async def __aenter__(self, *args, **kwargs) -> CraftBot:
-        """Spawn tasks to handle the message queue upon context entry."""
-        asyncio.create_task(self.commander.poll_server_messages())
-        asyncio.create_task(self.process_server_message_queue())
+        """Spawn tasks to handle the message queues upon context entry."""
+        self.sender = MessageSender(on_delivered=self.observe_relay_latency)
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+        await self.permissions.load()
+        for commander in self.commanders.values():
+            await commander.load_state()
+            try:
+                await commander.attach()
+            except OSError:
+                LOGGER.warning(
+                    f"Cannot reach server host for {commander.name} server."
+                )
+        self.relay_tasks = [
+            asyncio.create_task(self.process_server_message_queue(i))
+            for i in self.commanders
+        ]
         return self
 
     async def __aexit__(self, *args, **kwargs) -> None:
-        """Kill the server on context exit."""
+        """Kill the servers on context exit."""
         await self.stop()
 
     async def run(self) -> None:
@@ -60,55 +137,185 @@ class CraftBot(discord.Client):
         await self.start(self.token)
 
     async def stop(self) -> None:
-        """Stop the server, gracefully at first, then forcefully if needed."""
-        if await self.commander.server_running:
-            self.commander._cmd_stopserver(None)
-        LOGGER.info("Waiting a few seconds for server to stop gracefully...")
-        await asyncio.sleep(5)
+        """Stop all servers and the message relay."""
+        await asyncio.gather(
+            *(self.stop_server(i) for i in self.commanders.values())
+        )
+        for relay_task in self.relay_tasks:
+            relay_task.cancel()
+        await self.sender.close()
+        if self.metrics_server is not None:
+            await self.metrics_server.close()
+        FILE_IO.close()
+
+    def observe_relay_latency(self, channel_id: int, latency: float) -> None:
+        commander = self.commanders.get(channel_id)
+        if commander is not None:
+            commander.metrics.observe_relay_latency(latency)
+
+    def render_metrics(self) -> str:
+        """Metrics for all servers, in the Prometheus text format."""
+        return render_prometheus(
+            [(i.metrics, i.collect_gauges()) for i in self.commanders.values()]
+        )
+
+    async def stop_server(self, commander: CraftCommander) -> None:
+        """
+        Stop a server, waiting for it to exit, escalating if needed.
+        Servers run by a server host are left running.
+        """
+        # Jobs could start the server again.
+        await commander.jobs.close()
+        if commander.host is not None:
+            await commander.close()
+            return
         try:
-            if await self.commander.server_running:
-                LOGGER.warning("Server did not stop, killing it.")
-                self.commander._cmd_killserver(None)
+            await commander.supervisor.stop()
         except Exception:
-            pass
+            LOGGER.exception(f"Failed to stop {commander.name} server.")
+        await commander.close()
+
+    async def say(self, channel_id: int, message: str) -> None:
+        """
+        Send a message to a server's channel. Large messages are split or,
+        failing that, sent as (compressed) txt files.
+        """
+        channel = await self.get_server_channel(channel_id)
+        await self.sender.send(channel, message)
 
-    async def say(self, message: str) -> None:
-        """Send a message to the channel. Send large messages as txt files."""
-        if len(message) <= 2000:
-            await self.channel.send(message)
+    async def report_job(self, channel_id: int, job: Job) -> None:
+        """Post a job's progress to a server's channel, or edit it in."""
+        key = (channel_id, job.id)
+        done = job.done
+        if done:
+            message = self.job_messages.pop(key, None)
         else:
-            message_io = io.StringIO(message)
-            attachment = discord.File(message_io, filename="attachment.txt")
-            await self.channel.send(file=attachment)
+            message = self.job_messages.get(key)
+        # Through the sender, so it's sent after the command's reply and
+        # edits share the channel's rate limit with everything else.
+        channel = await self.get_server_channel(channel_id)
+        message = await self.sender.post(channel, job.render(), message)
+        if message is not None and not done:
+            self.job_messages[key] = message
+
+    async def get_server_channel(
+        self,
+        channel_id: int,
+    ) -> discord.abc.Messageable:
+        """Get a server's channel, fetching it the first time."""
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = await self.fetch_channel(channel_id)
+            self.channels[channel_id] = channel
+        return channel
+
+    async def next_server_message_batch(
+        self,
+        queue: asyncio.Queue,
+    ) -> list[tuple[float, bytes]]:
+        """
+        Wait for queued server messages and return them as a batch.
+        The batch is returned as soon as it reaches `RELAY_BATCH_SIZE` bytes
+        or `RELAY_LINGER_SECONDS` after its first message arrived.
+        """
+        loop = asyncio.get_running_loop()
+        batch = [await queue.get()]
+        batch_size = len(batch[0][1])
+        deadline = loop.time() + RELAY_LINGER_SECONDS
+        while batch_size < RELAY_BATCH_SIZE:
+            if queue.empty():
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = queue.get_nowait()
+            batch.append(item)
+            batch_size += len(item[1])
+        return batch
 
-    async def process_server_message_queue(self) -> None:
-        """Send queued server messages to the Discord channel."""
+    async def process_server_message_queue(self, channel_id: int) -> None:
+        """Send a server's queued messages to its Discord channel."""
+        commander = self.commanders[channel_id]
+        footer = f"Messages from {commander.name} server."
         while True:
-            message = ""
-            while self.server_message_queue:
-                message += self.server_message_queue.popleft().decode()
-            if message:
-                # Drop the last newline from the messages.
-                message = message[:-1]
-                # Send large messages as attachments,
-                footer = f"Messages from {self.server_type.title()} server."
-                if len(message) > 4000:
-                    message = f"{footer}\n{message}"
-                    await self.say(message)
-                else:
-                    # Send messages as embeds when possible for cleaner look.
-                    embed = discord.Embed(description=f"```{message}```")
-                    embed.set_footer(text=footer)
-                    await self.channel.send(embed=embed)
-            await asyncio.sleep(2)
+            batch = await self.next_server_message_batch(
+                commander.server_message_queue
+            )
+            # Drop the last newline from the messages.
+            message = b"".join(i[1] for i in batch).decode(errors="replace")
+            message = message.rstrip("\r\n")
+            commander.metrics.lines_relayed += len(batch)
+            if not message:
+                continue
+            await self.wait_until_ready()
+            # Sent as embeds for a cleaner look, or attachments when large.
+            channel = await self.get_server_channel(channel_id)
+            await self.sender.send(
+                channel, message, footer=footer, created_at=batch[0][0]
+            )
 
     async def on_ready(self) -> None:
-        self.channel = await self.fetch_channel(self.channel_id)
+        guilds = set()
+        for channel_id in self.commanders:
+            channel = await self.get_server_channel(channel_id)
+            if getattr(channel, "guild", None) is not None:
+                guilds.add(channel.guild)
+        # Index members' tiers up front, from the members sent on connecting.
+        for guild in guilds:
+            for member in guild.members:
+                self.permissions.refresh_member(member)
+        # Per guild, as global commands can take a while to show up.
+        for guild in guilds:
+            self.tree.copy_global_to(guild=guild)
+            try:
+                await self.tree.sync(guild=guild)
+            except discord.HTTPException:
+                LOGGER.warning(
+                    f"Failed to register slash commands in {guild.name}.",
+                    exc_info=True,
+                )
         LOGGER.info(f"{self.user.name} is now running.")
 
+    async def run_slash_command(
+        self,
+        interaction: discord.Interaction,
+        command: str,
+    ) -> None:
+        """Dispatch a slash command to the channel's server and reply."""
+        commander = self.commanders.get(interaction.channel_id)
+        if commander is None:
+            await interaction.response.send_message(
+                "This channel isn't bound to a Minecraft server.",
+                ephemeral=True,
+            )
+            return
+        command = command.strip()
+        LOGGER.info(
+            f"Processing slash command for {commander.name} server from user"
+            f" {interaction.user.name}, {command}"
+        )
+        # Commands can take longer than Discord waits for a reply.
+        await interaction.response.defer(thinking=True)
+        response = await commander.dispatch_command(
+            command,
+            interaction.user.name,
+            self.permissions.tier_of(interaction.user),
+        )
+        await send_reply(interaction, response)
+
     async def on_message(self, message: discord.Message) -> None:
-        """Messages starting with prefix are parsed and dispatched."""
-        if message.author == self.user or message.channel.id != self.channel_id:
+        """
+        Messages starting with prefix are parsed and dispatched to the
+        server bound to the channel they were sent in.
+        """
+        if not self.prefix_commands or message.author == self.user:
+            return
+        commander = self.commanders.get(message.channel.id)
+        if commander is None:
             return
         user_name = message.author.name
         text = message.content
@@ -116,7 +323,51 @@ class CraftBot(discord.Client):
             return
         else:
             command = text[1:]
-            LOGGER.info(f"Processing command from user {user_name}, {command}")
-            response = await self.commander.dispatch_command(command, user_name)
-            if response:
-                await self.say(response)
+            LOGGER.info(
+                f"Processing command for {commander.name} server from user"
+                f" {user_name}, {command}"
+            )
+            response = await commander.dispatch_command(
+                command, user_name, self.permissions.tier_of(message.author)
+            )
+            if isinstance(response, Attachment):
+                await self.sender.send_file(message.channel, response)
+            elif response:
+                await self.say(message.channel.id, response)
+
+    async def on_member_update(
+        self,
+        before: discord.Member,
+        after: discord.Member,
+    ) -> None:
+        if before.roles != after.roles:
+            self.permissions.refresh_member(after)
+
+    async def on_member_remove(self, member: discord.Member) -> None:
+        self.permissions.forget_member(member.guild.id, member.id)
+
+    async def on_guild_role_update(
+        self,
+        before: discord.Role,
+        after: discord.Role,
+    ) -> None:
+        # Only the Administrator permission affects tiers.
+        if before.permissions.administrator != after.permissions.administrator:
+            for member in after.members:
+                self.permissions.refresh_member(member)
+
+    async def on_guild_role_delete(self, role: discord.Role) -> None:
+        if role.id in self.permissions.roles:
+            # Also drops the cached tiers.
+            await self.permissions.set_role(role.id, None)
+        elif role.permissions.administrator:
+            self.permissions.forget_guild(role.guild.id)
+
+    async def on_guild_update(
+        self,
+        before: discord.Guild,
+        after: discord.Guild,
+    ) -> None:
+        if before.owner_id != after.owner_id:
+            for member_id in (before.owner_id, after.owner_id):
+                self.permissions.forget_member(after.id, member_id)
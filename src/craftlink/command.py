@@ -1,28 +1,70 @@
 from __future__ import annotations
 import asyncio
-import json
 import logging
 import os
 import re
-from collections import deque
+import time
 from pathlib import Path
+from typing import Callable
 
+from craftlink.allowlist import AllowlistStore
+from craftlink.archive import ConsoleArchive, parse_duration
+from craftlink.attachments import Attachment
+from craftlink.backup import BackupManager
 from craftlink.constants import (
     ADMIN_COMMANDS_MESSAGE,
     ADMIN_COMMAND_NAMES,
-    ALL_COMMAND_NAMES,
+    ALLOWLIST_WRITE_DELAY,
+    ARCHIVE_KEEP_DAYS,
+    ARCHIVE_SEARCH_LIMIT,
+    BACKUP_KEEP,
     BEDROCK_COMMANDS_MESSAGE,
-    BEDROCK_COMMAND_NAMES,
     CMD_PREFIX,
-    IGNORED_MESSAGE_PATTERNS,
+    COMMAND_RESPONSE_SETTLE_SECONDS,
+    COMMAND_RESPONSE_TIMEOUT,
+    DEDUP_WINDOW_SECONDS,
+    DISCORD_MESSAGE_LIMIT,
     JAVA_COMMANDS_MESSAGE,
-    JAVA_COMMAND_NAMES,
     OS,
+    PERMISSION_TIERS,
+    PRESENCE_WRITE_DELAY,
 )
+from craftlink.dedup import RepeatCollapser
+from craftlink.files import FILE_IO, FileTooLargeError
+from craftlink.filters import MessageFilter
+from craftlink.host import HostClient, HostedProcess
+from craftlink.idle import IdleManager
+from craftlink.jobs import (
+    COMMAND_TIER,
+    COMMAND_USER,
+    LIFECYCLE,
+    CronExpression,
+    JobManager,
+    Schedule,
+    report_progress,
+)
+from craftlink.jvm import JavaLauncher
+from craftlink.metrics import ServerMetrics
+from craftlink.parser import ConsoleEvent, ConsoleParser
+from craftlink.permissions import PermissionIndex, tier_allows
+from craftlink.presence import (
+    PresenceIndex,
+    format_duration,
+    parse_player_list,
+)
+from craftlink.properties import ServerProperties
+from craftlink.registry import COMMAND_REGISTRIES
+from craftlink.rcon import RconClient, RconError
+from craftlink.responses import ResponseCapture, compile_signatures
+from craftlink.supervisor import ServerSupervisor
 
 
 LOGGER = logging.getLogger(__name__)
 
+REGEX_SPECIAL_CHARACTERS = re.compile(r"[\\.^$*+?{}\[\]|()]")
+# A Discord role, as a mention or its ID.
+ROLE_PATTERN = re.compile(r"<@&(\d+)>|(\d+)")
+
 
 class CraftCommander():
     """
@@ -32,15 +74,56 @@ class CraftCommander():
     def __init__(
         self,
         server_path: Path,
-        server_message_queue: deque,
+        server_message_queue: asyncio.Queue,
         server_type: str,
-        java_mem_range: tuple[int],
+        java_mem_range: tuple[int | str, int | str],
         use_box64: bool,
+        *,
+        filter_file: str | None = None,
+        name: str | None = None,
+        response_timeout: float = COMMAND_RESPONSE_TIMEOUT,
+        transport: str = "stdin",
+        rcon_address: tuple[str, int | None] = ("127.0.0.1", None),
+        rcon_password: str | None = None,
+        auto_restart: bool = True,
+        host_socket: str | None = None,
+        backup_dir: str | None = None,
+        backup_keep: int = BACKUP_KEEP,
+        idle_timeout: float = 0.0,
+        wake_on_connect: bool = True,
+        java_profile: str = "default",
+        java_path: str = "java",
+        java_args: list[str] | tuple[str] = (),
+        server_args: list[str] | tuple[str] = (),
+        archive_dir: str | None = None,
+        archive_days: float = ARCHIVE_KEEP_DAYS,
+        dedup_window: float = DEDUP_WINDOW_SECONDS,
+        permissions: PermissionIndex | None = None,
     ) -> None:
         self.server_type = server_type
+        self.name = name or server_type.title()
         self.use_box64 = use_box64
         self.server_proc = None
+        self.reader_task = None
         self.server_message_queue = server_message_queue
+        self.repeats = RepeatCollapser(dedup_window) if dedup_window else None
+        self.repeats_task = None
+        self.console_parser = ConsoleParser(server_type)
+        self.event_handlers = []
+        self.metrics = ServerMetrics(self.name)
+        self.subscribe(self.metrics.handle_event)
+        self.response_signatures = compile_signatures(server_type)
+        self.response_timeout = response_timeout
+        # Only one command captures its reply at a time.
+        self.response_lock = asyncio.Lock()
+        self.response_capture = None
+        self.supervisor = ServerSupervisor(self, auto_restart)
+        # Coroutine functions to call with server lifecycle messages.
+        self.lifecycle_handlers = []
+        if filter_file:
+            self.message_filter = MessageFilter.from_file(filter_file)
+        else:
+            self.message_filter = MessageFilter()
         if not server_path.is_dir():
             raise ValueError("The given server directory is invalid.")
         self.server_path = server_path
@@ -50,20 +133,105 @@ class CraftCommander():
             self.eol = b"\r\n"
         else:
             self.eol = b"\n"
-        self._run_file_checks(java_mem_range)
+        self.java = None
+        if server_type == "java":
+            self.java = JavaLauncher(
+                server_path,
+                java_profile,
+                java_mem_range,
+                java_path,
+                java_args,
+                server_args,
+            )
+            self.subscribe(self.java.handle_event)
+        self._run_file_checks()
+        self.rcon = None
+        self.host = None
+        if transport == "rcon":
+            self.rcon = self._build_rcon_client(rcon_address, rcon_password)
+        elif transport == "host":
+            if not host_socket:
+                host_socket = str(self.server_path / "craftlink-host.sock")
+            self.host = HostClient(host_socket)
+            self.host_offset_file = self.server_path / ".craftlink-host-offset"
+        elif transport != "stdin":
+            raise ValueError(f"Invalid transport given, {transport}.")
+        self.presence = PresenceIndex(
+            self.server_path / ".craftlink-players.json",
+            PRESENCE_WRITE_DELAY,
+        )
+        self.subscribe(self.presence.handle_event)
+        # After presence, to see who's online once it has handled an event.
+        self.idle = IdleManager(self, idle_timeout, wake_on_connect)
+        self.subscribe(self.idle.handle_event)
+        self.backups = BackupManager(
+            self,
+            Path(backup_dir) if backup_dir else server_path / "backups",
+            backup_keep,
+        )
+        self.jobs = JobManager(
+            self.name,
+            self.server_path / ".craftlink-schedules.json",
+            self.run_scheduled,
+        )
+        self.archive = None
+        if archive_days:
+            self.archive = ConsoleArchive(
+                Path(archive_dir) if archive_dir
+                else server_path / "console-archive",
+                archive_days,
+            )
         # Verify no commands have been added for which we have no method.
         for command_name in ADMIN_COMMAND_NAMES:
             assert hasattr(self, f"_cmd_{command_name}")
-    
+        self.commands = COMMAND_REGISTRIES[server_type]
+        # Shared by all servers, as Discord roles aren't per channel.
+        self.permissions = permissions
+        self.command_methods = {
+            i: getattr(self, f"_cmd_{i}") for i in self.commands.admin_commands
+        }
+
     @property
     async def server_running(self) -> bool:
-        """Check if the server process is active or exists."""
-        if not self.server_proc:
-            return False
+        """
+        Check if the server process is active or exists. With RCON, also
+        counts servers not started by us if the RCON connection is up.
+        """
+        if self.server_proc and self.server_proc.returncode is None:
+            return True
+        elif self.rcon is not None:
+            try:
+                await self.rcon.connect()
+            except RconError:
+                return False
+            return True
         else:
-            return self.server_proc.returncode is None
+            return False
 
-    def _run_file_checks(self, java_mem_range: tuple[int]) -> None:
+    def _build_rcon_client(
+        self,
+        rcon_address: tuple[str, int | None],
+        rcon_password: str | None,
+    ) -> RconClient:
+        """
+        Build the RCON client, with the port and password defaulting to
+        those in server.properties.
+        """
+        if self.server_type != "java":
+            raise ValueError("RCON is only supported by Java servers.")
+        rcon_host, rcon_port = rcon_address
+        if rcon_port is None or rcon_password is None:
+            # Before the event loop runs, so read it directly.
+            self.properties.load()
+        if rcon_port is None:
+            rcon_port = int(self.properties.get("rcon.port") or 25575)
+        if rcon_password is None:
+            rcon_password = self.properties.get("rcon.password")
+        if not rcon_password:
+            raise ValueError("No RCON password given or in server.properties.")
+        return RconClient(rcon_host, rcon_port, rcon_password)
+
+    def _run_file_checks(self) -> None:
         """Ensure binaries exist and assign some attributes."""
         # Set the command based on os and server type.
         if self.server_type == "bedrock":
@@ -77,10 +245,6 @@ class CraftCommander():
                 self.env["LD_LIBRARY_PATH"] = str(self.server_path.absolute())
         elif self.server_type == "java":
             server_binary = self.server_path / "server.jar"
-            mem_min, mem_max = java_mem_range
-            self.server_cmd = (
-                f"java -Xmx{mem_min}M -Xms{mem_max}M -jar server.jar nogui"
-            )
         else:
             raise ValueError(f"Invalid server type given, {self.server_type}.")
         if not server_binary.is_file():
@@ -89,6 +253,15 @@ class CraftCommander():
         # Default to whitelist if no allowlist.
         if not self.allowlist_file.is_file():
             self.allowlist_file = self.server_path / "whitelist.json"
+        self.allowlist = AllowlistStore(
+            self.allowlist_file,
+            self.server_type,
+            ALLOWLIST_WRITE_DELAY,
+        )
+        self.properties = ServerProperties(
+            self.server_path / "server.properties",
+            self.server_type,
+        )
 
     async def _cmd_listcommands(self, category: str = None, *args) -> str:
         """
@@ -109,49 +282,407 @@ class CraftCommander():
             commands_message = JAVA_COMMANDS_MESSAGE
         return commands_message
 
-    async def _cmd_adduser(self, user_name: str, user_id: str, *args) -> str:
+    async def _cmd_adduser(self, *users) -> str:
         """
-        Add a user to the server's allowlist.json file.
-        Better to use `whitelist` command instead of this.
+        Add users to the server's allowlist.json file, given as pairs of
+        user name and (x/u)uid. Better to use `whitelist` command instead.
         """
-        if self.server_type == "bedrock":
-            id_name = "xuid"
-        elif self.server_type == "java":
-            id_name = "uuid"
-        allowlist = json.loads(self.allowlist_file.read_text())
-        if any(
-            (i["name"] == user_name or i.get(id_name) == user_id)
-            for i in allowlist
-        ):
-            return "New user appears to be a duplicate user."
-        new_entry = {
-            "ignoresPlayerLimit": False,
-            "name": user_name,
-            id_name: user_id,
-        }
-        if self.server_type == "java":
-            new_entry.pop("ignoresPlayerLimit")
-        allowlist.append(new_entry)
-        self.allowlist_file.write_text(json.dumps(allowlist))
-        return f"Added user {user_name} to allowlist."
-
-    async def _cmd_rmuser(self, user_name: str, *args) -> str:
-        """Remove a user from the server's allowlist.json file."""
-        allowlist = json.loads(self.allowlist_file.read_text())
-        if not any(i["name"] == user_name for i in allowlist):
-            return f"User *\"{user_name}\"* does not appear in allowlist."
-        good_entries = [i for i in allowlist if i["name"] != user_name]
-        self.allowlist_file.write_text(json.dumps(good_entries))
-        return f"Removed user {user_name} from allowlist."
-
-    async def _cmd_userrole(self, *args) -> str:
-        return "Not yet implemented."
+        if not users or len(users) % 2:
+            return "Give a user name and (x/u)uid for each user to add."
+        await self.allowlist.refresh()
+        added = []
+        duplicates = []
+        for user_name, user_id in zip(users[::2], users[1::2]):
+            if self.allowlist.add(user_name, user_id):
+                added.append(user_name)
+            else:
+                duplicates.append(user_name)
+        await self.allowlist.save()
+        return _summarise_users(
+            ("Added user(s) {} to allowlist.", added),
+            ("User(s) {} appear to be duplicates.", duplicates),
+        )
+
+    async def _cmd_rmuser(self, *user_names) -> str:
+        """Remove users from the server's allowlist.json file."""
+        if not user_names:
+            return "Give the name of at least one user to remove."
+        await self.allowlist.refresh()
+        removed = []
+        missing = []
+        for user_name in user_names:
+            if self.allowlist.remove(user_name):
+                removed.append(user_name)
+            else:
+                missing.append(user_name)
+        await self.allowlist.save()
+        return _summarise_users(
+            ("Removed user(s) {} from allowlist.", removed),
+            ("User(s) {} do not appear in allowlist.", missing),
+        )
+
+    async def _cmd_userrole(self, role: str = "", tier: str = "") -> str:
+        """List or change the command tiers of Discord roles."""
+        permissions = self.permissions
+        if permissions is None:
+            return "Permissions are not managed by this bot."
+        if not role:
+            lines = [
+                f"Members without a mapped role: {permissions.default_tier}"
+            ]
+            lines.extend(
+                f"- <@&{role_id}>: {role_tier}"
+                for role_id, role_tier in permissions.roles.items()
+            )
+            return "\n".join(lines)
+        if role == "default":
+            if tier not in PERMISSION_TIERS:
+                return f"Tier must be one of {', '.join(PERMISSION_TIERS)}."
+            await permissions.set_default(tier)
+            return f"Members without a mapped role now have the {tier} tier."
+        match = ROLE_PATTERN.fullmatch(role)
+        if match is None:
+            return "Give the role as a mention (e.g. @Moderators) or its ID."
+        role_id = int(match.group(1) or match.group(2))
+        if tier == "remove":
+            if role_id not in permissions.roles:
+                return f"<@&{role_id}> is not mapped to a tier."
+            await permissions.set_role(role_id, None)
+            return f"Removed the tier of <@&{role_id}>."
+        if tier not in PERMISSION_TIERS:
+            return (
+                f"Tier must be one of {', '.join(PERMISSION_TIERS)},"
+                " or remove."
+            )
+        await permissions.set_role(role_id, tier)
+        return f"<@&{role_id}> now has the {tier} tier."
+
+    async def _cmd_backup(self, action: str = "", *args) -> str:
+        """Back up the world, list backups or restore one."""
+        if not action:
+            return await self.jobs.run(
+                "backup", self.backups.backup, conflicts=LIFECYCLE
+            )
+        elif action == "list":
+            return await self.backups.list_backups()
+        elif action == "restore" and args:
+            return await self.jobs.run(
+                f"backup restore {args[0]}",
+                self.backups.restore,
+                args[0],
+                conflicts=LIFECYCLE,
+            )
+        return "Use `!backup`, `!backup list` or `!backup restore backup_id`."
+
+    async def _cmd_jobs(self, *args) -> str:
+        """List running and recently finished jobs."""
+        return self.jobs.report()
+
+    async def _cmd_cancel(self, job_id: str = "", *args) -> str:
+        """Cancel a queued or running job."""
+        if not job_id.lstrip("#").isdigit():
+            return f"Give the ID of a job to cancel, see `{CMD_PREFIX}jobs`."
+        job_id = int(job_id.lstrip("#"))
+        if not self.jobs.cancel(job_id):
+            return f"Job #{job_id} isn't queued or running."
+        return f"Cancelling job #{job_id}."
+
+    async def _cmd_cron(self, action: str = "list", *args) -> str:
+        """List, add or remove commands run on a schedule."""
+        if action == "list":
+            if not self.jobs.schedules:
+                return "No commands are scheduled."
+            return "\n".join(
+                f"- #{schedule_id} `{i.cron.expression}`: `{i.command}`"
+                f" by {i.user_name}"
+                for schedule_id, i in self.jobs.schedules.items()
+            )
+        elif action == "add" and args:
+            # Aliases are one field, expressions five.
+            field_count = 1 if args[0].startswith("@") else 5
+            expression = " ".join(args[:field_count])
+            command = " ".join(args[field_count:])
+            try:
+                cron = CronExpression(expression)
+            except ValueError as error:
+                return f"Invalid schedule `{expression}`: {error}"
+            base_command = command.split(" ")[0]
+            if base_command not in self.commands:
+                return f"Command `{command}` is not a valid command."
+            # Scheduled commands run with the tier of whoever scheduled them.
+            tier = COMMAND_TIER.get()
+            required_tier = self.commands.required_tier(base_command)
+            if not tier_allows(tier, required_tier):
+                return (
+                    f"Command `{base_command}` needs the {required_tier} tier,"
+                    f" you have the {tier} tier."
+                )
+            schedule_id = await self.jobs.add_schedule(
+                Schedule(cron, command, COMMAND_USER.get(), tier)
+            )
+            return f"Scheduled `{command}` at `{expression}` as #{schedule_id}."
+        elif action == "remove" and args and args[0].lstrip("#").isdigit():
+            schedule_id = int(args[0].lstrip("#"))
+            if not await self.jobs.remove_schedule(schedule_id):
+                return f"No scheduled command #{schedule_id}."
+            return f"Removed scheduled command #{schedule_id}."
+        return (
+            f"Use `{CMD_PREFIX}cron`, `{CMD_PREFIX}cron add"
+            f" cron_expression command` or `{CMD_PREFIX}cron remove id`."
+        )
+
+    async def run_scheduled(self, schedule: Schedule) -> None:
+        """Run a scheduled command, passing on its reply."""
+        command = schedule.command
+        response = await self.dispatch_command(
+            command, schedule.user_name, schedule.tier
+        )
+        if isinstance(response, Attachment):
+            response = "The reply was too long to show."
+        if response:
+            await self.notify(f"Scheduled `{command}`: {response}")
+
+    async def _cmd_logs(
+        self,
+        action: str = "",
+        *args,
+    ) -> str | Attachment:
+        """Search the console archive."""
+        if self.archive is None:
+            return "Server output isn't being archived."
+        query = " ".join(args)
+        since = pattern = literal = None
+        if action == "since" and query:
+            duration = parse_duration(query)
+            if duration is None:
+                return f"*\"{query}\"* isn't a duration, e.g. 10m or 1h30m."
+            since = time.time() - duration
+        elif action == "grep" and query:
+            try:
+                pattern = re.compile(query.encode(), re.IGNORECASE)
+            except re.error as error:
+                return f"Invalid pattern, {error}."
+            # Only plain text can be looked up in the segments' filters.
+            if not REGEX_SPECIAL_CHARACTERS.search(query):
+                literal = query
+        elif action == "player" and query:
+            pattern = re.compile(re.escape(query.encode()), re.IGNORECASE)
+            literal = query
+        else:
+            return (
+                "Use `!logs since duration`, `!logs grep pattern` or"
+                " `!logs player player_name`."
+            )
+        lines, more = await self.archive.search(
+            since, pattern, literal, ARCHIVE_SEARCH_LIMIT
+        )
+        if not lines:
+            return "No matching lines."
+        pieces = []
+        if more:
+            pieces.append(
+                f"Showing the last {len(lines)} matching lines.\n".encode()
+            )
+        for stamp, text in lines:
+            stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(stamp))
+            pieces.append(b"%s %s\n" % (stamp.encode(), text))
+        # Leave room for the code block fences.
+        if sum(len(i) for i in pieces) > DISCORD_MESSAGE_LIMIT - 10:
+            return Attachment("logs.txt", pieces)
+        text = b"".join(pieces).decode(errors="replace").rstrip("\n")
+        return f"```{text}```"
+
+    async def _cmd_online(self, *args) -> str:
+        """List online players, from the join and leave messages seen."""
+        online = self.presence.online
+        if not online:
+            return "No players online."
+        now = time.time()
+        lines = [f"**{len(online)} player(s) online**"]
+        for player, (_, joined) in sorted(online.items()):
+            lines.append(f"- {player}, for {format_duration(now - joined)}")
+        return "\n".join(lines)
+
+    async def _cmd_seen(self, player: str = "", *args) -> str:
+        """Show when a player was last online."""
+        if not player:
+            return "Give the name of a player."
+        name = self.presence.find(player)
+        if name is None:
+            return f"*\"{player}\"* hasn't been seen."
+        now = time.time()
+        playtime = format_duration(self.presence.playtime(name, now))
+        if name in self.presence.online:
+            joined = self.presence.online[name][1]
+            return (
+                f"{name} is online, for {format_duration(now - joined)}"
+                f" ({playtime} in total)."
+            )
+        last_seen = self.presence.players[name].last_seen
+        return (
+            f"{name} was last seen {format_duration(now - last_seen)} ago"
+            f" ({playtime} in total)."
+        )
+
+    async def _cmd_playtime(self, player: str = "", *args) -> str:
+        """Show a player's playtime, or the top players by playtime."""
+        now = time.time()
+        if player:
+            name = self.presence.find(player)
+            if name is None:
+                return f"*\"{player}\"* hasn't been seen."
+            record = self.presence.players.get(name)
+            sessions = record.sessions if record else 0
+            if name in self.presence.online:
+                sessions += 1
+            return (
+                f"{name} has played for"
+                f" {format_duration(self.presence.playtime(name, now))}"
+                f" over {sessions} session(s)."
+            )
+        players = {*self.presence.online, *self.presence.players}
+        if not players:
+            return "No players have been seen yet."
+        top = sorted(
+            players, key=lambda i: self.presence.playtime(i, now),
+            reverse=True,
+        )[:10]
+        lines = ["**Top players by playtime**"]
+        for index, name in enumerate(top, 1):
+            playtime = format_duration(self.presence.playtime(name, now))
+            lines.append(f"{index}. {name}, {playtime}")
+        return "\n".join(lines)
 
     async def _cmd_changeprop(self, *args) -> str:
-        return "Not yet implemented."
+        """
+        Change server properties, given as a name and value (which may
+        contain spaces) or as any number of name=value pairs.
+        """
+        if args and all("=" in i for i in args):
+            changes = dict(i.split("=", 1) for i in args)
+        elif len(args) >= 2:
+            changes = {args[0]: " ".join(args[1:])}
+        else:
+            return "Give a property name and value to change."
+        errors = await self.properties.set_many(changes)
+        if errors:
+            return "\n".join(errors)
+        changed = ", ".join(f"`{k}={v}`" for k, v in changes.items())
+        return f"Changed {changed}. Restart the server to apply."
+
+    def collect_gauges(self) -> dict:
+        """Point in time measurements of the server process and relay."""
+        gauges = {
+            "server_running": int(
+                self.server_proc is not None
+                and self.server_proc.returncode is None
+            ),
+            "queue_depth": self.server_message_queue.qsize(),
+        }
+        if gauges["server_running"]:
+            process_stats = self.metrics.process.sample(self.server_proc.pid)
+            if process_stats:
+                gauges.update(
+                    {f"process_{k}": v for k, v in process_stats.items()}
+                )
+        return gauges
+
+    async def _cmd_stats(self, *args) -> str:
+        """Show server process and relay statistics."""
+        gauges = self.collect_gauges()
+        metrics = self.metrics
+        lines = [f"**{self.name} Server Stats**"]
+        if gauges["server_running"]:
+            cpu_percent = gauges.get("process_cpu_percent")
+            if cpu_percent is not None:
+                lines.append(f"- CPU: {cpu_percent:.1f}%")
+            if "process_rss_bytes" in gauges:
+                rss_mb = gauges["process_rss_bytes"] / 1024 / 1024
+                lines.append(f"- Memory (RSS): {rss_mb:.0f} MB")
+                lines.append(f"- Threads: {gauges['process_threads']}")
+                lines.append(f"- Open files: {gauges['process_open_fds']}")
+        else:
+            lines.append("- Server not running.")
+        if metrics.tps is not None:
+            lines.append(f"- TPS: {metrics.tps}")
+        if metrics.startup_seconds is not None:
+            lines.append(f"- Last start up: {metrics.startup_seconds:.1f}s")
+        lines.append(
+            f"- Lag warnings: {metrics.lag_warnings}"
+            f" ({metrics.ticks_behind} ticks skipped)"
+        )
+        lines.append(
+            f"- Lines read/relayed: {metrics.lines_read}"
+            f"/{metrics.lines_relayed}"
+            f" ({metrics.lines_collapsed} repeats collapsed)"
+        )
+        lines.append(f"- Relay queue depth: {gauges['queue_depth']}")
+        percentiles = metrics.latency_percentiles()
+        if percentiles:
+            latencies = ", ".join(
+                f"p{float(k) * 100:g} {v * 1000:.0f}ms"
+                for k, v in percentiles.items()
+            )
+            lines.append(f"- Relay latency: {latencies}")
+        return "\n".join(lines)
+
+    async def _cmd_jvm(self, *args) -> str:
+        """Show the Java launch profile and recent runs' GC pauses."""
+        if self.java is None:
+            return "Launch profiles are only used by Java servers."
+        java = self.java
+        mem_min, mem_max = java.heap_sizes()
+        lines = [
+            f"**{self.name} Server Launch Profile:** {java.profile},"
+            f" heap {mem_min}-{mem_max} MB",
+            f"`{' '.join(java.argv())}`",
+        ]
+        runs = list(java.runs)
+        if java.current_run is not None:
+            await java.gc_log.update()
+            runs.append({**java.current_run, **java.gc_log.summary()})
+        if runs:
+            lines.append("**Recent Runs**")
+        for run in runs[-5:]:
+            started = time.strftime(
+                "%Y-%m-%d %H:%M", time.localtime(run["started"])
+            )
+            line = f"- {started}, {run['profile']}, {run['heap_mb']} MB"
+            if run["startup_seconds"] is not None:
+                line += f", started in {run['startup_seconds']:.1f}s"
+            line += (
+                f", {run['gc_pauses']} GC pauses"
+                f" totalling {run['gc_pause_total_ms']:.0f}ms,"
+                f" p99 {run['gc_pause_p99_ms']:.0f}ms,"
+                f" max {run['gc_pause_max_ms']:.0f}ms"
+            )
+            if "exit_code" not in run:
+                line += " (running)"
+            lines.append(line)
+        return "\n".join(lines)
 
-    async def _cmd_showsettings(self, target_file: str, *args) -> str:
+    async def _cmd_getprop(self, *keys) -> str:
+        """Show the values of server properties."""
+        if not keys:
+            return "Give the name of at least one property."
+        await self.properties.refresh()
+        lines = []
+        for key in keys:
+            value = self.properties.get(key)
+            if value is None:
+                lines.append(f"*\"{key}\"* is not set.")
+            else:
+                lines.append(f"`{key}={value}`")
+        return "\n".join(lines)
+
+    async def _cmd_showsettings(
+        self,
+        target_file: str,
+        *args,
+    ) -> str | Attachment:
+        """Show a settings file, uploaded as a file if too large to post."""
         if target_file == "allowlist" or target_file == "whitelist":
+            await self.allowlist.flush()
             file_path = self.allowlist_file
         elif target_file == "permissions":
             file_path = self.server_path / "permissions.json"
@@ -159,11 +690,31 @@ class CraftCommander():
             file_path = self.server_path / "server.properties"
         else:
             return f"Unrecognised file identifier, *\"{target_file}\"*."
-        file_contents = file_path.read_text()
+        try:
+            pieces = [i async for i in FILE_IO.read_chunks(file_path)]
+        except FileNotFoundError:
+            return f"*\"{file_path.name}\"* doesn't exist."
+        except FileTooLargeError as error:
+            return str(error)
+        # Leave room for the file name and code block fences.
+        if sum(len(i) for i in pieces) > DISCORD_MESSAGE_LIMIT - 100:
+            return Attachment(file_path.name, pieces)
+        file_contents = b"".join(pieces).decode(errors="replace")
         return f"**{file_path.name}**\n```{file_contents}```"
 
     async def _cmd_startserver(self, *args) -> str:
+        return await self.jobs.run(
+            "startserver", self.start_server, conflicts=LIFECYCLE
+        )
+
+    async def start_server(self) -> str:
         """Launch and assign the server process."""
+        if self.host is not None:
+            try:
+                await self.attach()
+            except OSError:
+                LOGGER.warning("Cannot reach server host.", exc_info=True)
+                return "Cannot reach the server host, is it running?"
         if await self.server_running:
             return "The server is already running."
         if self.server_type == "bedrock":
@@ -171,95 +722,344 @@ class CraftCommander():
             if self.use_box64:
                 server_cmd.insert(0, "box64")
         elif self.server_type == "java":
-            server_cmd = self.server_cmd.split(" ")
+            server_cmd = self.java.argv()
+            await self.java.start_run(server_cmd)
         LOGGER.info(f"Starting process: {' '.join(server_cmd)}")
-        self.server_proc = (
-            await asyncio.subprocess.create_subprocess_exec(
+        # Free the game port if waiting for players to join.
+        await self.idle.stop_listening()
+        self.idle.server_starting()
+        if self.host is not None:
+            # Only pass on what differs, the host has its own environment.
+            env = {k: v for k, v in self.env.items() if os.environ.get(k) != v}
+            server_proc = await self.host.start(
+                server_cmd, str(self.server_path.absolute()), env
+            )
+        else:
+            server_proc = await asyncio.subprocess.create_subprocess_exec(
                 *server_cmd,
                 stdin=asyncio.subprocess.PIPE,
                 stdout=asyncio.subprocess.PIPE,
                 cwd=self.server_path,
                 env=self.env,
             )
-        )
+        self._adopt_process(server_proc)
         return "Started Minecraft server."
 
+    def _adopt_process(
+        self,
+        server_proc: asyncio.subprocess.Process | HostedProcess,
+    ) -> None:
+        """Start reading and supervising a server process."""
+        self.server_proc = server_proc
+        self.reader_task = asyncio.create_task(
+            self.read_server_messages(self.server_proc)
+        )
+        self.supervisor.watch(self.server_proc)
+
+    async def load_state(self) -> None:
+        """Load state kept on disk between runs."""
+        await self.presence.load()
+        await self.jobs.load_schedules()
+        if self.java is not None:
+            await self.java.load()
+        if self.archive is not None:
+            await self.archive.prune()
+
+    async def attach(self) -> None:
+        """
+        Attach to the server host, if using one, picking up the server if
+        it's already running and resuming its output where we left off.
+        """
+        if self.host is None or self.host.connected:
+            return
+        if self.host.epoch is not None:
+            # Reconnecting, e.g. after the host dropped us for lagging.
+            epoch, last_offset = self.host.epoch, self.host.last_offset
+        else:
+            try:
+                text = await FILE_IO.read_text(self.host_offset_file)
+                epoch, last_offset = (int(i) for i in text.split())
+            except (OSError, ValueError):
+                epoch, last_offset = None, -1
+        await self.host.connect(epoch, last_offset)
+        if self.host.process is not None:
+            LOGGER.info(f"Attached to running {self.name} server.")
+            self._adopt_process(self.host.process)
+            # Joins from before the output that was kept weren't seen.
+            self.idle.online_unknown()
+            asyncio.create_task(self.sync_presence())
+
+    async def sync_presence(self) -> None:
+        """Ask the server who's online and update presence to match."""
+        try:
+            reply = await self.query_server("list")
+        except RconError:
+            reply = None
+        players = parse_player_list(reply) if reply else None
+        if players is None:
+            LOGGER.warning(
+                f"Cannot list players online on {self.name} server, it"
+                " won't be stopped when idle until it restarts."
+            )
+            return
+        self.presence.sync(players)
+        self.console_parser.online_players = set(players)
+        self.idle.players_listed()
+
     async def _cmd_stopserver(self, *args) -> str:
+        return await self.jobs.run(
+            "stopserver", self.stop_server, conflicts=LIFECYCLE
+        )
+
+    async def stop_server(self) -> str:
         """
-        Gracefully stop the server by sending the `/stop` command.
-        This command is mostly just for consistency since sending `/stop`
-        does the same thing.
+        Gracefully stop the server by sending the `/stop` command, waiting
+        for it to exit and escalating to terminating or killing it if not.
         """
         if not await self.server_running:
             return "The server is already shutdown."
-        await self.send_server_command("stop")
+        if await self.supervisor.stop():
+            return "Server did not stop gracefully, it was killed."
         return "Shutdown Minecraft server gracefully."
 
+    async def _cmd_restartserver(self, *args) -> str:
+        return await self.jobs.run(
+            "restartserver", self.restart_server, conflicts=LIFECYCLE
+        )
+
+    async def restart_server(self) -> str:
+        """Stop the server, waiting for it to exit, then start it again."""
+        if await self.server_running:
+            report_progress("Stopping the server.")
+            await self.supervisor.stop()
+        report_progress("Starting the server.")
+        return await self.start_server()
+
+    async def _cmd_filterstats(self, *args) -> str:
+        """Show how many lines each message filter rule has matched."""
+        return self.message_filter.report()
+
     async def _cmd_killserver(self, *args) -> str:
         """Force stop the server process."""
-        try:
-            self.server_proc.kill()
-        except Exception:
-            pass
+        await self.supervisor.kill()
         return "Shutdown Minecraft server forcefully."
 
     async def send_server_command(
         self,
         command: str,
         user_name: str = "unknown",
-    ) -> None:
+    ) -> str | None:
         """
-        Send a server command. This command does not return a message
-        as some commands sent to the server need no confirmation (e.g. `/say`),
-        however, if the server does give some reply, it'll be picked up and
-        enqueued in the `CraftCommander.poll_server_messages`.
+        Send a server command. Some commands sent to the server need no
+        confirmation (e.g. `/say`), so return nothing and any reply is just
+        relayed with the rest of the output. Commands with a signature in
+        `COMMAND_RESPONSE_SIGNATURES` wait for their reply and return it.
         """
         if not await self.server_running:
             return "The server isn't running."
         # Append the Discord username to the "say" command.
         if command.startswith("say"):
             command = f'say ({user_name}@Discord){command[3:]}'
+        elif command.split(" ")[0] == "stop":
+            self.supervisor.expect_exit()
+        try:
+            reply = await self.query_server(command)
+        except RconError as error:
+            return f"RCON command failed: {error}"
+        return f"```{reply}```" if reply else None
+
+    async def query_server(self, command: str) -> str | None:
+        """
+        Send a command to the running server and return its reply, or None
+        if it has no signature to recognise the reply by or didn't reply.
+        Raises `RconError` if sending it over RCON fails.
+        """
+        if self.rcon is not None:
+            # RCON ties each reply to its command, no capture needed.
+            return await self.rcon.command(command) or None
         encoded_command = bytes(command, encoding="utf-8") + b"\n"
-        self.server_proc.stdin.write(encoded_command)
+        signature = self.response_signatures.get(command.split(" ")[0])
+        if signature is None:
+            self.server_proc.stdin.write(encoded_command)
+            return None
+        async with self.response_lock:
+            self.response_capture = ResponseCapture(
+                *signature, self.console_parser.log_prefix
+            )
+            try:
+                self.server_proc.stdin.write(encoded_command)
+                lines = await self.response_capture.wait(
+                    self.response_timeout,
+                    COMMAND_RESPONSE_SETTLE_SECONDS,
+                )
+            finally:
+                self.response_capture = None
+        if not lines:
+            return None
+        return "\n".join(
+            self.console_parser.strip_prefix(i).decode(errors="replace")
+            for i in lines
+        )
 
-    async def poll_server_messages(self) -> None:
-        """Poll the server's output and enqueue any new messages."""
+    async def read_server_messages(
+        self,
+        server_proc: asyncio.subprocess.Process,
+    ) -> None:
+        """
+        Read the server's output as it arrives and enqueue each line.
+        Runs until the process closes its stdout, i.e. when it exits.
+        """
+        stdout = server_proc.stdout
         while True:
-            LOGGER.debug("Polling for server messages...")
-            await asyncio.sleep(1)
-            if not await self.server_running:
-                continue
-            # All stdout.<read> methods will hang waiting for an EOF so
-            # using a loop to grab everythign available and then letting
-            # it hang while nothing is being sent.
-            while True:
-                try:
-                    buffer = await self.server_proc.stdout.readuntil(self.eol)
-                except asyncio.exceptions.IncompleteReadError:
-                    break
-                # Skip spammy messages.
-                if not any(
-                    re.search(pattern, str(buffer))
-                    for pattern in IGNORED_MESSAGE_PATTERNS
-                ):
-                    self.server_message_queue.append(buffer)
+            try:
+                buffer = await stdout.readuntil(self.eol)
+            except asyncio.IncompleteReadError as error:
+                # EOF, keep whatever partial line was left over.
+                buffer = error.partial
+                if buffer:
+                    await self._enqueue_server_message(buffer + self.eol)
+                break
+            except asyncio.LimitOverrunError as error:
+                # Very long line, take what's buffered and carry on.
+                buffer = await stdout.read(error.consumed)
+            await self._enqueue_server_message(buffer)
+        returncode = await server_proc.wait()
+        LOGGER.info(f"Server process exited with code {returncode}.")
+        self.presence.end_sessions()
+        if self.repeats is not None:
+            for line in self.repeats.flush():
+                await self.server_message_queue.put((time.monotonic(), line))
+        if self.java is not None:
+            await self.java.finish_run(returncode)
+        if self.host is not None and not self.host.connected:
+            # Lost the host rather than the server, e.g. dropped for
+            # lagging behind, so pick the server up again.
+            try:
+                await self.attach()
+            except OSError:
+                LOGGER.warning("Cannot reach server host.", exc_info=True)
+
+    async def notify(self, message: str) -> None:
+        """Pass a server lifecycle message to the lifecycle handlers."""
+        for handler in self.lifecycle_handlers:
+            try:
+                await handler(message)
+            except Exception:
+                LOGGER.exception(f"Lifecycle handler {handler} failed.")
+
+    def subscribe(self, handler: Callable[[ConsoleEvent], None]) -> None:
+        """Call a handler with each event parsed from the server's output."""
+        self.event_handlers.append(handler)
+
+    def unsubscribe(self, handler: Callable[[ConsoleEvent], None]) -> None:
+        """Stop calling a handler added with `subscribe`."""
+        if handler in self.event_handlers:
+            self.event_handlers.remove(handler)
+
+    async def _enqueue_server_message(self, buffer: bytes) -> None:
+        """
+        Enqueue a line of server output, skipping spammy messages.
+        Waits for room if the queue is full so a slow relay applies
+        backpressure instead of growing memory. Lines are queued along with
+        the time they were read, to measure relay latency.
+        """
+        self.metrics.lines_read += 1
+        if self.archive is not None:
+            self.archive.append(buffer)
+        # Lines are only parsed if something wants the events.
+        if self.event_handlers:
+            event = self.console_parser.parse(buffer)
+            if event is not None:
+                for handler in self.event_handlers:
+                    try:
+                        handler(event)
+                    except Exception:
+                        LOGGER.exception(f"Event handler {handler} failed.")
+        # Replies to commands go back to whoever sent the command.
+        capture = self.response_capture
+        if capture is not None and capture.offer(buffer):
+            return
+        if not self.message_filter.allow(buffer):
+            return
+        if self.repeats is None:
+            await self.server_message_queue.put((time.monotonic(), buffer))
+            return
+        now = time.monotonic()
+        lines = self.repeats.offer(buffer, now)
+        if not lines:
+            self.metrics.lines_collapsed += 1
+            if self.repeats_task is None:
+                self.repeats_task = asyncio.create_task(
+                    self._relay_repeats()
+                )
+        for line in lines:
+            await self.server_message_queue.put((now, line))
+
+    async def _relay_repeats(self) -> None:
+        """Relay counts of repeated lines as their runs end."""
+        try:
+            while self.repeats.held:
+                await asyncio.sleep(self.repeats.window / 2)
+                now = time.monotonic()
+                for line in self.repeats.expired(now):
+                    await self.server_message_queue.put((now, line))
+        finally:
+            self.repeats_task = None
+
+    async def close(self) -> None:
+        """Tear down the output reader task and save pending changes."""
+        await self.jobs.close()
+        await self.supervisor.close()
+        await self.idle.close()
+        if self.reader_task and not self.reader_task.done():
+            self.reader_task.cancel()
+            try:
+                await self.reader_task
+            except asyncio.CancelledError:
+                pass
+        self.reader_task = None
+        if self.repeats_task is not None:
+            self.repeats_task.cancel()
+        if self.archive is not None:
+            await self.archive.close()
+        await self.allowlist.flush()
+        await self.presence.flush()
+        self.backups.close()
+        if self.rcon is not None:
+            await self.rcon.close()
+        if self.host is not None and self.host.connected:
+            # Remember where the output got to, to resume from there.
+            await FILE_IO.write_text(
+                self.host_offset_file,
+                f"{self.host.epoch} {self.host.last_offset}",
+            )
+            await self.host.close()
 
     async def dispatch_command(
         self,
         command: str,
-        user_name: str
-    ) -> str | None:
-        """Parse command and dispatch to target method."""
+        user_name: str,
+        tier: str,
+    ) -> str | Attachment | None:
+        """
+        Parse command and dispatch to target method, if the user's tier
+        allows it.
+        """
         message = ""
         command_and_args = command.split(" ")
         base_command = command_and_args[0]
         command_args = command_and_args[1:]
-        if base_command not in ALL_COMMAND_NAMES:
+        command_method = self.command_methods.get(base_command)
+        required_tier = self.commands.required_tier(base_command)
+        if not tier_allows(tier, required_tier):
+            LOGGER.info(
+                f"Refused {base_command} for {user_name}, who is {tier} tier."
+            )
             message = (
-                f"Command `{base_command}` is not a valid command."
-                f" Run `{CMD_PREFIX}listcommands` to list commands."
+                f"Command `{base_command}` needs the {required_tier} tier,"
+                f" you have the {tier} tier."
             )
-        elif base_command in BEDROCK_COMMAND_NAMES + JAVA_COMMAND_NAMES:
+        elif base_command in self.commands.server_commands:
             if not await self.server_running:
                 message = (
                     f"Server not running... start it with the"
@@ -267,8 +1067,15 @@ class CraftCommander():
                 )
             else:
                 message = await self.send_server_command(command, user_name)
+        elif command_method is None:
+            message = (
+                f"Command `{base_command}` is not a valid command."
+                f" Run `{CMD_PREFIX}listcommands` to list commands."
+            )
         else:
-            command_method = getattr(self, f"_cmd_{base_command}")
+            # Jobs started by the command are named as the user's.
+            user_token = COMMAND_USER.set(user_name)
+            tier_token = COMMAND_TIER.set(tier)
             try:
                 message = await command_method(*command_args)
             except Exception:
@@ -280,4 +1087,17 @@ class CraftCommander():
                     "Something went wrong... verify the command's syntax and"
                     " try again. The error has been logged."
                 )
+            finally:
+                COMMAND_USER.reset(user_token)
+                COMMAND_TIER.reset(tier_token)
         return message
+
+
+def _summarise_users(*outcomes: tuple[str, list[str]]) -> str:
+    """Join messages for each non-empty group of user names."""
+    messages = []
+    for message, user_names in outcomes:
+        if user_names:
+            names = ", ".join(f"*\"{i}\"*" for i in user_names)
+            messages.append(message.format(names))
+    return " ".join(messages)
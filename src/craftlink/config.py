@@ -0,0 +1,94 @@
+from __future__ import annotations
+import json
+import logging
+from pathlib import Path
+
+from craftlink.constants import (
+    ARCHIVE_KEEP_DAYS,
+    BACKUP_KEEP,
+    COMMAND_RESPONSE_TIMEOUT,
+    DEDUP_WINDOW_SECONDS,
+)
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Settings for each server, with defaults for the optional ones.
+SERVER_CONFIG_DEFAULTS = {
+    "name": None,
+    "server_type": "bedrock",
+    # Heap sizes in MiB, or "auto" to size from the host's memory.
+    "java_memory_min": 1024,
+    "java_memory_max": 1024,
+    # JVM flags to launch Java servers with, see `JVM_PROFILES`.
+    "java_profile": "default",
+    "java_path": "java",
+    # Extra arguments for the JVM, and for the server after "nogui".
+    "java_args": [],
+    "server_args": [],
+    "is_arm64": False,
+    "filter_file": None,
+    "response_timeout": COMMAND_RESPONSE_TIMEOUT,
+    # How to run and talk to the server: "stdin" of a server we started,
+    # "rcon", or "host" for a server run by `craftlink-host`.
+    "transport": "stdin",
+    "rcon_host": "127.0.0.1",
+    # Default to the port and password in server.properties.
+    "rcon_port": None,
+    "rcon_password": None,
+    # Restart the server if it crashes.
+    "auto_restart": True,
+    # Defaults to craftlink-host.sock in the server directory.
+    "host_socket": None,
+    # Defaults to backups in the server directory.
+    "backup_dir": None,
+    "backup_keep": BACKUP_KEEP,
+    # Stop the server after this many seconds with nobody online, 0 to never.
+    "idle_timeout": 0,
+    # Once stopped for being idle, start it when a player tries to join.
+    "wake_on_connect": True,
+    # Defaults to console-archive in the server directory.
+    "archive_dir": None,
+    # Days of server output to keep, 0 to not keep any.
+    "archive_days": ARCHIVE_KEEP_DAYS,
+    # Collapse repeated messages within this many seconds, 0 to relay all.
+    "dedup_window": DEDUP_WINDOW_SECONDS,
+}
+REQUIRED_SERVER_CONFIG = ("server_dir", "channel_id")
+
+
+def build_server_config(**settings) -> dict:
+    """Fill in defaults for a server's settings and check them."""
+    missing = [i for i in REQUIRED_SERVER_CONFIG if not settings.get(i)]
+    if missing:
+        raise ValueError(f"Server config missing {', '.join(missing)}.")
+    unknown = set(settings) - set(SERVER_CONFIG_DEFAULTS)
+    unknown -= set(REQUIRED_SERVER_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown server config {', '.join(unknown)}.")
+    server_config = {**SERVER_CONFIG_DEFAULTS, **settings}
+    server_config["channel_id"] = int(server_config["channel_id"])
+    if not server_config["name"]:
+        server_config["name"] = server_config["server_type"].title()
+    return server_config
+
+
+def load_server_configs(config_file: str | Path) -> list[dict]:
+    """
+    Load the servers to manage from a JSON file, shaped like:
+    `{"servers": [{"name": ..., "server_dir": ..., "channel_id": ...}]}`
+    Each server needs its own channel, other keys are optional, see
+    `SERVER_CONFIG_DEFAULTS`.
+    """
+    config = json.loads(Path(config_file).read_text())
+    server_configs = [build_server_config(**i) for i in config["servers"]]
+    if not server_configs:
+        raise ValueError(f"No servers defined in {config_file}.")
+    channel_ids = [i["channel_id"] for i in server_configs]
+    if len(set(channel_ids)) != len(channel_ids):
+        raise ValueError("Each server must have its own channel.")
+    names = [i["name"] for i in server_configs]
+    if len(set(names)) != len(names):
+        raise ValueError("Each server must have a unique name.")
+    LOGGER.info(f"Loaded config for servers: {', '.join(names)}.")
+    return server_configs
@@ -1,3 +1,4 @@
+from __future__ import annotations
 import asyncio
 import json
 import logging
@@ -7,6 +8,8 @@ from argparse import ArgumentParser
 from dotenv import load_dotenv
 
 from craftlink.bot import CraftBot
+from craftlink.config import build_server_config, load_server_configs
+from craftlink.constants import JVM_PROFILES, PERMISSIONS_FILE
 
 
 load_dotenv()
@@ -15,14 +18,33 @@ logging.basicConfig(level=logging.INFO)
 LOGGER = logging.getLogger(__name__)
 
 
+def memory_size(value: str) -> int | str:
+    """A memory size in MiB, or "auto"."""
+    return value if value == "auto" else int(value)
+
+
 async def amain(options):
+    if options.config_file:
+        servers = load_server_configs(options.config_file)
+    else:
+        servers = [
+            build_server_config(
+                server_dir=options.server_dir,
+                channel_id=options.channel_id,
+                server_type=options.server_type,
+                java_memory_min=options.java_memory_min,
+                java_memory_max=options.java_memory_max,
+                java_profile=options.java_profile,
+                is_arm64=options.is_arm64,
+                filter_file=options.filter_file,
+            )
+        ]
     async with CraftBot(
         token=options.token,
-        server_dir=options.server_dir,
-        channel_id=options.channel_id,
-        server_type=options.server_type,
-        java_mem_range=(options.java_memory_min, options.java_memory_max),
-        use_box64=options.is_arm64,
+        servers=servers,
+        metrics_port=options.metrics_port,
+        prefix_commands=not options.slash_only,
+        permissions_file=options.permissions_file,
     ) as bot:
         await bot.run()
 
@@ -36,6 +58,15 @@ def main():
         dest="token",
         help="Token to use to authenticate the Discord bot.",
     )
+    parser.add_argument(
+        "--config",
+        default=os.environ.get("CRAFTLINK_CONFIG", ""),
+        dest="config_file",
+        help=(
+            "JSON file defining several servers to manage, each with its own"
+            " channel. Replaces the per-server arguments below."
+        ),
+    )
     parser.add_argument(
         "-c",
         "--discord-channel-id",
@@ -62,17 +93,62 @@ def main():
         "-m",
         "--java-memory-min",
         default=os.environ.get("JAVA_MEMORY_MIN", "1024"),
-        type=int,
+        type=memory_size,
         required=False,
-        help="(Java only) minimum server memory to allocate, defaults to 1024.",
+        help=(
+            "(Java only) minimum server memory to allocate in MiB, or auto,"
+            " defaults to 1024."
+        ),
     )
     parser.add_argument(
         "-x",
         "--java-memory-max",
         default=os.environ.get("JAVA_MEMORY_MAX", "1024"),
+        type=memory_size,
+        required=False,
+        help=(
+            "(Java only) maximum server memory to allocate in MiB, or auto,"
+            " defaults to 1024."
+        ),
+    )
+    parser.add_argument(
+        "--java-profile",
+        default=os.environ.get("JAVA_PROFILE", "default"),
+        choices=list(JVM_PROFILES),
+        required=False,
+        help="(Java only) JVM flags to launch the server with.",
+    )
+    parser.add_argument(
+        "-f",
+        "--filter-file",
+        default=os.environ.get("FILTER_FILE", ""),
+        required=False,
+        help="File of extra include/exclude rules for relayed messages.",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        default=os.environ.get("METRICS_PORT", "0"),
         type=int,
         required=False,
-        help="(Java only) maximum server memory to allocate, defaults to 1024.",
+        help="Serve Prometheus metrics on this localhost port, 0 to disable.",
+    )
+    parser.add_argument(
+        "--permissions-file",
+        default=os.environ.get("PERMISSIONS_FILE", PERMISSIONS_FILE),
+        required=False,
+        help=(
+            "JSON file mapping Discord roles to command tiers, defaults to"
+            f" {PERMISSIONS_FILE}."
+        ),
+    )
+    parser.add_argument(
+        "--slash-only",
+        action="store_true",
+        required=False,
+        help=(
+            "Only accept slash commands, not prefixed messages, so the bot"
+            " doesn't need the message content intent."
+        ),
     )
     parser.add_argument(
         "--is-arm64",
@@ -86,6 +162,11 @@ def main():
             options.is_arm64 = True
     except json.JSONDecodeError:
         LOGGER.warning("Invalid value given for IS_ARM64.")
+    try:
+        if json.loads(os.environ.get("SLASH_ONLY", "false")):
+            options.slash_only = True
+    except json.JSONDecodeError:
+        LOGGER.warning("Invalid value given for SLASH_ONLY.")
     try:
         asyncio.run(amain(options))
     except KeyboardInterrupt:
@@ -26,6 +26,308 @@ IGNORED_MESSAGE_PATTERNS = (
 
 CMD_PREFIX = "!"
 
+# Known server.properties keys and the values they accept, either "bool",
+# "int", "str" or a tuple of choices. Keys not listed are not validated.
+_COMMON_PROPERTY_TYPES = {
+    "difficulty": ("peaceful", "easy", "normal", "hard"),
+    "level-name": "str",
+    "level-seed": "str",
+    "max-players": "int",
+    "online-mode": "bool",
+    "player-idle-timeout": "int",
+    "server-port": "int",
+    "view-distance": "int",
+}
+SERVER_PROPERTY_TYPES = {
+    "bedrock": {
+        **_COMMON_PROPERTY_TYPES,
+        "allow-cheats": "bool",
+        "allow-list": "bool",
+        "compression-threshold": "int",
+        "content-log-file-enabled": "bool",
+        "default-player-permission-level": ("visitor", "member", "operator"),
+        "force-gamemode": "bool",
+        "gamemode": ("survival", "creative", "adventure"),
+        "max-threads": "int",
+        "server-authoritative-movement": (
+            "client-auth", "server-auth", "server-auth-with-rewind",
+        ),
+        "server-name": "str",
+        "server-portv6": "int",
+        "texturepack-required": "bool",
+        "tick-distance": "int",
+    },
+    "java": {
+        **_COMMON_PROPERTY_TYPES,
+        "allow-flight": "bool",
+        "allow-nether": "bool",
+        "enable-command-block": "bool",
+        "enable-rcon": "bool",
+        "enforce-whitelist": "bool",
+        "force-gamemode": "bool",
+        "gamemode": ("survival", "creative", "adventure", "spectator"),
+        "generate-structures": "bool",
+        "hardcore": "bool",
+        "level-type": "str",
+        "max-world-size": "int",
+        "motd": "str",
+        "pvp": "bool",
+        "rcon.password": "str",
+        "rcon.port": "int",
+        "simulation-distance": "int",
+        "spawn-animals": "bool",
+        "spawn-monsters": "bool",
+        "spawn-protection": "int",
+        "white-list": "bool",
+    },
+}
+
+# Bytes of recent output the server host keeps to replay to the bot.
+HOST_REPLAY_BUFFER_BYTES = 4 * 1024 * 1024
+# Bytes of output the server host queues for a client before dropping it
+# as stalled. It can reattach and resume from the last offset it saw.
+HOST_CLIENT_BUFFER_BYTES = 4 * 1024 * 1024
+
+# Seconds to wait for the server to exit after `stop`, then after SIGTERM,
+# then after SIGKILL.
+STOP_TIMEOUT_SECONDS = 120
+TERMINATE_TIMEOUT_SECONDS = 15
+KILL_TIMEOUT_SECONDS = 5
+# Seconds to wait before restarting a crashed server, doubling each crash.
+RESTART_BACKOFF_MIN_SECONDS = 5
+RESTART_BACKOFF_MAX_SECONDS = 300
+# Stop restarting after this many crashes within this many seconds.
+CRASH_LOOP_LIMIT = 5
+CRASH_LOOP_WINDOW_SECONDS = 900
+
+# Seconds to wait for a server command's reply to start...
+COMMAND_RESPONSE_TIMEOUT = 2.0
+# ...and for the rest of a multi-line reply once it has started.
+COMMAND_RESPONSE_SETTLE_SECONDS = 0.05
+
+# Patterns recognising the replies to server commands, with the most lines
+# each reply spans. "_error" matches errors any command may reply with.
+# Commands not listed here don't wait for a reply, it's just relayed.
+COMMAND_RESPONSE_SIGNATURES = {
+    "bedrock": {
+        "_error": (
+            r"Unknown command|Syntax error|No targets matched|"
+            r"You do not have permission",
+            1,
+        ),
+        "allowlist": (r"allowlist|\{\"command\":", 1),
+        "whitelist": (r"allowlist|whitelist|\{\"command\":", 1),
+        "list": (r"There are \d+/\d+ players online", 2),
+        "difficulty": (r"[Dd]ifficulty", 1),
+        "gamerule": (r"[Gg]amerule|is currently set to", 1),
+        "kick": (r"Kicked ", 1),
+        "op": (r"Opped|operator", 1),
+        "deop": (r"De-opped|operator", 1),
+        # `save query` replies with the files to copy on a second line.
+        "save": (
+            r"Saving\.\.\.|Data saved|previous save has not|"
+            r"Changes to the level are resumed|already running",
+            2,
+        ),
+        "help": (r"Showing help page|^/", 30),
+        "time": (r"Set the time to|Day is|Time is|The time is", 1),
+        "tp": (r"Teleported ", 1),
+        "teleport": (r"Teleported ", 1),
+        "weather": (r"[Ww]eather|Changing to", 1),
+    },
+    "java": {
+        "_error": (
+            r"Unknown or incomplete command|Incorrect argument|"
+            r"Unknown command|<--\[HERE\]|No (?:entity|player) was found",
+            2,
+        ),
+        "ban": (r"Banned |Nothing changed", 1),
+        "banlist": (
+            r"There (?:are|is) \d+ ban|There are no bans|was banned",
+            50,
+        ),
+        "difficulty": (r"[Dd]ifficulty", 1),
+        "gamerule": (r"Gamerule |is currently set to", 1),
+        "kick": (r"Kicked ", 1),
+        "list": (r"There are \d+ of a max of \d+ players online", 1),
+        "op": (r"a server operator|Nothing changed", 1),
+        "deop": (r"a server operator|Nothing changed", 1),
+        "pardon": (r"Unbanned |Nothing changed", 1),
+        "save-all": (r"Saving the game|Saved the game", 2),
+        "save-off": (
+            r"[Ss]aving is (?:now|already) (?:turned off|disabled)",
+            1,
+        ),
+        "save-on": (
+            r"[Ss]aving is (?:now|already) (?:turned on|enabled)",
+            1,
+        ),
+        "seed": (r"Seed: \[", 1),
+        "time": (r"Set the time to|The time is", 1),
+        "tp": (r"Teleported ", 1),
+        "teleport": (r"Teleported ", 1),
+        "weather": (r"[Ww]eather", 1),
+        "whitelist": (
+            r"whitelist|[Ww]hitelisted|Player is already|Player is not",
+            1,
+        ),
+    },
+}
+
+# Threads for reading and writing files in the server directory, and
+# seconds to wait for each read or write before giving up on it.
+FILE_IO_WORKERS = 4
+FILE_IO_TIMEOUT = 30.0
+# Largest file read from the server directory, and bytes per read when
+# streaming one.
+FILE_READ_LIMIT = 64 * 1024 * 1024
+FILE_READ_CHUNK_SIZE = 256 * 1024
+
+# Seconds to wait before saving player session history, batching writes.
+PRESENCE_WRITE_DELAY = 5.0
+
+# Number of world backups to keep.
+BACKUP_KEEP = 24
+# Bytes of each chunk backed up files are split into and stored as. A write
+# to part of a file only stores the chunks it changed.
+BACKUP_CHUNK_SIZE = 1024 * 1024
+# Processes hashing and compressing backup files.
+BACKUP_WORKERS = 4
+# Seconds to wait for the server to flush its world to disk...
+BACKUP_SAVE_TIMEOUT = 120
+# ...polling this often on Bedrock.
+BACKUP_SAVE_QUERY_INTERVAL = 0.5
+
+# JVM flags for each Java launch profile, the heap size is set separately.
+_G1_FLAGS = (
+    # Aikar's flags, G1 tuned for how Minecraft allocates.
+    "-XX:+UseG1GC",
+    "-XX:+ParallelRefProcEnabled",
+    "-XX:MaxGCPauseMillis=200",
+    "-XX:+UnlockExperimentalVMOptions",
+    "-XX:+DisableExplicitGC",
+    "-XX:+AlwaysPreTouch",
+    "-XX:G1NewSizePercent=30",
+    "-XX:G1MaxNewSizePercent=40",
+    "-XX:G1HeapRegionSize=8M",
+    "-XX:G1ReservePercent=20",
+    "-XX:G1HeapWastePercent=5",
+    "-XX:G1MixedGCCountTarget=4",
+    "-XX:InitiatingHeapOccupancyPercent=15",
+    "-XX:G1MixedGCLiveThresholdPercent=90",
+    "-XX:G1RSetUpdatingPauseTimePercent=5",
+    "-XX:SurvivorRatio=32",
+    "-XX:+PerfDisableSharedMem",
+    "-XX:MaxTenuringThreshold=1",
+)
+JVM_PROFILES = {
+    # The JVM's own defaults.
+    "default": (),
+    "g1": _G1_FLAGS,
+    # Pauses of a millisecond or so however large the heap, for 12GB+.
+    "zgc": (
+        "-XX:+UseZGC",
+        "-XX:+DisableExplicitGC",
+        "-XX:+AlwaysPreTouch",
+        "-XX:+PerfDisableSharedMem",
+    ),
+    # G1 backed by large pages, which must be set up on the host first.
+    "g1-large-pages": (*_G1_FLAGS, "-XX:+UseLargePages"),
+}
+# Share of the host's (or container's) memory given to the heap when its
+# size is "auto", and the smallest heap to give, in MiB.
+JVM_AUTO_HEAP_FRACTION = 0.75
+JVM_MIN_HEAP_MB = 512
+# Recent GC pauses kept for percentiles, and Java runs kept in the history.
+GC_PAUSE_SAMPLES = 4096
+JVM_RUN_HISTORY = 20
+
+# Days of console output kept in the archive.
+ARCHIVE_KEEP_DAYS = 30
+# Write archived output in blocks of about this many bytes, or after this
+# many seconds, compressing each block separately.
+ARCHIVE_BLOCK_SIZE = 256 * 1024
+ARCHIVE_FLUSH_SECONDS = 5.0
+# Start a new archive segment once the current one reaches this many bytes.
+ARCHIVE_SEGMENT_SIZE = 64 * 1024 * 1024
+# Size in bits, and number of hashes, of each segment's bloom filter.
+ARCHIVE_BLOOM_BITS = 1 << 20
+ARCHIVE_BLOOM_HASHES = 3
+# Most lines shown from a search of the archive.
+ARCHIVE_SEARCH_LIMIT = 1000
+
+# Seconds to wait before writing allowlist changes, so bursts are batched.
+ALLOWLIST_WRITE_DELAY = 0.5
+
+# Collapse repeats of a line of server output coming within this many
+# seconds of each other, relaying a count of them at least this often, and
+# keep track of this many distinct lines.
+DEDUP_WINDOW_SECONDS = 5.0
+DEDUP_MAX_HOLD_SECONDS = 60.0
+DEDUP_MAX_FINGERPRINTS = 1024
+
+# Seconds a command waits for its job to finish and reply with the result,
+# before leaving it running in the background with a progress message.
+JOB_REPLY_SECONDS = 3.0
+# Minimum seconds between edits of a job's progress message.
+JOB_UPDATE_SECONDS = 2.0
+# Number of finished jobs listed by `jobs`.
+JOB_HISTORY = 10
+# Shorthands for common schedules.
+CRON_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+}
+
+# Command tiers, least to most privileged. Members are given the highest tier
+# mapped to any of their Discord roles, see `PermissionIndex`.
+PERMISSION_TIERS = ("none", "user", "mod", "admin")
+# File mapping Discord roles to tiers, relative to the working directory.
+PERMISSIONS_FILE = "craftlink-permissions.json"
+# Tier of members without a mapped role.
+DEFAULT_PERMISSION_TIER = "user"
+# Tier needed to send commands to the server, unless given below.
+SERVER_COMMAND_TIER = "mod"
+# Server commands needing another tier.
+SERVER_COMMAND_TIERS = {
+    "?": "user",
+    "help": "user",
+    "list": "user",
+    "me": "user",
+    "msg": "user",
+    "say": "user",
+    "seed": "user",
+    "tell": "user",
+    "w": "user",
+}
+
+# Maximum number of server output lines waiting to be relayed.
+MESSAGE_QUEUE_SIZE = 10000
+# Relay a batch once it holds this many bytes...
+RELAY_BATCH_SIZE = 4000
+# ...or once this many seconds have passed since its first line.
+RELAY_LINGER_SECONDS = 0.25
+# Recent relay latencies kept for percentiles.
+LATENCY_SAMPLES = 1024
+
+# Discord's size limits for message content and embed descriptions.
+DISCORD_MESSAGE_LIMIT = 2000
+DISCORD_EMBED_LIMIT = 4096
+# Send as an attachment rather than split into more messages than this.
+MAX_SPLIT_MESSAGES = 3
+# Messages allowed per channel, per this many seconds.
+CHANNEL_RATE_LIMIT = (5, 5.0)
+# Discord's upload limit for servers without boosts.
+ATTACHMENT_SIZE_LIMIT = 10 * 1024 * 1024
+# Compress attachments with more characters than this.
+COMPRESS_ATTACHMENTS_OVER = 256 * 1024
+# Characters of overflowing console output per session log segment.
+SESSION_LOG_SEGMENT_CHARS = 1024 * 1024
+# Characters waiting to be sent to a channel before senders must wait.
+MAX_PENDING_CHARS = 100000
+
 
 def commands_message(command_names: tuple[str], server_type: str) -> str:
     server_commands = "\n- ".join(
@@ -38,43 +340,150 @@ def commands_message(command_names: tuple[str], server_type: str) -> str:
 ADMIN_COMMANDS = {
     "adduser": {
         "help": (
-            "Add a user to the server's allowlist."
+            "Add users to the server's allowlist."
             " It's recommended to instead use the server-level"
             " command for allowlist control, it does not require a (x/u)uid."
         ),
-        "args": "user_name user_xuid_or_uuid",
+        "args": "user_name user_xuid_or_uuid [user_name user_xuid_or_uuid...]",
+        # Lowest tier allowed to use it, see `PERMISSION_TIERS`.
+        "tier": "mod",
+    },
+    "backup": {
+        "help": (
+            "Back up the world, copying only files changed since the last"
+            " backup. Also lists backups, or restores one while the server"
+            " is stopped."
+        ),
+        "args": "[list | restore backup_id]",
+        "tier": "admin",
+    },
+    "cancel": {
+        "help": "Cancel a queued or running job, see jobs.",
+        "args": "job_id",
+        "tier": "mod",
     },
     "changeprop": {
-        "help": "Change a server property (server.properties).",
-        "args": "property_name property_value",
+        "help": (
+            "Change server properties (server.properties), either one"
+            " as name and value or several as name=value pairs."
+            " Restart the server to apply."
+        ),
+        "args": "property_name property_value | name=value [name=value...]",
+        "tier": "admin",
+    },
+    "cron": {
+        "help": (
+            "List, add or remove commands run on a schedule, given as a cron"
+            " expression (minute hour day month weekday, in local time) or"
+            " @hourly, @daily, @weekly or @monthly,"
+            " e.g. \"cron add 0 4 * * * restartserver\"."
+        ),
+        "args": "[list | add cron_expression command | remove schedule_id]",
+        "tier": "admin",
+    },
+    "filterstats": {
+        "help": "Show how many server messages each filter rule has matched.",
+        "args": "",
+        "tier": "user",
+    },
+    "getprop": {
+        "help": "Show the value of server properties (server.properties).",
+        "args": "property_name [property_name...]",
+        "tier": "mod",
+    },
+    "jobs": {
+        "help": (
+            "List running and recently finished jobs, such as backups and"
+            " restarts."
+        ),
+        "args": "",
+        "tier": "user",
+    },
+    "jvm": {
+        "help": (
+            "Show the Java launch profile, and start up times and GC pauses"
+            " of recent runs."
+        ),
+        "args": "",
+        # Only accepted by these types of server, if given.
+        "server_types": ("java",),
+        "tier": "user",
     },
     "killserver": {
         "help": "Force shutdown the Minecraft server.",
         "args": "",
+        "tier": "admin",
     },
     "listcommands": {
         "help": "Lists commands accepted by this bot.",
         "args": "[type (\"admin\", \"bedrock\", \"java\")]",
+        "tier": "user",
+    },
+    "logs": {
+        "help": (
+            "Search all server output kept on disk, including messages"
+            " not relayed: lines from the last so long (e.g. 10m, 2h, 1d),"
+            " lines matching a pattern, or lines mentioning a player."
+        ),
+        "args": "since duration | grep pattern | player player_name",
+        "tier": "mod",
+    },
+    "online": {
+        "help": "List the players online and how long they've been on.",
+        "args": "",
+        "tier": "user",
+    },
+    "playtime": {
+        "help": (
+            "Show a player's total playtime, or the players who have"
+            " played the most."
+        ),
+        "args": "[player_name]",
+        "tier": "user",
     },
     "rmuser": {
-        "help": "Remove a user from the server's allowlist.",
-        "args": "user_name",
+        "help": "Remove users from the server's allowlist.",
+        "args": "user_name [user_name...]",
+        "tier": "mod",
+    },
+    "restartserver": {
+        "help": "Gracefully stop, then start the Minecraft server.",
+        "args": "",
+        "tier": "mod",
+    },
+    "seen": {
+        "help": "Show whether a player is online or when they last were.",
+        "args": "player_name",
+        "tier": "user",
     },
     "showsettings": {
         "help": "View a server settings file.",
         "args": "[file (\"allowlist\", \"permissions\", \"properties\")]",
+        "tier": "mod",
+    },
+    "stats": {
+        "help": "Show server resource usage, lag and relay statistics.",
+        "args": "",
+        "tier": "user",
     },
     "startserver": {
         "help": "Start the Minecraft server.",
         "args": "",
+        "tier": "mod",
     },
     "stopserver": {
         "help": "Gracefully shutdown the Minecraft server.",
         "args": "",
+        "tier": "mod",
     },
     "userrole": {
-        "help": "Change user permissions (permissions.json).",
-        "args": "user_xuid permission_name",
+        "help": (
+            "List which Discord roles may use which commands, or map a role"
+            " to a tier (\"admin\", \"mod\", \"user\" or \"none\"),"
+            " \"remove\" a role's mapping or set the \"default\" tier."
+        ),
+        "args": "[@role tier | @role remove | default tier]",
+        "tier": "admin",
     },
 }
 
@@ -167,7 +576,9 @@ BEDROCK_COMMAND_NAMES = (
 JAVA_COMMAND_NAMES = (
     "advancement",
     "attribute",
-    "execute",
+    "ban",
+    "ban-ip",
+    "banlist",
     "bossbar",
     "clear",
     "clone",
@@ -176,12 +587,12 @@ JAVA_COMMAND_NAMES = (
     "datapack",
     "debug",
     "defaultgamemode",
+    "deop",
     "difficulty",
     "effect",
-    "me",
     "enchant",
+    "execute",
     "experience",
-    "xp",
     "fill",
     "fillbiome",
     "forceload",
@@ -191,61 +602,68 @@ JAVA_COMMAND_NAMES = (
     "give",
     "help",
     "item",
+    "jfr",
     "kick",
     "kill",
     "list",
     "locate",
     "loot",
+    "me",
     "msg",
-    "tell",
-    "w",
+    "op",
+    "pardon",
+    "pardon-ip",
     "particle",
+    "perf",
     "place",
     "playsound",
-    "reload",
+    "random",
     "recipe",
+    "reload",
     "return",
     "ride",
+    "save-all",
+    "save-off",
+    "save-on",
     "say",
     "schedule",
     "scoreboard",
     "seed",
     "setblock",
-    "spawnpoint",
+    "setidletimeout",
     "setworldspawn",
+    "spawnpoint",
     "spectate",
     "spreadplayers",
+    "stop",
     "stopsound",
     "summon",
     "tag",
     "team",
     "teammsg",
-    "tm",
     "teleport",
-    "tp",
+    "tell",
     "tellraw",
+    "tick",
     "time",
     "title",
+    "tm",
+    "tp",
+    "transfer",
     "trigger",
+    "w",
     "weather",
-    "worldborder",
-    "jfr",
-    "ban-ip",
-    "banlist",
-    "ban",
-    "deop",
-    "op",
-    "pardon",
-    "pardon-ip",
-    "perf",
-    "save-all",
-    "save-off",
-    "save-on",
-    "setidletimeout",
-    "stop",
     "whitelist",
+    "worldborder",
+    "xp",
 )
 
+# Commands passed on to each type of server.
+SERVER_COMMAND_NAMES = {
+    "bedrock": BEDROCK_COMMAND_NAMES,
+    "java": JAVA_COMMAND_NAMES,
+}
+
 ALL_COMMAND_NAMES = [
     *ADMIN_COMMAND_NAMES,
     *BEDROCK_COMMAND_NAMES,
@@ -0,0 +1,127 @@
+from __future__ import annotations
+import logging
+import re
+from collections import OrderedDict
+
+from craftlink.constants import DEDUP_MAX_FINGERPRINTS, DEDUP_MAX_HOLD_SECONDS
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Fields that differ between otherwise identical lines: UUIDs, hex IDs and
+# numbers, which covers times, coordinates and entity IDs.
+VOLATILE_FIELDS = re.compile(
+    rb"[0-9a-fA-F]{8}(?:-[0-9a-fA-F]{4}){3}-[0-9a-fA-F]{12}"
+    rb"|0x[0-9a-fA-F]+"
+    rb"|-?\d+(?:\.\d+)?"
+)
+# Chat, joins and leaves, which are compared as is, as lines differing only
+# in numbers are still different things said or different players.
+PLAYER_LINES = re.compile(
+    rb"<[^>]+> "
+    rb"|Player (?:dis)?connected: "
+    rb"| (?:joined|left) the game"
+)
+
+
+class _Run():
+    """A line seen recently, and any repeats of it being held back."""
+    __slots__ = ("last_seen", "held_since", "count", "line")
+
+    def __init__(self, last_seen: float) -> None:
+        self.last_seen = last_seen
+        self.held_since = None
+        self.count = 0
+        self.line = None
+
+
+class RepeatCollapser():
+    """
+    Collapses runs of repeated lines of server output into one line.
+    Lines are compared by a fingerprint with their volatile fields
+    normalised away, except player lines, which must match exactly. The
+    first line of a run is relayed as is, repeats within `window` seconds
+    of the previous one are held back and counted, and once the run ends,
+    or has been held back for `max_hold` seconds, the last repeat is
+    relayed with a "(×N)" count of the repeats. Only the `max_runs` most
+    recently seen fingerprints are kept.
+    """
+    def __init__(
+        self,
+        window: float,
+        max_hold: float = DEDUP_MAX_HOLD_SECONDS,
+        max_runs: int = DEDUP_MAX_FINGERPRINTS,
+    ) -> None:
+        self.window = window
+        self.max_hold = max_hold
+        self.max_runs = max_runs
+        # Runs by fingerprint, least recently seen first.
+        self.runs = OrderedDict()
+        # Number of runs with repeats held back.
+        self.held = 0
+
+    def offer(self, line: bytes, now: float) -> list[bytes]:
+        """Take a line, returning the lines to relay now."""
+        if PLAYER_LINES.search(line):
+            fingerprint = hash(line)
+        else:
+            fingerprint = hash(VOLATILE_FIELDS.sub(b"#", line))
+        run = self.runs.get(fingerprint)
+        if run is not None and now - run.last_seen <= self.window:
+            run.last_seen = now
+            run.line = line
+            run.count += 1
+            if run.count == 1:
+                run.held_since = now
+                self.held += 1
+            self.runs.move_to_end(fingerprint)
+            return []
+        relay = []
+        if run is not None:
+            # The run ended but hasn't been swept up yet.
+            relay.extend(self._end(run))
+        self.runs[fingerprint] = _Run(now)
+        self.runs.move_to_end(fingerprint)
+        if len(self.runs) > self.max_runs:
+            _, evicted = self.runs.popitem(last=False)
+            relay.extend(self._end(evicted))
+        relay.append(line)
+        return relay
+
+    def expired(self, now: float) -> list[bytes]:
+        """
+        Summaries of runs that have ended, or have been held back for too
+        long, forgetting lines not seen within the window.
+        """
+        relay = []
+        for fingerprint, run in list(self.runs.items()):
+            if now - run.last_seen > self.window:
+                relay.extend(self._end(run))
+                del self.runs[fingerprint]
+            elif run.count and now - run.held_since >= self.max_hold:
+                relay.extend(self._end(run))
+        return relay
+
+    def flush(self) -> list[bytes]:
+        """Summaries of all runs, e.g. as the server exits."""
+        relay = []
+        for run in self.runs.values():
+            relay.extend(self._end(run))
+        self.runs.clear()
+        return relay
+
+    def _end(self, run: _Run) -> list[bytes]:
+        if not run.count:
+            return []
+        line = run.line
+        if run.count == 1:
+            summary = line
+        else:
+            body = line.rstrip(b"\r\n")
+            eol = line[len(body):]
+            summary = b"%s (\xc3\x97%d)%s" % (body, run.count, eol)
+        run.count = 0
+        run.held_since = None
+        run.line = None
+        self.held -= 1
+        return [summary]
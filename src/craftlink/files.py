@@ -0,0 +1,179 @@
+from __future__ import annotations
+import asyncio
+import errno
+import logging
+import os
+import shutil
+import tempfile
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Callable
+
+from craftlink.constants import (
+    FILE_IO_TIMEOUT,
+    FILE_IO_WORKERS,
+    FILE_READ_CHUNK_SIZE,
+    FILE_READ_LIMIT,
+)
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def atomic_write_text(path: Path, text: str) -> None:
+    """
+    Write a file via a temporary file that is renamed over it, so the server
+    never reads a half written file. Newlines are written as given.
+    """
+    file_descriptor, temp_name = tempfile.mkstemp(
+        dir=path.parent,
+        prefix=f".{path.name}.",
+        suffix=".tmp",
+    )
+    try:
+        with os.fdopen(
+            file_descriptor, "w", encoding="utf-8", newline=""
+        ) as temp_file:
+            temp_file.write(text)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        if path.exists():
+            shutil.copymode(path, temp_name)
+        try:
+            os.replace(temp_name, path)
+        except OSError as error:
+            # Files bind mounted into a container (see docker-compose.yml)
+            # can't be replaced, fall back to writing in place.
+            if error.errno not in (errno.EBUSY, errno.EXDEV):
+                raise
+            LOGGER.debug(f"Cannot replace {path}, writing in place.")
+            with path.open("w", encoding="utf-8", newline="") as file:
+                file.write(text)
+    finally:
+        if os.path.exists(temp_name):
+            os.unlink(temp_name)
+
+
+class FileTooLargeError(Exception):
+    """Raised when a file is larger than the caller is willing to read."""
+
+
+class AsyncFileIO():
+    """
+    Runs blocking file access in a bounded thread pool, so a slow disk (or
+    a hung network mount) doesn't stall the event loop, Discord heartbeats
+    and console relay with it. Operations on the same path are serialised
+    by a lock and time out after `timeout` seconds. A timed out operation's
+    thread can't be interrupted, it keeps its pool slot until it returns.
+    """
+    def __init__(
+        self,
+        max_workers: int = FILE_IO_WORKERS,
+        timeout: float = FILE_IO_TIMEOUT,
+    ) -> None:
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="craftlink-file-io"
+        )
+        self.timeout = timeout
+        # Locks are dropped once no operation on their path holds them.
+        self._locks = weakref.WeakValueDictionary()
+
+    def lock(self, path: Path) -> asyncio.Lock:
+        """Lock for a path, to group several operations on it."""
+        key = os.path.abspath(path)
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[key] = lock
+        return lock
+
+    async def run(self, path: Path, function: Callable, *args):
+        """Call `function(*args)` in the pool, holding the path's lock."""
+        async with self.lock(path):
+            return await self.run_unlocked(path, function, *args)
+
+    async def run_unlocked(self, path: Path, function: Callable, *args):
+        """Like `run`, for callers already holding the path's lock."""
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(self.executor, function, *args),
+                self.timeout,
+            )
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Timed out accessing {path}.")
+
+    async def file_stamp(self, path: Path) -> tuple[int, int] | None:
+        return await self.run(path, file_stamp, path)
+
+    async def read_text(self, path: Path, limit: int = FILE_READ_LIMIT) -> str:
+        """Read a text file, keeping its newlines as they are."""
+        return await self.run(path, _read_text, path, limit)
+
+    async def read_bytes(
+        self,
+        path: Path,
+        limit: int = FILE_READ_LIMIT,
+    ) -> bytes:
+        return await self.run(path, _read_bytes, path, limit)
+
+    async def read_chunks(
+        self,
+        path: Path,
+        limit: int = FILE_READ_LIMIT,
+        chunk_size: int = FILE_READ_CHUNK_SIZE,
+    ) -> AsyncIterator[bytes]:
+        """Stream a file in chunks, each read in the pool."""
+        async with self.lock(path):
+            file = await self.run_unlocked(path, _open_limited, path, limit)
+            try:
+                while True:
+                    chunk = await self.run_unlocked(
+                        path, file.read, chunk_size
+                    )
+                    if not chunk:
+                        break
+                    yield chunk
+            finally:
+                await self.run_unlocked(path, file.close)
+
+    async def write_text(self, path: Path, text: str) -> None:
+        """Atomically write a text file, see `atomic_write_text`."""
+        await self.run(path, atomic_write_text, path, text)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
+
+
+def file_stamp(path: Path) -> tuple[int, int] | None:
+    """Modification time and size of a file, or None if it's missing."""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _open_limited(path: Path, limit: int) -> BinaryIO:
+    file = path.open("rb")
+    size = os.fstat(file.fileno()).st_size
+    if size > limit:
+        file.close()
+        raise FileTooLargeError(
+            f"{path.name} is {size} bytes, over the limit of {limit}."
+        )
+    return file
+
+
+def _read_bytes(path: Path, limit: int) -> bytes:
+    with _open_limited(path, limit) as file:
+        return file.read()
+
+
+def _read_text(path: Path, limit: int) -> str:
+    return _read_bytes(path, limit).decode("utf-8")
+
+
+# Shared by everything touching the server directories.
+FILE_IO = AsyncFileIO()
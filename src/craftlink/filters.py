@@ -0,0 +1,155 @@
+from __future__ import annotations
+import logging
+import re
+from collections import Counter
+from pathlib import Path
+
+from craftlink.constants import IGNORED_MESSAGE_PATTERNS
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Inline flags at the start of a rule, which apply to the whole pattern.
+GLOBAL_FLAGS = re.compile(rb"\(\?([aiLmsux]+)\)")
+# Numbered backreferences and conditionals, preceded by an even number of
+# backslashes so they aren't escaped.
+NUMBERED_REFERENCE = re.compile(rb"(?<!\\)(?:\\\\)*\\[1-9]|\(\?\(\d")
+
+
+class MessageFilter():
+    """
+    Decide which lines of server output get relayed.
+    Lines matching an exclude rule are dropped unless they also match an
+    include rule. Each set of rules is compiled once into a single bytes
+    pattern, so lines are checked in one pass without being decoded.
+    Rules can't use named groups or backreferences, as their groups are
+    renumbered when joined, and leading inline flags only apply to the rule.
+    """
+    def __init__(
+        self,
+        exclude_patterns: tuple[str] = IGNORED_MESSAGE_PATTERNS,
+        include_patterns: tuple[str] = (),
+    ) -> None:
+        self.exclude_patterns = tuple(exclude_patterns)
+        self.include_patterns = tuple(include_patterns)
+        self._exclude = self._compile(self.exclude_patterns)
+        self._include = self._compile(self.include_patterns)
+        self.exclude_hits = Counter()
+        self.include_hits = Counter()
+
+    @classmethod
+    def from_file(cls, rules_file: str | Path) -> MessageFilter:
+        """
+        Build a filter from a rules file, on top of the default exclusions.
+        Each line is `exclude <regex>` or `include <regex>`, blank lines and
+        lines starting with `#` are skipped.
+        """
+        exclude_patterns = list(IGNORED_MESSAGE_PATTERNS)
+        include_patterns = []
+        rules_text = Path(rules_file).read_text(encoding="utf-8")
+        for line_number, line in enumerate(rules_text.splitlines(), 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            rule_type, _, pattern = line.partition(" ")
+            pattern = pattern.strip()
+            if rule_type == "exclude" and pattern:
+                exclude_patterns.append(pattern)
+            elif rule_type == "include" and pattern:
+                include_patterns.append(pattern)
+            else:
+                raise ValueError(
+                    f"Invalid rule on line {line_number} of {rules_file}."
+                )
+        LOGGER.info(
+            f"Loaded {len(exclude_patterns)} exclude and"
+            f" {len(include_patterns)} include message filter rules."
+        )
+        return cls(exclude_patterns, include_patterns)
+
+    @staticmethod
+    def _compile(patterns: tuple[str]) -> tuple[re.Pattern, dict] | None:
+        """
+        Join patterns into one alternation, each wrapped in a group.
+        Returns the compiled pattern and a map of group index to rule index,
+        as a rule's wrapping group is the last to close when it matches,
+        `Match.lastindex` identifies the rule.
+        """
+        if not patterns:
+            return None
+        group_rules = {}
+        group_index = 1
+        rules = []
+        for rule_index, pattern in enumerate(patterns):
+            # Compile individually first so a bad rule is named in the error.
+            try:
+                rule = MessageFilter._scope_flags(pattern.encode("utf-8"))
+                rule_regex = re.compile(rule)
+            except re.error as error:
+                raise ValueError(f"Invalid pattern `{pattern}`: {error}.")
+            # Group numbers and names change once rules are joined.
+            if rule_regex.groupindex:
+                raise ValueError(
+                    f"Invalid pattern `{pattern}`: named groups aren't"
+                    " supported."
+                )
+            if rule_regex.groups and NUMBERED_REFERENCE.search(rule):
+                raise ValueError(
+                    f"Invalid pattern `{pattern}`: backreferences aren't"
+                    " supported."
+                )
+            rules.append(rule)
+            group_rules[group_index] = rule_index
+            group_index += rule_regex.groups + 1
+        try:
+            regex = re.compile(b"|".join(b"(%s)" % i for i in rules))
+        except re.error as error:
+            raise ValueError(f"Invalid patterns: {error}.")
+        return regex, group_rules
+
+    @staticmethod
+    def _scope_flags(rule: bytes) -> bytes:
+        """
+        Rewrite leading inline flags, e.g. `(?i)`, to only apply to the
+        rule, `(?i:...)`, as global flags can't be used once it's joined.
+        """
+        flags = b""
+        while match := GLOBAL_FLAGS.match(rule):
+            flags += match.group(1)
+            rule = rule[match.end():]
+        if not flags:
+            return rule
+        # A comment in verbose mode would run on over the closing bracket.
+        end = b"\n)" if b"x" in flags else b")"
+        return b"(?%s:%s%s" % (flags, rule, end)
+
+    def allow(self, line: bytes) -> bool:
+        """Return whether a line of server output should be relayed."""
+        if self._exclude is None:
+            return True
+        exclude_regex, exclude_rules = self._exclude
+        match = exclude_regex.search(line)
+        if match is None:
+            return True
+        if self._include is not None:
+            include_regex, include_rules = self._include
+            include_match = include_regex.search(line)
+            if include_match is not None:
+                self.include_hits[include_rules[include_match.lastindex]] += 1
+                return True
+        self.exclude_hits[exclude_rules[match.lastindex]] += 1
+        return False
+
+    def report(self) -> str:
+        """Summarise how often each rule has matched."""
+        lines = []
+        for title, patterns, hits in (
+            ("Exclude", self.exclude_patterns, self.exclude_hits),
+            ("Include", self.include_patterns, self.include_hits),
+        ):
+            if not patterns:
+                continue
+            lines.append(f"**{title} rules**")
+            for rule_index, pattern in enumerate(patterns):
+                lines.append(f"- `{pattern}`: {hits[rule_index]} hits")
+        return "\n".join(lines) or "No message filter rules configured."
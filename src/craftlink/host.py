@@ -0,0 +1,376 @@
+"""
+Long-lived host for a Minecraft server process, so the bot can restart
+without taking the server down with it.
+
+The host owns the server's stdin/stdout, keeps recent output in a replay
+buffer and serves clients over a Unix socket. Clients attach from the last
+output offset they saw and get everything after it that is still buffered.
+Offsets restart with each host, so they're paired with the host's epoch,
+and clients attaching with another epoch get the whole buffer.
+POSIX only, as it relies on Unix sockets.
+
+    craftlink-host --socket /srv/bedrock/craftlink-host.sock
+"""
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+import secrets
+import signal
+import struct
+from argparse import ArgumentParser
+from collections import deque
+
+from craftlink.constants import (
+    HOST_CLIENT_BUFFER_BYTES,
+    HOST_REPLAY_BUFFER_BYTES,
+)
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Frames are a header of type, an integer argument (e.g. an output offset)
+# and payload length, followed by the payload.
+FRAME_HEADER = struct.Struct("!BqI")
+# Host to client.
+FRAME_OUTPUT = 1
+FRAME_STARTED = 2
+FRAME_EXITED = 3
+FRAME_ERROR = 4
+FRAME_EPOCH = 5
+# Client to host. Attach frames carry the epoch seen last as decimal text.
+FRAME_ATTACH = 10
+FRAME_INPUT = 11
+FRAME_START = 12
+FRAME_SIGNAL = 13
+# Random epochs fit in a frame's signed 64 bit argument.
+EPOCH_BITS = 63
+# Reported for a hosted server once out of reach, so it isn't treated as a
+# crash and restarted while it may well still be running.
+LOST_RETURNCODE = 0
+
+
+def encode_frame(frame_type: int, argument: int, payload: bytes) -> bytes:
+    return FRAME_HEADER.pack(frame_type, argument, len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple[int, int, bytes]:
+    header = await reader.readexactly(FRAME_HEADER.size)
+    frame_type, argument, length = FRAME_HEADER.unpack(header)
+    return frame_type, argument, await reader.readexactly(length)
+
+
+class ServerHost():
+    """Runs the server process and relays it to any attached clients."""
+    def __init__(self, socket_path: str) -> None:
+        self.socket_path = socket_path
+        self.server_proc = None
+        # Identifies this host's offsets, which restart with each host.
+        self.epoch = secrets.randbits(EPOCH_BITS)
+        self.next_offset = 0
+        # Recent output as (offset, line), capped by total size.
+        self.replay_buffer = deque()
+        self.replay_buffer_size = 0
+        self.clients = set()
+
+    async def serve(self) -> None:
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        # Only our user may connect, from the moment the socket exists.
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(
+                self._handle_client, self.socket_path
+            )
+        finally:
+            os.umask(umask)
+        LOGGER.info(f"Server host listening on {self.socket_path}.")
+        async with server:
+            await server.serve_forever()
+
+    def _broadcast(self, frame: bytes) -> None:
+        for writer in list(self.clients):
+            if writer.is_closing():
+                self.clients.discard(writer)
+            elif (
+                writer.transport.get_write_buffer_size()
+                > HOST_CLIENT_BUFFER_BYTES
+            ):
+                # Too far behind, drop it rather than buffer without end.
+                LOGGER.warning("Dropping a client that isn't keeping up.")
+                self.clients.discard(writer)
+                writer.transport.abort()
+            else:
+                writer.write(frame)
+
+    def _started_frame(self) -> bytes:
+        return encode_frame(FRAME_STARTED, self.server_proc.pid, b"")
+
+    async def _start_server(
+        self,
+        writer: asyncio.StreamWriter,
+        request: dict,
+    ) -> None:
+        if self.server_proc is not None and self.server_proc.returncode is None:
+            # Already running, hand the requester the current run.
+            writer.write(self._started_frame())
+            return
+        env = {**os.environ, **request.get("env", {})}
+        LOGGER.info(f"Starting process: {' '.join(request['argv'])}")
+        self.server_proc = await asyncio.create_subprocess_exec(
+            *request["argv"],
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            cwd=request["cwd"],
+            env=env,
+        )
+        self._broadcast(self._started_frame())
+        asyncio.create_task(self._read_output(self.server_proc))
+
+    async def _read_output(
+        self,
+        server_proc: asyncio.subprocess.Process,
+    ) -> None:
+        stdout = server_proc.stdout
+        while True:
+            try:
+                line = await stdout.readuntil(b"\n")
+            except asyncio.IncompleteReadError as error:
+                line = error.partial
+                if not line:
+                    break
+            except asyncio.LimitOverrunError as error:
+                line = await stdout.read(error.consumed)
+            self._buffer_output(line)
+        returncode = await server_proc.wait()
+        LOGGER.info(f"Server process exited with code {returncode}.")
+        self._broadcast(encode_frame(FRAME_EXITED, returncode, b""))
+
+    def _buffer_output(self, line: bytes) -> None:
+        offset = self.next_offset
+        self.next_offset += 1
+        self.replay_buffer.append((offset, line))
+        self.replay_buffer_size += len(line)
+        while self.replay_buffer_size > HOST_REPLAY_BUFFER_BYTES:
+            self.replay_buffer_size -= len(self.replay_buffer.popleft()[1])
+        self._broadcast(encode_frame(FRAME_OUTPUT, offset, line))
+
+    async def _handle_client(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        try:
+            while True:
+                frame_type, argument, payload = await read_frame(reader)
+                if frame_type == FRAME_ATTACH:
+                    self._attach(writer, argument, payload)
+                elif frame_type == FRAME_START:
+                    try:
+                        await self._start_server(
+                            writer, json.loads(payload)
+                        )
+                    except (OSError, ValueError, KeyError) as error:
+                        writer.write(
+                            encode_frame(FRAME_ERROR, 0, str(error).encode())
+                        )
+                elif frame_type == FRAME_INPUT:
+                    if self.server_proc and self.server_proc.returncode is None:
+                        self.server_proc.stdin.write(payload)
+                elif frame_type == FRAME_SIGNAL:
+                    if self.server_proc and self.server_proc.returncode is None:
+                        self.server_proc.send_signal(argument)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    def _attach(
+        self,
+        writer: asyncio.StreamWriter,
+        last_offset: int,
+        epoch: bytes,
+    ) -> None:
+        """Send the client the current run and any output it missed."""
+        if epoch != str(self.epoch).encode():
+            # Offsets from another host mean nothing here.
+            last_offset = -1
+        writer.write(encode_frame(FRAME_EPOCH, self.epoch, b""))
+        self.clients.add(writer)
+        if self.server_proc is None or self.server_proc.returncode is not None:
+            return
+        writer.write(self._started_frame())
+        for offset, line in self.replay_buffer:
+            if offset > last_offset:
+                writer.write(encode_frame(FRAME_OUTPUT, offset, line))
+
+
+class _HostStdin():
+    """Stand-in for a process's stdin, writing to the host."""
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self._writer = writer
+
+    def write(self, data: bytes) -> None:
+        self._writer.write(encode_frame(FRAME_INPUT, 0, data))
+
+
+class HostedProcess():
+    """
+    Stand-in for `asyncio.subprocess.Process` for a server run by a host,
+    so `CraftCommander` can use it like a process it started itself.
+    """
+    def __init__(self, client: HostClient, pid: int) -> None:
+        self.pid = pid
+        self.returncode = None
+        self.stdin = _HostStdin(client.writer)
+        self.stdout = asyncio.StreamReader()
+        self._client = client
+        self._exited = asyncio.get_running_loop().create_future()
+
+    def _exit(self, returncode: int) -> None:
+        if self.returncode is None:
+            self.returncode = returncode
+            self.stdout.feed_eof()
+            self._exited.set_result(returncode)
+
+    async def wait(self) -> int:
+        return await asyncio.shield(self._exited)
+
+    def send_signal(self, signal_number: int) -> None:
+        self._client.writer.write(
+            encode_frame(FRAME_SIGNAL, signal_number, b"")
+        )
+
+    def terminate(self) -> None:
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self) -> None:
+        self.send_signal(signal.SIGKILL)
+
+
+class HostClient():
+    """Connection to a `ServerHost`, tracking the server run it's hosting."""
+    def __init__(self, socket_path: str) -> None:
+        self.socket_path = socket_path
+        self.reader = None
+        self.writer = None
+        self.process = None
+        self.epoch = None
+        self.last_offset = -1
+        self._read_task = None
+        self._started = None
+        self._error = None
+
+    @property
+    def connected(self) -> bool:
+        return self._read_task is not None and not self._read_task.done()
+
+    async def connect(
+        self,
+        epoch: int | None = None,
+        last_offset: int = -1,
+    ) -> None:
+        """
+        Attach to the host, resuming output after `last_offset` if the host
+        is still the one with `epoch`.
+        """
+        self.reader, self.writer = await asyncio.open_unix_connection(
+            self.socket_path
+        )
+        self.epoch = epoch
+        self.last_offset = last_offset
+        # Any earlier run is over as far as this connection knows.
+        self.process = None
+        self._error = None
+        self._started = asyncio.Event()
+        epoch_text = b"" if epoch is None else str(epoch).encode()
+        self.writer.write(encode_frame(FRAME_ATTACH, last_offset, epoch_text))
+        await self.writer.drain()
+        self._read_task = asyncio.create_task(self._read_frames())
+        # Give the host a moment to report a server already running.
+        try:
+            await asyncio.wait_for(self._started.wait(), 0.5)
+        except asyncio.TimeoutError:
+            pass
+
+    async def start(
+        self,
+        argv: list[str],
+        cwd: str,
+        env: dict[str, str],
+        timeout: float = 10.0,
+    ) -> HostedProcess:
+        """
+        Ask the host to start the server, returning its process, or the
+        process of the run already going.
+        """
+        self._started.clear()
+        self._error = None
+        request = {"argv": argv, "cwd": cwd, "env": env}
+        self.writer.write(
+            encode_frame(FRAME_START, 0, json.dumps(request).encode())
+        )
+        await self.writer.drain()
+        await asyncio.wait_for(self._started.wait(), timeout)
+        if self._error is not None:
+            raise OSError(f"Server host failed to start server: {self._error}")
+        return self.process
+
+    async def _read_frames(self) -> None:
+        try:
+            while True:
+                frame_type, argument, payload = await read_frame(self.reader)
+                if frame_type == FRAME_EPOCH:
+                    self.epoch = argument
+                elif frame_type == FRAME_OUTPUT:
+                    self.last_offset = argument
+                    if self.process is not None:
+                        self.process.stdout.feed_data(payload)
+                elif frame_type == FRAME_STARTED:
+                    self.process = HostedProcess(self, argument)
+                    self._started.set()
+                elif frame_type == FRAME_EXITED:
+                    if self.process is not None:
+                        self.process._exit(argument)
+                elif frame_type == FRAME_ERROR:
+                    self._error = payload.decode(errors="replace")
+                    self._started.set()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            LOGGER.warning("Lost connection to the server host.")
+        finally:
+            # The server may still be running, but it's out of reach.
+            if self.process is not None:
+                self.process._exit(LOST_RETURNCODE)
+
+    async def close(self) -> None:
+        """Detach from the host, leaving the server running."""
+        if self._read_task is not None:
+            self._read_task.cancel()
+            try:
+                await self._read_task
+            except asyncio.CancelledError:
+                pass
+            self._read_task = None
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "-s",
+        "--socket",
+        default=os.environ.get("CRAFTLINK_HOST_SOCKET", ""),
+        required=not os.environ.get("CRAFTLINK_HOST_SOCKET"),
+        help="Path of the Unix socket to listen on.",
+    )
+    options = parser.parse_args()
+    try:
+        asyncio.run(ServerHost(options.socket).serve())
+    except KeyboardInterrupt:
+        pass
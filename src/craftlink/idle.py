@@ -0,0 +1,274 @@
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from functools import partial
+from typing import TYPE_CHECKING
+
+from craftlink.jobs import LIFECYCLE
+from craftlink.parser import (
+    ConsoleEvent,
+    PlayerJoin,
+    PlayerLeave,
+    ServerStarted,
+)
+from craftlink.presence import format_duration
+from craftlink.rcon import RconError
+
+if TYPE_CHECKING:
+    from craftlink.command import CraftCommander
+
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_GAME_PORTS = {"bedrock": 19132, "java": 25565}
+# RakNet's Open Connection Request 1, sent by Bedrock clients joining. Pings
+# from the server list are ignored.
+RAKNET_OPEN_CONNECTION_REQUEST = 0x05
+# Java handshake's next state when logging in, rather than a status ping.
+JAVA_LOGIN_STATE = 2
+
+
+class IdleManager():
+    """
+    Stops the server once nobody has been online for `idle_timeout`
+    seconds, saving the world first so it stops quickly. While stopped, it
+    can listen on the game port and start the server again as soon as a
+    player tries to join. Also reports how long each start took.
+    """
+    def __init__(
+        self,
+        commander: CraftCommander,
+        idle_timeout: float,
+        wake_on_connect: bool,
+    ) -> None:
+        self.commander = commander
+        self.idle_timeout = idle_timeout
+        self.wake_on_connect = wake_on_connect
+        self.idle_task = None
+        self.wake_task = None
+        # Background tasks, kept so they aren't garbage collected mid-run.
+        self.tasks = set()
+        self.listener = None
+        self.start_requested = None
+        # Whether presence knows everyone online. Not after attaching to a
+        # server already running, until its players have been listed.
+        self.online_known = True
+
+    def handle_event(self, event: ConsoleEvent) -> None:
+        if isinstance(event, ServerStarted):
+            self._report_start()
+            self.online_known = True
+        if not self.idle_timeout:
+            return
+        if isinstance(event, PlayerJoin):
+            self._cancel_idle_timer()
+        elif isinstance(event, (PlayerLeave, ServerStarted)):
+            self._arm_idle_timer()
+
+    def online_unknown(self) -> None:
+        """Don't stop the server until who's online is known again."""
+        self.online_known = False
+        self._cancel_idle_timer()
+
+    def players_listed(self) -> None:
+        """Note presence has been matched to the server's player list."""
+        self.online_known = True
+        if self.idle_timeout:
+            self._arm_idle_timer()
+
+    def _arm_idle_timer(self) -> None:
+        if (
+            self.online_known
+            and not self.commander.presence.online
+            and self.idle_task is None
+        ):
+            self.idle_task = asyncio.create_task(self._stop_when_idle())
+
+    def server_starting(self) -> None:
+        """Note the time the server was started, to time the start up."""
+        self.start_requested = time.monotonic()
+
+    def _report_start(self) -> None:
+        if self.start_requested is None:
+            return
+        startup_seconds = time.monotonic() - self.start_requested
+        self.start_requested = None
+        self.commander.metrics.startup_seconds = startup_seconds
+        name = self.commander.name
+        LOGGER.info(f"{name} server started in {startup_seconds:.1f}s.")
+        self._spawn(
+            self.commander.notify(
+                f"{name} server started in {startup_seconds:.1f}s."
+            ),
+            "report the server start",
+        )
+
+    def _spawn(self, coroutine, description: str) -> asyncio.Task:
+        """Run a coroutine in the background, logging if it fails."""
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(partial(self._task_done, description))
+        return task
+
+    def _task_done(self, description: str, task: asyncio.Task) -> None:
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            LOGGER.error(
+                f"Failed to {description}.", exc_info=task.exception()
+            )
+
+    def _cancel_idle_timer(self) -> None:
+        if self.idle_task is not None:
+            self.idle_task.cancel()
+            self.idle_task = None
+
+    async def _stop_when_idle(self) -> None:
+        await asyncio.sleep(self.idle_timeout)
+        self.idle_task = None
+        commander = self.commander
+        if commander.presence.online or not await commander.server_running:
+            return
+        # Only once any other start, stop or backup is done, checking again
+        # then.
+        commander.jobs.submit(
+            "idle stop",
+            self._stop_idle_server,
+            conflicts=LIFECYCLE,
+            user_name="idle timer",
+        )
+
+    async def _stop_idle_server(self) -> str:
+        commander = self.commander
+        if commander.presence.online:
+            return "Someone joined, the server was left running."
+        if not await commander.server_running:
+            return "The server was already stopped."
+        LOGGER.info(f"{commander.name} server idle, stopping it.")
+        # Flush the world first so the stop itself is quick. Bedrock has no
+        # such command, it saves as it stops.
+        if commander.server_type == "java":
+            try:
+                await commander.query_server("save-all flush")
+            except RconError:
+                LOGGER.warning("Failed to save before stopping.")
+        await commander.supervisor.stop()
+        message = (
+            f"{commander.name} server stopped after"
+            f" {format_duration(self.idle_timeout)} with nobody online."
+        )
+        if self.wake_on_connect:
+            try:
+                await self.listen()
+            except OSError as error:
+                LOGGER.warning(f"Cannot listen for players joining: {error}")
+            else:
+                message += " It will start again when someone joins."
+        return message
+
+    async def listen(self) -> None:
+        """Listen on the game port for players trying to join."""
+        if self.listener is not None:
+            return
+        await self.commander.properties.refresh()
+        port = self.commander.properties.get("server-port")
+        port = int(port or DEFAULT_GAME_PORTS[self.commander.server_type])
+        loop = asyncio.get_running_loop()
+        if self.commander.server_type == "bedrock":
+            self.listener, _ = await loop.create_datagram_endpoint(
+                lambda: _BedrockWakeProtocol(self._wake),
+                local_addr=("0.0.0.0", port),
+            )
+        else:
+            self.listener = await asyncio.start_server(
+                self._handle_java_connection, port=port
+            )
+        LOGGER.info(f"Listening for players joining on port {port}.")
+
+    async def stop_listening(self) -> None:
+        """Free the game port, e.g. for the server to start."""
+        listener = self.listener
+        self.listener = None
+        if listener is None:
+            return
+        listener.close()
+        if isinstance(listener, asyncio.AbstractServer):
+            await listener.wait_closed()
+
+    async def _handle_java_connection(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        try:
+            next_state = await asyncio.wait_for(
+                _read_java_handshake(reader), 5
+            )
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError,
+                ConnectionError, ValueError):
+            next_state = None
+        finally:
+            writer.close()
+        if next_state == JAVA_LOGIN_STATE:
+            self._wake()
+
+    def _wake(self) -> None:
+        if self.listener is None:
+            return
+        # Clients retry joining, one start is enough.
+        if self.wake_task is not None and not self.wake_task.done():
+            return
+        self.wake_task = self._spawn(
+            self._start_for_player(), "start the server for a player"
+        )
+
+    async def _start_for_player(self) -> None:
+        await self.stop_listening()
+        name = self.commander.name
+        LOGGER.info(f"Player trying to join, starting {name} server.")
+        await self.commander.notify(
+            f"Someone is trying to join, starting {name} server."
+        )
+        self.commander.jobs.submit(
+            "start for player",
+            self.commander.start_server,
+            conflicts=LIFECYCLE,
+            user_name="idle timer",
+        )
+
+    async def close(self) -> None:
+        self._cancel_idle_timer()
+        await self.stop_listening()
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+class _BedrockWakeProtocol(asyncio.DatagramProtocol):
+    def __init__(self, wake) -> None:
+        self.wake = wake
+
+    def datagram_received(self, data: bytes, address: tuple) -> None:
+        if data and data[0] == RAKNET_OPEN_CONNECTION_REQUEST:
+            self.wake()
+
+
+async def _read_varint(reader: asyncio.StreamReader) -> int:
+    value = 0
+    for shift in range(0, 35, 7):
+        byte = (await reader.readexactly(1))[0]
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value
+    raise ValueError("VarInt too long.")
+
+
+async def _read_java_handshake(reader: asyncio.StreamReader) -> int:
+    """Read a Java client's handshake, returning the next state it wants."""
+    await _read_varint(reader)  # Packet length.
+    if await _read_varint(reader) != 0:
+        raise ValueError("Not a handshake.")
+    await _read_varint(reader)  # Protocol version.
+    await reader.readexactly(await _read_varint(reader))  # Server address.
+    await reader.readexactly(2)  # Server port.
+    return await _read_varint(reader)
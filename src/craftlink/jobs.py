@@ -0,0 +1,469 @@
+from __future__ import annotations
+import asyncio
+import contextvars
+import itertools
+import json
+import logging
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from craftlink.constants import (
+    CMD_PREFIX,
+    CRON_ALIASES,
+    DISCORD_MESSAGE_LIMIT,
+    JOB_HISTORY,
+    JOB_REPLY_SECONDS,
+    JOB_UPDATE_SECONDS,
+)
+from craftlink.files import FILE_IO
+from craftlink.presence import format_duration
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Jobs starting, stopping or backing up the server, run one at a time.
+LIFECYCLE = "lifecycle"
+# The job the current task is running, if any, see `report_progress`.
+CURRENT_JOB = contextvars.ContextVar("current_job", default=None)
+# The user whose command is being dispatched, named as the jobs' user, and
+# their tier, given to the commands they schedule.
+COMMAND_USER = contextvars.ContextVar("command_user", default="bot")
+COMMAND_TIER = contextvars.ContextVar("command_tier", default="none")
+# Ranges of each field of a cron expression, and the names of the fields.
+CRON_FIELDS = (
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day of month", 1, 31),
+    ("month", 1, 12),
+    ("day of week", 0, 7),
+)
+
+
+def report_progress(progress: str) -> None:
+    """Update the progress of the job running this, if any."""
+    job = CURRENT_JOB.get()
+    if job is not None:
+        job.progress = progress
+        job.manager.publish(job)
+
+
+class Job():
+    """A command running in the background, see `JobManager`."""
+    def __init__(
+        self,
+        manager: JobManager,
+        job_id: int,
+        name: str,
+        user_name: str,
+        conflicts: str | None,
+    ) -> None:
+        self.manager = manager
+        self.id = job_id
+        self.name = name
+        self.user_name = user_name
+        # Jobs with the same value don't run at the same time.
+        self.conflicts = conflicts
+        # One of queued, running, done, failed or cancelled.
+        self.state = "queued"
+        self.progress = None
+        self.result = None
+        self.created = time.monotonic()
+        self.started = None
+        self.finished = None
+        self.task = None
+        # Whether its progress is reported, rather than its result awaited.
+        self.detached = False
+        self.dirty = False
+        self.report_task = None
+
+    @property
+    def done(self) -> bool:
+        return self.finished is not None
+
+    def describe(self) -> str:
+        """One line summary of the job."""
+        if self.done:
+            if self.started is None:
+                status = self.state
+            else:
+                took = format_duration(self.finished - self.started)
+                status = f"{self.state} after {took}"
+        elif self.started is None:
+            status = f"queued for {self.age()}"
+        else:
+            status = f"running for {self.age()}"
+        return f"#{self.id} `{self.name}` by {self.user_name}, {status}"
+
+    def age(self) -> str:
+        return format_duration(
+            time.monotonic() - (self.started or self.created)
+        )
+
+    def render(self) -> str:
+        """The job's progress message."""
+        text = self.result if self.done else self.progress
+        message = f"**Job {self.describe()}**"
+        if text:
+            message = f"{message}\n{text}"
+        if len(message) > DISCORD_MESSAGE_LIMIT:
+            message = f"{message[:DISCORD_MESSAGE_LIMIT - 3]}..."
+        return message
+
+
+class JobManager():
+    """
+    Runs a server's slow commands as jobs, in the background, so commands
+    return quickly. Jobs that conflict, e.g. starting the server during a
+    backup, wait for each other, others run at the same time. Jobs can be
+    listed and cancelled, and commands can be scheduled with cron
+    expressions. The handlers are called with jobs as they progress,
+    at most every `JOB_UPDATE_SECONDS`.
+    """
+    def __init__(
+        self,
+        name: str,
+        schedule_file: Path,
+        run_scheduled: Callable[[Schedule], Awaitable[None]],
+    ) -> None:
+        self.name = name
+        self.schedule_file = schedule_file
+        self.run_scheduled = run_scheduled
+        self.ids = itertools.count(1)
+        # Queued and running jobs by ID.
+        self.jobs = {}
+        self.finished = deque(maxlen=JOB_HISTORY)
+        self.locks = defaultdict(asyncio.Lock)
+        # Job holding each lock.
+        self.holders = {}
+        # Coroutine functions to call with jobs to report.
+        self.handlers = []
+        # Scheduled commands by ID.
+        self.schedules = {}
+        self.schedule_task = None
+
+    def submit(
+        self,
+        name: str,
+        function: Callable[..., Awaitable[str]],
+        *args,
+        conflicts: str | None = None,
+        user_name: str | None = None,
+        detached: bool = True,
+    ) -> Job:
+        """
+        Run a coroutine function returning a message as a job, after any
+        job with the same `conflicts` finishes. Detached jobs' progress is
+        reported from the start.
+        """
+        job = Job(
+            self,
+            next(self.ids),
+            name,
+            user_name or COMMAND_USER.get(),
+            conflicts,
+        )
+        job.detached = detached
+        self.jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job, function, args))
+        if detached:
+            self.publish(job)
+        return job
+
+    async def run(
+        self,
+        name: str,
+        function: Callable[..., Awaitable[str]],
+        *args,
+        conflicts: str | None = None,
+        user_name: str | None = None,
+    ) -> str:
+        """
+        Run a job, returning its result if it finishes within
+        `JOB_REPLY_SECONDS`, otherwise leaving it to report its progress.
+        """
+        job = self.submit(
+            name,
+            function,
+            *args,
+            conflicts=conflicts,
+            user_name=user_name,
+            detached=False,
+        )
+        await asyncio.wait({job.task}, timeout=JOB_REPLY_SECONDS)
+        if job.done:
+            return job.result
+        job.detached = True
+        self.publish(job)
+        return (
+            f"Job #{job.id} `{name}` is {job.state}, see its progress below."
+            f" Use `{CMD_PREFIX}cancel {job.id}` to cancel it."
+        )
+
+    async def _run(
+        self,
+        job: Job,
+        function: Callable[..., Awaitable[str]],
+        args: tuple,
+    ) -> None:
+        # Set in this task's own copy of the context.
+        CURRENT_JOB.set(job)
+        try:
+            if job.conflicts is None:
+                await self._execute(job, function, args)
+            else:
+                lock = self.locks[job.conflicts]
+                holder = self.holders.get(job.conflicts)
+                if holder is not None:
+                    job.progress = f"Waiting for job #{holder.id}."
+                    self.publish(job)
+                async with lock:
+                    self.holders[job.conflicts] = job
+                    try:
+                        await self._execute(job, function, args)
+                    finally:
+                        del self.holders[job.conflicts]
+        except asyncio.CancelledError:
+            job.state = "cancelled"
+            job.result = "Cancelled."
+        except Exception:
+            LOGGER.exception(f"{self.name} server job {job.name} failed.")
+            job.state = "failed"
+            job.result = "Something went wrong, the error has been logged."
+        finally:
+            job.finished = time.monotonic()
+            del self.jobs[job.id]
+            self.finished.append(job)
+            self.publish(job)
+
+    async def _execute(
+        self,
+        job: Job,
+        function: Callable[..., Awaitable[str]],
+        args: tuple,
+    ) -> None:
+        job.state = "running"
+        job.started = time.monotonic()
+        job.progress = None
+        self.publish(job)
+        job.result = await function(*args)
+        job.state = "done"
+
+    def publish(self, job: Job) -> None:
+        """Report a job's state to the handlers, if it's detached."""
+        job.dirty = True
+        if job.detached and job.report_task is None and self.handlers:
+            job.report_task = asyncio.create_task(self._report(job))
+
+    async def _report(self, job: Job) -> None:
+        try:
+            while job.dirty:
+                job.dirty = False
+                for handler in self.handlers:
+                    try:
+                        await handler(job)
+                    except Exception:
+                        LOGGER.exception(f"Job handler {handler} failed.")
+                if job.dirty:
+                    # Edits of one message are rate limited.
+                    await asyncio.sleep(JOB_UPDATE_SECONDS)
+        finally:
+            job.report_task = None
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a job, returning whether it was queued or running."""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return False
+        job.task.cancel()
+        return True
+
+    def report(self) -> str:
+        """Summary of running and recently finished jobs."""
+        lines = []
+        if self.jobs:
+            lines.append("**Running**")
+            for job in self.jobs.values():
+                line = f"- {job.describe()}"
+                if job.progress:
+                    line = f"{line}: {job.progress}"
+                lines.append(line)
+        if self.finished:
+            lines.append("**Finished**")
+            lines.extend(f"- {i.describe()}" for i in reversed(self.finished))
+        return "\n".join(lines) or "No jobs have run yet."
+
+    async def load_schedules(self) -> None:
+        try:
+            text = await FILE_IO.read_text(self.schedule_file)
+        except FileNotFoundError:
+            return
+        self.schedules = {
+            int(k): Schedule.from_dict(v) for k, v in json.loads(text).items()
+        }
+        self._start_scheduler()
+
+    async def save_schedules(self) -> None:
+        schedules = {str(k): v.to_dict() for k, v in self.schedules.items()}
+        await FILE_IO.write_text(
+            self.schedule_file, json.dumps(schedules, indent=4) + "\n"
+        )
+
+    async def add_schedule(self, schedule: Schedule) -> int:
+        """Schedule a command, returning the schedule's ID."""
+        schedule_id = max(self.schedules, default=0) + 1
+        self.schedules[schedule_id] = schedule
+        await self.save_schedules()
+        self._start_scheduler()
+        return schedule_id
+
+    async def remove_schedule(self, schedule_id: int) -> bool:
+        if self.schedules.pop(schedule_id, None) is None:
+            return False
+        await self.save_schedules()
+        return True
+
+    def _start_scheduler(self) -> None:
+        if self.schedules and self.schedule_task is None:
+            self.schedule_task = asyncio.create_task(self._run_schedules())
+
+    async def _run_schedules(self) -> None:
+        """Run each scheduled command due, checking at each minute."""
+        last_minute = None
+        while self.schedules:
+            await asyncio.sleep(60 - time.time() % 60)
+            # Sleeps can end just short of the minute, don't run it twice.
+            minute = datetime.now().replace(second=0, microsecond=0)
+            if minute == last_minute:
+                continue
+            last_minute = minute
+            for schedule in list(self.schedules.values()):
+                if schedule.cron.matches(minute):
+                    LOGGER.info(
+                        f"Running scheduled command: {schedule.command}"
+                    )
+                    asyncio.create_task(self.run_scheduled(schedule))
+        self.schedule_task = None
+
+    async def close(self) -> None:
+        """Cancel all jobs and scheduled commands."""
+        tasks = [i.task for i in self.jobs.values()]
+        if self.schedule_task is not None:
+            tasks.append(self.schedule_task)
+            self.schedule_task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class Schedule():
+    """
+    A command run whenever a cron expression matches, as the user who
+    scheduled it, with the tier they had then.
+    """
+    def __init__(
+        self,
+        cron: CronExpression,
+        command: str,
+        user_name: str,
+        tier: str,
+    ) -> None:
+        self.cron = cron
+        self.command = command
+        self.user_name = user_name
+        self.tier = tier
+
+    @classmethod
+    def from_dict(cls, schedule: dict) -> Schedule:
+        return cls(
+            CronExpression(schedule["cron"]),
+            schedule["command"],
+            schedule.get("user_name", "cron"),
+            # Unknown tiers can't run anything.
+            schedule.get("tier", "none"),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "cron": self.cron.expression,
+            "command": self.command,
+            "user_name": self.user_name,
+            "tier": self.tier,
+        }
+
+
+class CronExpression():
+    """
+    When to run a scheduled command: five fields of minute, hour, day of
+    month, month and day of week (0 or 7 is Sunday), each `*`, a number,
+    a range `a-b` or a list of those, optionally stepped with `/n`, e.g.
+    `0 4 * * *` is daily at 04:00. Also accepts `CRON_ALIASES`. As with
+    cron, when both days are restricted, either day matching is enough.
+    Raises `ValueError` for invalid expressions.
+    """
+    def __init__(self, expression: str) -> None:
+        self.expression = expression
+        expression = CRON_ALIASES.get(expression, expression)
+        fields = expression.split()
+        if len(fields) != len(CRON_FIELDS):
+            raise ValueError(
+                f"Expected {len(CRON_FIELDS)} fields, got {len(fields)}."
+            )
+        (
+            self.minutes,
+            self.hours,
+            self.days,
+            self.months,
+            self.weekdays,
+        ) = [
+            _parse_cron_field(field, *spec)
+            for field, spec in zip(fields, CRON_FIELDS)
+        ]
+        if 7 in self.weekdays:
+            self.weekdays = self.weekdays | {0}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def matches(self, moment: datetime) -> bool:
+        if (
+            moment.minute not in self.minutes
+            or moment.hour not in self.hours
+            or moment.month not in self.months
+        ):
+            return False
+        day = moment.day in self.days
+        # Python counts days of the week from Monday, cron from Sunday.
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+
+def _parse_cron_field(
+    field: str,
+    name: str,
+    minimum: int,
+    maximum: int,
+) -> frozenset[int]:
+    values = set()
+    try:
+        for part in field.split(","):
+            part, _, step = part.partition("/")
+            if part == "*":
+                start, end = minimum, maximum
+            elif "-" in part:
+                start, _, end = part.partition("-")
+                start, end = int(start), int(end)
+            else:
+                start = end = int(part)
+                if step:
+                    end = maximum
+            step = int(step) if step else 1
+            if not minimum <= start <= end <= maximum or step < 1:
+                raise ValueError
+            values.update(range(start, end + 1, step))
+    except ValueError:
+        raise ValueError(f"Invalid {name} field: {field}") from None
+    return frozenset(values)
@@ -0,0 +1,238 @@
+from __future__ import annotations
+import json
+import logging
+import os
+import re
+import time
+from collections import deque
+from functools import partial
+from pathlib import Path
+
+from craftlink.constants import (
+    GC_PAUSE_SAMPLES,
+    JVM_AUTO_HEAP_FRACTION,
+    JVM_MIN_HEAP_MB,
+    JVM_PROFILES,
+    JVM_RUN_HISTORY,
+)
+from craftlink.files import FILE_IO
+from craftlink.parser import ConsoleEvent, ServerStarted
+
+
+LOGGER = logging.getLogger(__name__)
+
+# GC log lines for stop-the-world pauses, e.g. G1's
+# "GC(3) Pause Young (Normal) (G1 Evacuation Pause) 24M->8M(256M) 3.456ms"
+# or ZGC's "GC(0) Pause Mark Start 0.012ms".
+GC_PAUSE_PATTERN = re.compile(rb"\bPause\b.*\s(\d+(?:\.\d+)?)ms\s*$")
+# Memory limits meaning "no limit" under cgroup v1.
+CGROUP_UNLIMITED = 1 << 60
+
+
+class GcPauseLog():
+    """Pause times read from the GC log of the running JVM as it grows."""
+    def __init__(self, log_file: Path) -> None:
+        self.log_file = log_file
+        self.reset()
+
+    def reset(self) -> None:
+        self.offset = 0
+        self._partial = b""
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.recent = deque(maxlen=GC_PAUSE_SAMPLES)
+
+    async def update(self) -> None:
+        """Read pauses logged since the last update."""
+        try:
+            data, size = await FILE_IO.run(
+                self.log_file, _read_from, self.log_file, self.offset
+            )
+        except FileNotFoundError:
+            return
+        if size < self.offset:
+            # Truncated, a new JVM started logging.
+            self.reset()
+            data, size = await FILE_IO.run(
+                self.log_file, _read_from, self.log_file, 0
+            )
+        self.offset += len(data)
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+        for line in lines:
+            match = GC_PAUSE_PATTERN.search(line)
+            if match:
+                pause_ms = float(match.group(1))
+                self.count += 1
+                self.total_ms += pause_ms
+                self.max_ms = max(self.max_ms, pause_ms)
+                self.recent.append(pause_ms)
+
+    def summary(self) -> dict:
+        samples = sorted(self.recent)
+        last = len(samples) - 1
+        return {
+            "gc_pauses": self.count,
+            "gc_pause_total_ms": round(self.total_ms, 3),
+            "gc_pause_max_ms": self.max_ms,
+            "gc_pause_p99_ms": samples[round(last * 0.99)] if samples else 0.0,
+        }
+
+
+class JavaLauncher():
+    """
+    Builds the command line for a Java server from a named launch profile
+    of JVM flags, sizing the heap from the host's memory if asked to, and
+    keeps a history of runs with the profile used, how long the server
+    took to start and its GC pauses, read from a GC log written each run.
+    """
+    def __init__(
+        self,
+        server_path: Path,
+        profile: str = "default",
+        mem_range: tuple[int | str, int | str] = (1024, 1024),
+        java_path: str = "java",
+        java_args: list[str] | tuple[str] = (),
+        server_args: list[str] | tuple[str] = (),
+    ) -> None:
+        if profile not in JVM_PROFILES:
+            raise ValueError(
+                f"Invalid Java profile given, {profile}, must be one of"
+                f" {', '.join(JVM_PROFILES)}."
+            )
+        self.server_path = server_path
+        self.profile = profile
+        self.mem_range = mem_range
+        self.java_path = java_path
+        self.java_args = list(java_args)
+        self.server_args = list(server_args)
+        # Relative to the server directory, which the server runs in.
+        self.gc_log_name = ".craftlink-gc.log"
+        self.gc_log = GcPauseLog(server_path / self.gc_log_name)
+        self.history_file = server_path / ".craftlink-java-runs.json"
+        self.runs = []
+        self.current_run = None
+        self._launched = None
+
+    def heap_sizes(self) -> tuple[int, int]:
+        """Minimum and maximum heap, in MiB."""
+        mem_min, mem_max = self.mem_range
+        if mem_max == "auto":
+            mem_max = max(
+                int(host_memory_mb() * JVM_AUTO_HEAP_FRACTION),
+                JVM_MIN_HEAP_MB,
+            )
+        jvm_flags = (*JVM_PROFILES[self.profile], *self.java_args)
+        # Pre-touching only helps if the whole heap is committed up front.
+        if mem_min == "auto" or "-XX:+AlwaysPreTouch" in jvm_flags:
+            mem_min = mem_max
+        return min(int(mem_min), int(mem_max)), int(mem_max)
+
+    def argv(self) -> list[str]:
+        mem_min, mem_max = self.heap_sizes()
+        jvm_flags = [*JVM_PROFILES[self.profile], *self.java_args]
+        # ZGC only logs its pauses as GC phases.
+        log_tags = "gc,gc+phases" if "-XX:+UseZGC" in jvm_flags else "gc"
+        return [
+            self.java_path,
+            f"-Xms{mem_min}M",
+            f"-Xmx{mem_max}M",
+            *jvm_flags,
+            f"-Xlog:{log_tags}:file={self.gc_log_name}:uptime:filecount=0",
+            "-jar",
+            "server.jar",
+            "nogui",
+            *self.server_args,
+        ]
+
+    async def load(self) -> None:
+        """Load the history of runs, if any."""
+        try:
+            runs = json.loads(await FILE_IO.read_text(self.history_file))
+        except FileNotFoundError:
+            return
+        self.runs = runs + self.runs
+
+    async def start_run(self, argv: list[str]) -> None:
+        """Start recording a run, as the server is launched with `argv`."""
+        # Don't count a previous run's pauses if the JVM's slow to log.
+        await FILE_IO.run(
+            self.gc_log.log_file,
+            partial(self.gc_log.log_file.unlink, missing_ok=True),
+        )
+        self.gc_log.reset()
+        _, mem_max = self.heap_sizes()
+        self.current_run = {
+            "started": time.time(),
+            "profile": self.profile,
+            "heap_mb": mem_max,
+            "argv": argv,
+            "startup_seconds": None,
+        }
+        self._launched = time.monotonic()
+
+    def handle_event(self, event: ConsoleEvent) -> None:
+        if isinstance(event, ServerStarted) and self._launched is not None:
+            self.current_run["startup_seconds"] = round(
+                time.monotonic() - self._launched, 3
+            )
+            self._launched = None
+
+    async def finish_run(self, returncode: int | None) -> None:
+        """Record the run that's ended, with its GC pauses."""
+        run = self.current_run
+        if run is None:
+            return
+        self.current_run = None
+        self._launched = None
+        await self.gc_log.update()
+        run.update(self.gc_log.summary(), exit_code=returncode)
+        self.runs.append(run)
+        del self.runs[:-JVM_RUN_HISTORY]
+        await FILE_IO.write_text(self.history_file, json.dumps(self.runs))
+
+
+def host_memory_mb() -> int:
+    """
+    Memory available to us in MiB, the lower of the host's total and any
+    cgroup (e.g. container) limit.
+    """
+    limits = []
+    for limit_file in (
+        "/sys/fs/cgroup/memory.max",
+        "/sys/fs/cgroup/memory/memory.limit_in_bytes",
+    ):
+        try:
+            limit = Path(limit_file).read_text().strip()
+        except OSError:
+            continue
+        if limit.isdigit() and int(limit) < CGROUP_UNLIMITED:
+            limits.append(int(limit) // 1024 // 1024)
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemTotal:"):
+                    limits.append(int(line.split()[1]) // 1024)
+                    break
+    except OSError:
+        pass
+    if not limits and hasattr(os, "sysconf"):
+        try:
+            pages = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+            limits.append(pages // 1024 // 1024)
+        except (OSError, ValueError):
+            pass
+    if not limits:
+        raise OSError("Cannot tell how much memory this host has.")
+    return min(limits)
+
+
+def _read_from(path: Path, offset: int) -> tuple[bytes, int]:
+    """Read a file from an offset, also returning its size."""
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if size < offset:
+            return b"", size
+        file.seek(offset)
+        return file.read(), size
@@ -0,0 +1,217 @@
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import deque
+
+from craftlink.constants import LATENCY_SAMPLES
+from craftlink.parser import ConsoleEvent, LagWarning
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Paper/Spigot reply to the `tps` command.
+TPS_PATTERN = re.compile(r"TPS from last 1m, 5m, 15m: \D*([\d.]+)")
+
+
+class ProcessSampler():
+    """
+    Sample a process's resource usage from /proc, Linux only.
+    CPU usage is averaged over the time since the previous sample.
+    """
+    def __init__(self) -> None:
+        self.clock_ticks = os.sysconf("SC_CLK_TCK") if os.name == "posix" else 0
+        self._last_pid = None
+        self._last_cpu_ticks = None
+        self._last_time = None
+
+    def sample(self, pid: int) -> dict | None:
+        """Return CPU %, RSS, thread and fd counts, or None if unavailable."""
+        proc_path = f"/proc/{pid}"
+        try:
+            with open(f"{proc_path}/stat", "rb") as stat_file:
+                # Skip past the command name, which may contain spaces.
+                stat = stat_file.read().rsplit(b")", 1)[1].split()
+            with open(f"{proc_path}/status", "rb") as status_file:
+                status = dict(
+                    i.split(b":", 1) for i in status_file.read().splitlines()
+                )
+            open_fds = len(os.listdir(f"{proc_path}/fd"))
+        except (OSError, ValueError, IndexError):
+            return None
+        now = time.monotonic()
+        # utime and stime, fields 14 and 15 of /proc/<pid>/stat.
+        cpu_ticks = int(stat[11]) + int(stat[12])
+        cpu_percent = None
+        if self._last_pid == pid and now > self._last_time:
+            cpu_seconds = (cpu_ticks - self._last_cpu_ticks) / self.clock_ticks
+            cpu_percent = 100 * cpu_seconds / (now - self._last_time)
+        self._last_pid = pid
+        self._last_cpu_ticks = cpu_ticks
+        self._last_time = now
+        rss_kb = int(status.get(b"VmRSS", b"0 kB").split()[0])
+        return {
+            "cpu_percent": cpu_percent,
+            "cpu_seconds": cpu_ticks / self.clock_ticks,
+            "rss_bytes": rss_kb * 1024,
+            "threads": int(status.get(b"Threads", b"0")),
+            "open_fds": open_fds,
+        }
+
+
+class ServerMetrics():
+    """Counters and gauges for one server, updated as output is relayed."""
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.process = ProcessSampler()
+        self.lines_read = 0
+        self.lines_relayed = 0
+        # Repeated lines held back and relayed only as a count.
+        self.lines_collapsed = 0
+        self.lag_warnings = 0
+        self.ticks_behind = 0
+        self.last_ms_behind = None
+        self.tps = None
+        # Seconds from starting the server to it reporting it's started.
+        self.startup_seconds = None
+        self.relay_latency_count = 0
+        self.relay_latency_sum = 0.0
+        self.relay_latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def handle_event(self, event: ConsoleEvent) -> None:
+        if isinstance(event, LagWarning):
+            self.lag_warnings += 1
+            self.ticks_behind += event.ticks_behind
+            self.last_ms_behind = event.ms_behind
+        elif "TPS from last" in event.message:
+            match = TPS_PATTERN.search(event.message)
+            if match:
+                self.tps = float(match.group(1))
+
+    def observe_relay_latency(self, seconds: float) -> None:
+        """Record the time from a line being read to it reaching Discord."""
+        self.relay_latency_count += 1
+        self.relay_latency_sum += seconds
+        self.relay_latencies.append(seconds)
+
+    def latency_percentiles(self) -> dict[str, float]:
+        """Percentiles over the most recent `LATENCY_SAMPLES` latencies."""
+        if not self.relay_latencies:
+            return {}
+        samples = sorted(self.relay_latencies)
+        last = len(samples) - 1
+        return {
+            str(i): samples[round(last * i)] for i in (0.5, 0.9, 0.99)
+        }
+
+
+def escape_label(value: str) -> str:
+    """Escape a label value for the Prometheus text format."""
+    return (
+        value.replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+    )
+
+
+def render_prometheus(server_stats: list[tuple[ServerMetrics, dict]]) -> str:
+    """
+    Render metrics in the Prometheus text format. Takes pairs of server
+    metrics and extra gauges (e.g. queue depth, process stats) per server.
+    """
+    families = {}
+
+    def add(name: str, kind: str, labels: str, value, suffix="") -> None:
+        # Suffixed samples, e.g. a summary's `_sum`, go in the family.
+        if value is None:
+            return
+        family = families.setdefault(name, (kind, []))
+        family[1].append(f"{name}{suffix}{{{labels}}} {value}")
+
+    for metrics, gauges in server_stats:
+        labels = f'server="{escape_label(metrics.name)}"'
+        add("craftlink_lines_read_total", "counter", labels,
+            metrics.lines_read)
+        add("craftlink_lines_relayed_total", "counter", labels,
+            metrics.lines_relayed)
+        add("craftlink_lines_collapsed_total", "counter", labels,
+            metrics.lines_collapsed)
+        add("craftlink_lag_warnings_total", "counter", labels,
+            metrics.lag_warnings)
+        add("craftlink_ticks_behind_total", "counter", labels,
+            metrics.ticks_behind)
+        add("craftlink_tps", "gauge", labels, metrics.tps)
+        add("craftlink_startup_seconds", "gauge", labels,
+            metrics.startup_seconds)
+        for quantile, value in metrics.latency_percentiles().items():
+            add("craftlink_relay_latency_seconds", "summary",
+                f'{labels},quantile="{quantile}"', value)
+        add("craftlink_relay_latency_seconds", "summary", labels,
+            metrics.relay_latency_sum, "_sum")
+        add("craftlink_relay_latency_seconds", "summary", labels,
+            metrics.relay_latency_count, "_count")
+        for gauge_name, value in gauges.items():
+            add(f"craftlink_{gauge_name}", "gauge", labels, value)
+    lines = []
+    for name, (kind, samples) in families.items():
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer():
+    """
+    Minimal HTTP server exposing metrics at `/metrics` for Prometheus.
+    Only listens on localhost by default.
+    """
+    def __init__(self, collect, port: int, host: str = "127.0.0.1") -> None:
+        # Callable returning the metrics page as text.
+        self.collect = collect
+        self.port = port
+        self.host = host
+        self.server = None
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(
+            self._handle, self.host, self.port
+        )
+        LOGGER.info(f"Serving metrics on http://{self.host}:{self.port}/.")
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def _handle(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            # Drain the headers, the request body is never needed.
+            while (await asyncio.wait_for(reader.readline(), 5)).strip():
+                pass
+            parts = request_line.decode(errors="replace").split()
+            if len(parts) >= 2 and parts[0] == "GET" and (
+                parts[1].split("?")[0] in ("/", "/metrics")
+            ):
+                status = "200 OK"
+                body = self.collect().encode()
+            else:
+                status = "404 Not Found"
+                body = b"Not found.\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
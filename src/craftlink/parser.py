@@ -0,0 +1,285 @@
+from __future__ import annotations
+import logging
+import re
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Line prefixes, e.g. "[2024-01-01 12:00:00:000 INFO] " from Bedrock,
+# "[12:00:00] [Server thread/INFO]: " from vanilla Java and
+# "[12:00:00 INFO]: " from Paper/Spigot.
+BEDROCK_PREFIX = re.compile(
+    rb"(?:NO LOG FILE! - )?\[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d(?::\d+)?)"
+    rb" ([A-Z]+)\] ?"
+)
+JAVA_PREFIX = re.compile(
+    rb"\[(\d\d:\d\d:\d\d)(?: ([A-Z]+)\]|\] \[([^\]]*)/([A-Z]+)\]): ?"
+)
+
+BEDROCK_CONNECTED = re.compile(rb"Player connected: (.+?), xuid: (\d*)")
+BEDROCK_DISCONNECTED = re.compile(rb"Player disconnected: (.+?), xuid: (\d*)")
+JAVA_UUID = re.compile(rb"UUID of player (\S+) is ([0-9a-f-]+)")
+JAVA_CHAT = re.compile(rb"(?:\[Not Secure\] )?<([^>]+)> (.*)")
+JAVA_ADVANCEMENT = re.compile(
+    rb"(\S+) has (?:made the advancement|completed the challenge"
+    rb"|reached the goal) \[(.+)\]"
+)
+JAVA_LAG = re.compile(rb"Running (\d+)ms or (\d+) ticks behind")
+JAVA_DONE = re.compile(rb"Done \((\d+(?:\.\d+)?)s\)!")
+# Java player names, anything else saying it joined or left is chat, e.g.
+# "[Server] Fake joined the game" from `say` or "* Steve joined..." from `me`.
+JAVA_PLAYER_NAME = re.compile(r"[A-Za-z0-9_]{1,16}")
+# Threads logging joins and leaves, None for Paper, which doesn't log it.
+JAVA_SERVER_THREADS = (None, "Server thread")
+
+# Death messages start with the player's name followed by one of these.
+JAVA_DEATH_PHRASES = (
+    " was ", " drowned", " died", " fell ", " blew up", " burned",
+    " hit the ground", " starved", " suffocated", " froze", " withered",
+    " went ", " walked into", " tried to swim", " experienced kinetic",
+    " discovered the floor", " didn't want to live", " left the confines",
+)
+
+
+class ConsoleEvent():
+    """A recognised line of server output."""
+    __slots__ = ("time", "level", "source", "message")
+
+    def __init__(
+        self,
+        time: str,
+        level: str,
+        source: str | None,
+        message: str,
+    ) -> None:
+        self.time = time
+        self.level = level
+        self.source = source
+        self.message = message
+
+    def __repr__(self) -> str:
+        fields = ", ".join(
+            f"{i}={getattr(self, i)!r}"
+            for cls in type(self).__mro__
+            for i in getattr(cls, "__slots__", ())
+        )
+        return f"{type(self).__name__}({fields})"
+
+
+class PlayerJoin(ConsoleEvent):
+    __slots__ = ("player", "player_id")
+
+    def __init__(self, *args, player: str, player_id: str | None) -> None:
+        super().__init__(*args)
+        self.player = player
+        self.player_id = player_id
+
+
+class PlayerLeave(ConsoleEvent):
+    __slots__ = ("player", "player_id")
+
+    def __init__(self, *args, player: str, player_id: str | None) -> None:
+        super().__init__(*args)
+        self.player = player
+        self.player_id = player_id
+
+
+class ChatMessage(ConsoleEvent):
+    __slots__ = ("player", "text")
+
+    def __init__(self, *args, player: str, text: str) -> None:
+        super().__init__(*args)
+        self.player = player
+        self.text = text
+
+
+class PlayerDeath(ConsoleEvent):
+    __slots__ = ("player",)
+
+    def __init__(self, *args, player: str) -> None:
+        super().__init__(*args)
+        self.player = player
+
+
+class Advancement(ConsoleEvent):
+    __slots__ = ("player", "advancement")
+
+    def __init__(self, *args, player: str, advancement: str) -> None:
+        super().__init__(*args)
+        self.player = player
+        self.advancement = advancement
+
+
+class LagWarning(ConsoleEvent):
+    __slots__ = ("ms_behind", "ticks_behind")
+
+    def __init__(self, *args, ms_behind: int, ticks_behind: int) -> None:
+        super().__init__(*args)
+        self.ms_behind = ms_behind
+        self.ticks_behind = ticks_behind
+
+
+class ServerStarted(ConsoleEvent):
+    __slots__ = ("startup_seconds",)
+
+    def __init__(self, *args, startup_seconds: float | None) -> None:
+        super().__init__(*args)
+        self.startup_seconds = startup_seconds
+
+
+class ConsoleParser():
+    """
+    Turn raw lines of server output into `ConsoleEvent` objects.
+    Lines not starting with a log prefix's first character are rejected
+    before any regex runs, and
+    message bodies are only matched against patterns whose literal text
+    they contain. Keeps track of online players to spot death messages.
+    """
+    def __init__(self, server_type: str) -> None:
+        self.server_type = server_type
+        if server_type == "bedrock":
+            self._prefix = BEDROCK_PREFIX
+            self._parse_body = self._parse_bedrock
+        else:
+            self._prefix = JAVA_PREFIX
+            self._parse_body = self._parse_java
+        self.online_players = set()
+        self._player_ids = {}
+
+    @property
+    def log_prefix(self) -> re.Pattern:
+        """Pattern matching the prefix of this server type's log lines."""
+        return self._prefix
+
+    def strip_prefix(self, line: bytes) -> bytes:
+        """Remove the log prefix and line ending from a line of output."""
+        match = self._prefix.match(line)
+        if match is not None:
+            line = line[match.end():]
+        return line.rstrip(b"\r\n")
+
+    def parse(self, line: bytes) -> ConsoleEvent | None:
+        """Parse a line of output, returning None if it isn't recognised."""
+        if not line or line[0] not in b"[N":
+            return None
+        match = self._prefix.match(line)
+        if match is None:
+            return None
+        if self.server_type == "bedrock":
+            time, level = match.groups()
+            source = None
+        else:
+            time, paper_level, source, level = match.groups()
+            level = level or paper_level
+            source = source.decode(errors="replace") if source else None
+        header = (time.decode(), level.decode(), source)
+        body = line[match.end():].rstrip(b"\r\n")
+        return self._parse_body(header, body)
+
+    def _parse_bedrock(self, header: tuple, body: bytes) -> ConsoleEvent:
+        message = body.decode(errors="replace")
+        if body.startswith(b"Player connected: "):
+            match = BEDROCK_CONNECTED.match(body)
+            if match:
+                player = match.group(1).decode(errors="replace")
+                player_id = match.group(2).decode() or None
+                self.online_players.add(player)
+                return PlayerJoin(
+                    *header, message, player=player, player_id=player_id
+                )
+        elif body.startswith(b"Player disconnected: "):
+            match = BEDROCK_DISCONNECTED.match(body)
+            if match:
+                player = match.group(1).decode(errors="replace")
+                player_id = match.group(2).decode() or None
+                self.online_players.discard(player)
+                return PlayerLeave(
+                    *header, message, player=player, player_id=player_id
+                )
+        elif body.startswith(b"Server started."):
+            self.online_players.clear()
+            return ServerStarted(*header, message, startup_seconds=None)
+        return ConsoleEvent(*header, message)
+
+    @staticmethod
+    def _is_player(header: tuple, name: str) -> bool:
+        """Whether a Java line about a player came from the server."""
+        return (
+            header[2] in JAVA_SERVER_THREADS
+            and JAVA_PLAYER_NAME.fullmatch(name) is not None
+        )
+
+    def _parse_java(self, header: tuple, body: bytes) -> ConsoleEvent:
+        message = body.decode(errors="replace")
+        # Check chat first, players can type anything.
+        if body.startswith(b"<") or body.startswith(b"[Not Secure] <"):
+            match = JAVA_CHAT.match(body)
+            if match:
+                return ChatMessage(
+                    *header,
+                    message,
+                    player=match.group(1).decode(errors="replace"),
+                    text=match.group(2).decode(errors="replace"),
+                )
+        elif (
+            body.endswith(b" joined the game")
+            and self._is_player(header, message[:-len(" joined the game")])
+        ):
+            player = message[:-len(" joined the game")]
+            self.online_players.add(player)
+            return PlayerJoin(
+                *header,
+                message,
+                player=player,
+                player_id=self._player_ids.get(player),
+            )
+        elif (
+            body.endswith(b" left the game")
+            and self._is_player(header, message[:-len(" left the game")])
+        ):
+            player = message[:-len(" left the game")]
+            self.online_players.discard(player)
+            return PlayerLeave(
+                *header,
+                message,
+                player=player,
+                player_id=self._player_ids.pop(player, None),
+            )
+        elif body.startswith(b"UUID of player "):
+            match = JAVA_UUID.match(body)
+            if match:
+                player = match.group(1).decode(errors="replace")
+                self._player_ids[player] = match.group(2).decode()
+        elif b" has " in body and b" [" in body:
+            match = JAVA_ADVANCEMENT.match(body)
+            if match:
+                return Advancement(
+                    *header,
+                    message,
+                    player=match.group(1).decode(errors="replace"),
+                    advancement=match.group(2).decode(errors="replace"),
+                )
+        elif body.startswith(b"Can't keep up!"):
+            match = JAVA_LAG.search(body)
+            if match:
+                return LagWarning(
+                    *header,
+                    message,
+                    ms_behind=int(match.group(1)),
+                    ticks_behind=int(match.group(2)),
+                )
+        elif body.startswith(b"Done ("):
+            match = JAVA_DONE.match(body)
+            self.online_players.clear()
+            return ServerStarted(
+                *header,
+                message,
+                startup_seconds=float(match.group(1)) if match else None,
+            )
+        player = message.partition(" ")[0]
+        if (
+            player in self.online_players
+            and message[len(player):].startswith(JAVA_DEATH_PHRASES)
+        ):
+            return PlayerDeath(*header, message, player=player)
+        return ConsoleEvent(*header, message)
@@ -0,0 +1,121 @@
+from __future__ import annotations
+import json
+import logging
+from pathlib import Path
+
+import discord
+
+from craftlink.constants import DEFAULT_PERMISSION_TIER, PERMISSION_TIERS
+from craftlink.files import FILE_IO
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Rank of each tier, higher is more privileged.
+TIER_RANKS = {tier: rank for rank, tier in enumerate(PERMISSION_TIERS)}
+
+
+def tier_allows(tier: str, required_tier: str) -> bool:
+    """Whether a tier may use commands needing `required_tier`."""
+    return TIER_RANKS[tier] >= TIER_RANKS[required_tier]
+
+
+class PermissionIndex():
+    """
+    Command tiers of Discord members, from a JSON file mapping role IDs to
+    tiers, shaped like: `{"default": "user", "roles": {"1234": "admin"}}`
+    A member gets the highest tier of their roles, or the default tier if
+    none are mapped. Guild owners and members with the Administrator
+    permission are always admins, so the bot can't be locked out of.
+    Members' tiers are cached, and the bot drops or refreshes them as
+    roles change, so checks only use the member objects Discord sends.
+    """
+    def __init__(self, permissions_file: Path) -> None:
+        self.permissions_file = permissions_file
+        self.default_tier = DEFAULT_PERMISSION_TIER
+        # Tiers by role ID.
+        self.roles = {}
+        # Effective tiers by guild and member ID.
+        self.members = {}
+
+    async def load(self) -> None:
+        """Load the role mappings, if saved."""
+        try:
+            text = await FILE_IO.read_text(self.permissions_file)
+        except FileNotFoundError:
+            LOGGER.info(
+                f"No {self.permissions_file}, members have the"
+                f" {self.default_tier} tier unless Discord admins."
+            )
+            return
+        permissions = json.loads(text)
+        default_tier = permissions.get("default", DEFAULT_PERMISSION_TIER)
+        roles = {int(k): v for k, v in permissions.get("roles", {}).items()}
+        invalid = {default_tier, *roles.values()} - set(PERMISSION_TIERS)
+        if invalid:
+            raise ValueError(
+                f"Unknown permission tiers in {self.permissions_file}:"
+                f" {', '.join(sorted(invalid))}."
+            )
+        self.default_tier = default_tier
+        self.roles = roles
+        self.members.clear()
+
+    async def save(self) -> None:
+        permissions = {
+            "default": self.default_tier,
+            "roles": {str(k): v for k, v in sorted(self.roles.items())},
+        }
+        await FILE_IO.write_text(
+            self.permissions_file, json.dumps(permissions, indent=4) + "\n"
+        )
+
+    def tier_of(self, member: discord.Member | discord.User) -> str:
+        """A member's tier, from the cache if known."""
+        guild = getattr(member, "guild", None)
+        if guild is None:
+            # Not a member of a guild, e.g. in a direct message.
+            return "none"
+        key = (guild.id, member.id)
+        tier = self.members.get(key)
+        if tier is None:
+            tier = self._resolve(member)
+            self.members[key] = tier
+        return tier
+
+    def _resolve(self, member: discord.Member) -> str:
+        if (
+            member.id == member.guild.owner_id
+            or member.guild_permissions.administrator
+        ):
+            return "admin"
+        tiers = [self.roles[i.id] for i in member.roles if i.id in self.roles]
+        if not tiers:
+            return self.default_tier
+        return max(tiers, key=TIER_RANKS.__getitem__)
+
+    def refresh_member(self, member: discord.Member) -> None:
+        """Work out a member's tier again, e.g. after their roles change."""
+        self.members[(member.guild.id, member.id)] = self._resolve(member)
+
+    def forget_member(self, guild_id: int, member_id: int) -> None:
+        self.members.pop((guild_id, member_id), None)
+
+    def forget_guild(self, guild_id: int) -> None:
+        """Drop a guild's cached tiers, e.g. after a role changes."""
+        for key in [i for i in self.members if i[0] == guild_id]:
+            del self.members[key]
+
+    async def set_role(self, role_id: int, tier: str | None) -> None:
+        """Map a role to a tier, or remove its mapping if None, and save."""
+        if tier is None:
+            self.roles.pop(role_id, None)
+        else:
+            self.roles[role_id] = tier
+        self.members.clear()
+        await self.save()
+
+    async def set_default(self, tier: str) -> None:
+        self.default_tier = tier
+        self.members.clear()
+        await self.save()
@@ -0,0 +1,192 @@
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import re
+import time
+from pathlib import Path
+
+from craftlink.files import FILE_IO
+from craftlink.parser import (
+    ConsoleEvent,
+    PlayerJoin,
+    PlayerLeave,
+    ServerStarted,
+)
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Reply to `list`, from Java then Bedrock, which lists the players on the
+# next line.
+PLAYER_LIST = re.compile(
+    r"There are (\d+)(?: of a max of |/)\d+ players online:(.*)", re.DOTALL
+)
+
+
+class PlayerRecord():
+    """Totals over a player's finished sessions."""
+    __slots__ = (
+        "player_id", "sessions", "playtime", "first_seen", "last_seen"
+    )
+
+    def __init__(
+        self,
+        player_id: str | None = None,
+        sessions: int = 0,
+        playtime: float = 0.0,
+        first_seen: float | None = None,
+        last_seen: float | None = None,
+    ) -> None:
+        self.player_id = player_id
+        self.sessions = sessions
+        self.playtime = playtime
+        self.first_seen = first_seen
+        self.last_seen = last_seen
+
+
+class PresenceIndex():
+    """
+    Who's online and who has played, kept up to date from join and leave
+    events in the server's output rather than by asking the server.
+    Finished sessions are added to each player's record, and the records
+    are saved as a compact JSON file, written at most every `write_delay`
+    seconds.
+    """
+    def __init__(self, history_file: Path, write_delay: float) -> None:
+        self.history_file = history_file
+        self.write_delay = write_delay
+        # Online players' IDs and join times, by name.
+        self.online = {}
+        self.players = {}
+        self._dirty = False
+        self._flush_task = None
+
+    async def load(self) -> None:
+        """Load the saved player records, if any."""
+        try:
+            records = json.loads(await FILE_IO.read_text(self.history_file))
+        except FileNotFoundError:
+            return
+        for name, fields in records.items():
+            # Keep anything recorded since starting up.
+            if name not in self.players:
+                self.players[name] = PlayerRecord(*fields)
+
+    def handle_event(self, event: ConsoleEvent) -> None:
+        if isinstance(event, PlayerJoin):
+            self.online[event.player] = (event.player_id, time.time())
+        elif isinstance(event, PlayerLeave):
+            self._end_session(event.player, time.time())
+        elif isinstance(event, ServerStarted):
+            # Anyone still listed missed their leave, e.g. after a crash.
+            self.end_sessions()
+
+    def sync(self, players: list[str]) -> None:
+        """
+        Match who's online to the server's player list, e.g. after
+        attaching to a running server. Players found online are counted
+        from now, their join wasn't seen.
+        """
+        now = time.time()
+        for player in set(self.online) - set(players):
+            self._end_session(player, now)
+        for player in players:
+            if player not in self.online:
+                record = self.players.get(player)
+                player_id = record.player_id if record else None
+                self.online[player] = (player_id, now)
+
+    def end_sessions(self) -> None:
+        """End all online players' sessions, e.g. as the server exits."""
+        now = time.time()
+        for player in list(self.online):
+            self._end_session(player, now)
+
+    def _end_session(self, player: str, now: float) -> None:
+        session = self.online.pop(player, None)
+        if session is None:
+            return
+        player_id, joined = session
+        record = self.players.get(player)
+        if record is None:
+            record = self.players[player] = PlayerRecord(first_seen=joined)
+        record.player_id = player_id or record.player_id
+        record.sessions += 1
+        record.playtime += now - joined
+        record.last_seen = now
+        self._dirty = True
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    def find(self, player: str) -> str | None:
+        """Find a known player's name, ignoring case."""
+        if player in self.online or player in self.players:
+            return player
+        lowered = player.lower()
+        for name in (*self.online, *self.players):
+            if name.lower() == lowered:
+                return name
+        return None
+
+    def playtime(self, player: str, now: float) -> float:
+        """Total playtime, including any current session."""
+        record = self.players.get(player)
+        playtime = record.playtime if record else 0.0
+        if player in self.online:
+            playtime += now - self.online[player][1]
+        return playtime
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.write_delay)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Write the player records to disk if they changed."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if not self._dirty:
+            return
+        records = {
+            name: [getattr(record, i) for i in PlayerRecord.__slots__]
+            for name, record in self.players.items()
+        }
+        self._dirty = False
+        try:
+            await FILE_IO.write_text(
+                self.history_file, json.dumps(records, separators=(",", ":"))
+            )
+        except BaseException:
+            self._dirty = True
+            raise
+
+
+def parse_player_list(reply: str) -> list[str] | None:
+    """
+    Player names from the reply to `list`, e.g. "There are 2 of a max of
+    20 players online: Steve, Alex", or None if it isn't one.
+    """
+    match = PLAYER_LIST.search(reply)
+    if match is None:
+        return None
+    count = int(match.group(1))
+    if not count:
+        return []
+    players = [i.strip() for i in match.group(2).split(",") if i.strip()]
+    # Anything else, e.g. other output captured with it, can't be trusted.
+    return players if len(players) == count else None
+
+
+def format_duration(seconds: float) -> str:
+    """Format a duration to its two largest units, e.g. "2d 3h"."""
+    seconds = int(seconds)
+    parts = []
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60), ("s", 1)):
+        if seconds >= size or (unit == "s" and not parts):
+            parts.append(f"{seconds // size}{unit}")
+            seconds %= size
+        if len(parts) == 2:
+            break
+    return " ".join(parts)
@@ -0,0 +1,148 @@
+from __future__ import annotations
+import logging
+from pathlib import Path
+
+from craftlink.constants import SERVER_PROPERTY_TYPES
+from craftlink.files import FILE_IO, atomic_write_text, file_stamp
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ServerProperties():
+    """
+    Cached, comment preserving model of a server.properties file.
+    The file is kept as its original lines plus an index of key to line
+    number, so edits replace only the lines of the changed keys and
+    everything else is written back untouched. The file is only re-read if
+    its modification time changes. File access goes through `FILE_IO`, call
+    `refresh` before reading properties to pick up changes made on disk.
+    """
+    def __init__(self, properties_file: Path, server_type: str) -> None:
+        self.properties_file = properties_file
+        self.property_types = SERVER_PROPERTY_TYPES[server_type]
+        self._lines = []
+        self._index = {}
+        self._newline = "\n"
+        self._file_stamp = None
+
+    def load(self) -> None:
+        """Read the file, blocking, for use before the event loop runs."""
+        self._apply(_read_properties(self.properties_file, self._file_stamp))
+
+    async def refresh(self) -> None:
+        """Reload the file if it changed on disk since it was last read."""
+        self._apply(await FILE_IO.run(
+            self.properties_file,
+            _read_properties,
+            self.properties_file,
+            self._file_stamp,
+        ))
+
+    def _apply(self, parsed: tuple | None) -> None:
+        if parsed is not None:
+            self._file_stamp, self._newline, self._lines, self._index = parsed
+
+    @property
+    def keys(self) -> list[str]:
+        return list(self._index)
+
+    def get(self, key: str) -> str | None:
+        """Get a property's value, or None if it isn't set."""
+        line_number = self._index.get(key)
+        if line_number is None:
+            return None
+        return self._lines[line_number].partition("=")[2]
+
+    def validate(self, key: str, value: str) -> str | None:
+        """Return why a value is invalid for a property, or None if valid."""
+        property_type = self.property_types.get(key)
+        if property_type is None:
+            if key not in self._index:
+                return f"Unknown property *\"{key}\"*."
+        elif property_type == "bool":
+            if value not in ("true", "false"):
+                return f"*\"{key}\"* must be true or false."
+        elif property_type == "int":
+            try:
+                int(value)
+            except ValueError:
+                return f"*\"{key}\"* must be a whole number."
+        elif property_type != "str" and value not in property_type:
+            return f"*\"{key}\"* must be one of {', '.join(property_type)}."
+        if "\n" in value or "\r" in value:
+            return f"*\"{key}\"* cannot contain line breaks."
+        return None
+
+    async def set_many(self, changes: dict[str, str]) -> list[str]:
+        """
+        Validate and apply property changes, writing the file once.
+        Returns a list of errors, in which case nothing is changed.
+        """
+        await self.refresh()
+        errors = [
+            i for i in (self.validate(k, v) for k, v in changes.items()) if i
+        ]
+        if errors:
+            return errors
+        changed = False
+        for key, value in changes.items():
+            line = f"{key}={value}"
+            line_number = self._index.get(key)
+            if line_number is None:
+                self._index[key] = len(self._lines)
+                self._lines.append(line)
+                changed = True
+            elif self._lines[line_number] != line:
+                self._lines[line_number] = line
+                changed = True
+        if changed:
+            text = self._newline.join(self._lines) + self._newline
+            async with FILE_IO.lock(self.properties_file):
+                await FILE_IO.run_unlocked(
+                    self.properties_file,
+                    atomic_write_text,
+                    self.properties_file,
+                    text,
+                )
+                self._file_stamp = await FILE_IO.run_unlocked(
+                    self.properties_file, file_stamp, self.properties_file
+                )
+            LOGGER.info(f"Updated server properties: {', '.join(changes)}.")
+        return []
+
+
+def _read_properties(
+    properties_file: Path,
+    known_stamp: tuple[int, int] | None,
+) -> tuple | None:
+    """
+    Read and index a properties file, returning its stamp, newline, lines
+    and key to line number index, or None if its stamp is `known_stamp`.
+    """
+    stamp = file_stamp(properties_file)
+    if stamp == known_stamp:
+        return None
+    if stamp is None:
+        raise FileNotFoundError(f"Cannot find {properties_file.absolute()}.")
+    with properties_file.open(encoding="utf-8", newline="") as file:
+        text = file.read()
+    newline = "\r\n" if "\r\n" in text else "\n"
+    lines = text.splitlines()
+    index = {}
+    for line_number, line in enumerate(lines):
+        key = _parse_key(line)
+        if key is not None:
+            index[key] = line_number
+    return stamp, newline, lines, index
+
+
+def _parse_key(line: str) -> str | None:
+    """Get the key of a property line, or None for comments and blanks."""
+    stripped = line.strip()
+    if not stripped or stripped[0] in "#!":
+        return None
+    key, separator, _ = line.partition("=")
+    if not separator:
+        return None
+    return key.strip()
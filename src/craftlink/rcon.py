@@ -0,0 +1,166 @@
+from __future__ import annotations
+import asyncio
+import itertools
+import logging
+import struct
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Packet types, see https://wiki.vg/RCON.
+SERVERDATA_RESPONSE_VALUE = 0
+SERVERDATA_EXECCOMMAND = 2
+SERVERDATA_AUTH = 3
+# Java servers split responses into packets with payloads of this size.
+MAX_RESPONSE_FRAGMENT = 4096
+
+
+class RconError(Exception):
+    """Raised when the RCON connection fails or authentication is refused."""
+
+
+def encode_packet(request_id: int, packet_type: int, payload: str) -> bytes:
+    body = struct.pack("<ii", request_id, packet_type)
+    body += payload.encode("utf-8") + b"\x00\x00"
+    return struct.pack("<i", len(body)) + body
+
+
+async def read_packet(reader: asyncio.StreamReader) -> tuple[int, int, bytes]:
+    """Read a packet, returning its request ID, type and payload."""
+    (length,) = struct.unpack("<i", await reader.readexactly(4))
+    body = await reader.readexactly(length)
+    request_id, packet_type = struct.unpack("<ii", body[:8])
+    return request_id, packet_type, body[8:-2]
+
+
+class RconClient():
+    """
+    Async RCON client for Java servers, keeping one authenticated
+    connection open and reconnecting if it drops. Several commands can be
+    in flight at once, replies are matched to them by request ID.
+    """
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        password: str,
+        timeout: float = 5.0,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self._request_ids = itertools.count(1)
+        self._connect_lock = asyncio.Lock()
+        self._reader = None
+        self._writer = None
+        self._read_task = None
+        # Futures awaiting replies and reply fragments, by request ID.
+        self._pending = {}
+        self._fragments = {}
+
+    @property
+    def connected(self) -> bool:
+        return self._read_task is not None and not self._read_task.done()
+
+    async def connect(self) -> None:
+        """Connect and authenticate, unless already connected."""
+        async with self._connect_lock:
+            if self.connected:
+                return
+            await self._close_connection()
+            try:
+                self._reader, self._writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port),
+                    self.timeout,
+                )
+                request_id = next(self._request_ids)
+                self._writer.write(
+                    encode_packet(request_id, SERVERDATA_AUTH, self.password)
+                )
+                await self._writer.drain()
+                # Skip anything before the auth reply, some servers first
+                # send an empty response value.
+                while True:
+                    reply_id, packet_type, _ = await asyncio.wait_for(
+                        read_packet(self._reader), self.timeout
+                    )
+                    if packet_type != SERVERDATA_RESPONSE_VALUE:
+                        break
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                await self._close_connection()
+                raise RconError(
+                    f"Could not connect to RCON at {self.host}:{self.port}."
+                )
+            if reply_id == -1:
+                await self._close_connection()
+                raise RconError("RCON authentication failed.")
+            self._read_task = asyncio.create_task(self._read_replies())
+            LOGGER.info(f"Connected to RCON at {self.host}:{self.port}.")
+
+    async def command(self, command: str) -> str:
+        """
+        Run a command, reconnecting first if the connection dropped. Once
+        written a command isn't sent again if the connection drops, it may
+        already have run.
+        """
+        await self.connect()
+        request_id = next(self._request_ids)
+        reply = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = reply
+        try:
+            self._writer.write(
+                encode_packet(request_id, SERVERDATA_EXECCOMMAND, command)
+            )
+            await self._writer.drain()
+            return await asyncio.wait_for(reply, self.timeout)
+        except ConnectionError:
+            await self._close_connection()
+            raise RconError(f"RCON connection lost running: {command}")
+        except asyncio.TimeoutError:
+            raise RconError(f"RCON command timed out: {command}")
+        finally:
+            self._pending.pop(request_id, None)
+            self._fragments.pop(request_id, None)
+
+    async def close(self) -> None:
+        async with self._connect_lock:
+            await self._close_connection()
+
+    async def _read_replies(self) -> None:
+        try:
+            while True:
+                request_id, _, payload = await read_packet(self._reader)
+                reply = self._pending.get(request_id)
+                if reply is None or reply.done():
+                    continue
+                fragments = self._fragments.setdefault(request_id, [])
+                fragments.append(payload)
+                # A full fragment means more of the reply is coming.
+                if len(payload) < MAX_RESPONSE_FRAGMENT:
+                    reply.set_result(
+                        b"".join(fragments).decode(errors="replace")
+                    )
+        except (ConnectionError, asyncio.IncompleteReadError):
+            LOGGER.warning("RCON connection closed.")
+        finally:
+            for reply in self._pending.values():
+                if not reply.done():
+                    reply.set_exception(RconError("RCON connection closed."))
+
+    async def _close_connection(self) -> None:
+        if self._read_task is not None:
+            self._read_task.cancel()
+            try:
+                await self._read_task
+            except asyncio.CancelledError:
+                pass
+            self._read_task = None
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+            self._writer = None
+            self._reader = None
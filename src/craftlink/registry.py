@@ -0,0 +1,52 @@
+from __future__ import annotations
+import logging
+
+from craftlink.constants import (
+    ADMIN_COMMANDS,
+    SERVER_COMMAND_NAMES,
+    SERVER_COMMAND_TIER,
+    SERVER_COMMAND_TIERS,
+)
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CommandRegistry():
+    """
+    The commands accepted for one type of server: administrative commands,
+    handled by the bot, and commands passed on to the server. Built once
+    per server type, see `COMMAND_REGISTRIES`.
+    """
+    def __init__(self, server_type: str) -> None:
+        self.server_type = server_type
+        self.admin_commands = {
+            name: info
+            for name, info in ADMIN_COMMANDS.items()
+            if server_type in info.get("server_types", (server_type,))
+        }
+        self.server_commands = frozenset(SERVER_COMMAND_NAMES[server_type])
+        # Tier needed for each command, see `PERMISSION_TIERS`.
+        self.tiers = {
+            name: SERVER_COMMAND_TIERS.get(name, SERVER_COMMAND_TIER)
+            for name in self.server_commands
+        }
+        self.tiers.update(
+            (name, info["tier"]) for name, info in self.admin_commands.items()
+        )
+
+    def __contains__(self, command_name: str) -> bool:
+        return (
+            command_name in self.admin_commands
+            or command_name in self.server_commands
+        )
+
+    def required_tier(self, command_name: str) -> str:
+        """
+        Tier needed to use a command. Unknown commands are rejected when
+        dispatched, anyone may be told so.
+        """
+        return self.tiers.get(command_name, "none")
+
+
+COMMAND_REGISTRIES = {i: CommandRegistry(i) for i in SERVER_COMMAND_NAMES}
@@ -0,0 +1,76 @@
+from __future__ import annotations
+import asyncio
+import logging
+import re
+
+from craftlink.constants import COMMAND_RESPONSE_SIGNATURES
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def compile_signatures(server_type: str) -> dict[str, tuple[re.Pattern, int]]:
+    """
+    Compile the response signatures for a server type, mapping each command
+    name to a pattern for its reply lines and the most lines it replies with.
+    Every pattern also matches the server's generic command errors.
+    """
+    signatures = COMMAND_RESPONSE_SIGNATURES[server_type]
+    error_pattern = signatures["_error"][0]
+    return {
+        command_name: (
+            re.compile(f"(?:{pattern})|(?:{error_pattern})".encode()),
+            max_lines,
+        )
+        for command_name, (pattern, max_lines) in signatures.items()
+        if command_name != "_error"
+    }
+
+
+class ResponseCapture():
+    """
+    Collects the reply to a server command from its output stream.
+    The reply starts at the first line matching the command's signature,
+    and continues with lines that match it too, or that have no log prefix,
+    up to the signature's line limit.
+    """
+    def __init__(
+        self,
+        signature: re.Pattern,
+        max_lines: int,
+        log_prefix: re.Pattern,
+    ) -> None:
+        self.signature = signature
+        self.max_lines = max_lines
+        self.log_prefix = log_prefix
+        self.lines = []
+        self.started = asyncio.Event()
+        self.finished = asyncio.Event()
+
+    def offer(self, line: bytes) -> bool:
+        """Take a line if it's part of the reply, returning whether it was."""
+        if self.finished.is_set():
+            return False
+        if self.signature.search(line) is None and (
+            not self.lines or self.log_prefix.match(line) is not None
+        ):
+            return False
+        self.lines.append(line)
+        self.started.set()
+        if len(self.lines) >= self.max_lines:
+            self.finished.set()
+        return True
+
+    async def wait(self, timeout: float, settle_time: float) -> list[bytes]:
+        """
+        Wait up to `timeout` for the reply to start, then up to `settle_time`
+        for the rest of it. Returns the lines captured, if any.
+        """
+        try:
+            await asyncio.wait_for(self.started.wait(), timeout)
+            await asyncio.wait_for(self.finished.wait(), settle_time)
+        except asyncio.TimeoutError:
+            pass
+        # Stop taking lines, anything later is relayed as usual.
+        self.finished.set()
+        return self.lines
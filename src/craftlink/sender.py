@@ -0,0 +1,400 @@
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Callable
+
+import discord
+
+from craftlink.attachments import Attachment, fit_attachment
+from craftlink.constants import (
+    CHANNEL_RATE_LIMIT,
+    DISCORD_EMBED_LIMIT,
+    DISCORD_MESSAGE_LIMIT,
+    MAX_PENDING_CHARS,
+    MAX_SPLIT_MESSAGES,
+    SESSION_LOG_SEGMENT_CHARS,
+)
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Code block fences wrapped around embed descriptions.
+CODE_FENCE = "```"
+
+
+def split_lines(text: str, limit: int) -> list[str]:
+    """
+    Split text into as few chunks of at most `limit` characters as possible,
+    breaking on line boundaries. Lines longer than the limit are cut up.
+    """
+    chunks = []
+    current = []
+    current_size = 0
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if current:
+                chunks.append("\n".join(current))
+                current = []
+                current_size = 0
+            chunks.append(line[:limit])
+            line = line[limit:]
+        # Account for the newline joining this line to the previous one.
+        line_size = len(line) + (1 if current else 0)
+        if current and current_size + line_size > limit:
+            chunks.append("\n".join(current))
+            current = []
+            current_size = 0
+            line_size = len(line)
+        current.append(line)
+        current_size += line_size
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+class RateLimitBucket():
+    """Token bucket mirroring Discord's per-channel message rate limit."""
+    def __init__(self, capacity: int, period: float) -> None:
+        self.capacity = capacity
+        self.period = period
+        self.tokens = float(capacity)
+        self.updated = asyncio.get_running_loop().time()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated
+        self.tokens = min(
+            self.capacity,
+            self.tokens + elapsed * self.capacity / self.period,
+        )
+        self.updated = now
+
+    async def acquire(self) -> None:
+        """Wait until a message can be sent without being rate limited."""
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            missing = 1 - self.tokens
+            await asyncio.sleep(missing * self.period / self.capacity)
+
+    def block(self, retry_after: float) -> None:
+        """Hold off all sends after Discord reported a rate limit."""
+        now = asyncio.get_running_loop().time()
+        self.tokens = 0.0
+        self.updated = now
+        self.blocked_until = max(self.blocked_until, now + retry_after)
+
+
+class _Post():
+    """A message sent or edited on its own, returning the sent message."""
+    def __init__(self, text: str, message: discord.Message | None) -> None:
+        self.text = text
+        # The message to edit, or None to send a new one.
+        self.message = message
+        self.sent = asyncio.get_running_loop().create_future()
+
+
+class _Outbox():
+    """Pending messages for a single channel."""
+    def __init__(self, channel: discord.abc.Messageable) -> None:
+        self.channel = channel
+        self.bucket = RateLimitBucket(*CHANNEL_RATE_LIMIT)
+        self.pending = deque()
+        self.pending_size = 0
+        self.ready = asyncio.Event()
+        self.has_space = asyncio.Event()
+        self.has_space.set()
+        self.task = None
+        # Console output too large for messages, uploaded as a file per
+        # segment, each re-uploaded as it fills.
+        self.session_log = []
+        self.session_log_size = 0
+        self.session_segment = 1
+        self.session_message = None
+
+
+class MessageSender():
+    """
+    Outbound dispatcher for all Discord messages.
+    Messages are queued per channel and sent by a worker that waits on the
+    channel's rate limit bucket. Whatever piles up while waiting is merged
+    and split on line boundaries to fill each payload, falling back to an
+    attachment when that would take more than `MAX_SPLIT_MESSAGES` sends.
+    Console output that overflows like this is added to a session log,
+    uploaded in segments of `SESSION_LOG_SEGMENT_CHARS`. The latest segment
+    is re-uploaded in place of its previous copy as it fills, so each upload
+    stays small however long the log grows.
+    Posts, e.g. job progress, are sent or edited on their own, and take
+    their turn in the queue and the rate limit like any other message.
+    """
+    def __init__(
+        self,
+        on_delivered: Callable[[int, float], None] | None = None,
+    ) -> None:
+        self.outboxes = {}
+        # Called with the channel ID and seconds since the text was created.
+        self.on_delivered = on_delivered
+
+    def _get_outbox(self, channel: discord.abc.Messageable) -> _Outbox:
+        outbox = self.outboxes.get(channel.id)
+        if outbox is None:
+            outbox = _Outbox(channel)
+            outbox.task = asyncio.create_task(self._process_outbox(outbox))
+            self.outboxes[channel.id] = outbox
+        return outbox
+
+    async def send(
+        self,
+        channel: discord.abc.Messageable,
+        text: str,
+        footer: str | None = None,
+        created_at: float | None = None,
+    ) -> None:
+        """
+        Queue text to be sent to a channel. Text with a footer is sent as
+        a code block embed, otherwise as plain messages. Waits while the
+        channel already has `MAX_PENDING_CHARS` waiting to be sent.
+        If given, `created_at` (from `time.monotonic`) is used to report the
+        delivery latency to `on_delivered`.
+        """
+        if not text:
+            return
+        await self._enqueue(channel, footer, text, len(text), created_at)
+
+    async def send_file(
+        self,
+        channel: discord.abc.Messageable,
+        attachment: Attachment,
+    ) -> None:
+        """Queue a file to be uploaded to a channel."""
+        size = sum(len(i) for i in attachment.pieces)
+        await self._enqueue(channel, None, attachment, size, None)
+
+    async def post(
+        self,
+        channel: discord.abc.Messageable,
+        text: str,
+        message: discord.Message | None = None,
+    ) -> discord.Message | None:
+        """
+        Send text as a message of its own, or edit it into `message`, in
+        turn with the channel's other messages. Waits until it's sent and
+        returns the message, or None if it couldn't be sent.
+        """
+        post = _Post(text[:DISCORD_MESSAGE_LIMIT], message)
+        await self._enqueue(channel, None, post, len(post.text), None)
+        return await post.sent
+
+    async def _enqueue(
+        self,
+        channel: discord.abc.Messageable,
+        footer: str | None,
+        item: str | Attachment,
+        size: int,
+        created_at: float | None,
+    ) -> None:
+        outbox = self._get_outbox(channel)
+        await outbox.has_space.wait()
+        outbox.pending.append((footer, item, created_at))
+        outbox.pending_size += size
+        if outbox.pending_size >= MAX_PENDING_CHARS:
+            outbox.has_space.clear()
+        outbox.ready.set()
+
+    async def close(self) -> None:
+        """Stop all channel workers, dropping anything still pending."""
+        for outbox in self.outboxes.values():
+            outbox.task.cancel()
+            for _, item, _ in outbox.pending:
+                if isinstance(item, _Post) and not item.sent.done():
+                    item.sent.set_result(None)
+        await asyncio.gather(
+            *(i.task for i in self.outboxes.values()),
+            return_exceptions=True,
+        )
+        self.outboxes = {}
+
+    async def _process_outbox(self, outbox: _Outbox) -> None:
+        while True:
+            await outbox.ready.wait()
+            # Messages keep accumulating while waiting for the rate limit.
+            await outbox.bucket.acquire()
+            pending = list(outbox.pending)
+            outbox.pending.clear()
+            outbox.pending_size = 0
+            outbox.ready.clear()
+            outbox.has_space.set()
+            try:
+                for index, payload in enumerate(self._coalesce(pending)):
+                    if index:
+                        await outbox.bucket.acquire()
+                    await self._deliver(outbox, payload)
+            except Exception:
+                # Keep the channel's worker going for later messages.
+                LOGGER.exception("Failed to send messages.")
+            finally:
+                # Don't leave anyone waiting on posts that weren't sent.
+                for _, item, _ in pending:
+                    if isinstance(item, _Post) and not item.sent.done():
+                        item.sent.set_result(None)
+
+    def _coalesce(self, pending: list[tuple]) -> list[dict]:
+        """Merge neighbouring messages of the same kind into payloads."""
+        groups = []
+        for footer, item, created_at in pending:
+            if isinstance(item, (Attachment, _Post)):
+                groups.append([footer, item, created_at])
+            elif (
+                groups
+                and groups[-1][0] == footer
+                and isinstance(groups[-1][1], list)
+            ):
+                groups[-1][1].append(item)
+                # Track the oldest text in the group.
+                if groups[-1][2] is None:
+                    groups[-1][2] = created_at
+            else:
+                groups.append([footer, [item], created_at])
+        payloads = []
+        for footer, texts, created_at in groups:
+            group_payloads = self._group_payloads(footer, texts)
+            for payload in group_payloads:
+                payload["created_at"] = created_at
+            payloads.extend(group_payloads)
+        return payloads
+
+    def _group_payloads(
+        self,
+        footer: str | None,
+        texts: list[str] | Attachment | _Post,
+    ) -> list[dict]:
+        """Split a group of messages into the fewest payloads."""
+        if isinstance(texts, Attachment):
+            return [{"attachment": texts}]
+        if isinstance(texts, _Post):
+            return [{"post": texts}]
+        text = "\n".join(texts)
+        if footer is None:
+            chunks = split_lines(text, DISCORD_MESSAGE_LIMIT)
+        else:
+            chunk_limit = DISCORD_EMBED_LIMIT - 2 * len(CODE_FENCE)
+            chunks = split_lines(text, chunk_limit)
+        if len(chunks) <= MAX_SPLIT_MESSAGES:
+            if footer is None:
+                return [{"content": i} for i in chunks]
+            return [{"description": i, "footer": footer} for i in chunks]
+        elif footer is None:
+            pieces = [f"{i}\n" for i in texts]
+            return [{"attachment": Attachment("attachment.txt", pieces)}]
+        return [{"session_log": texts, "footer": footer}]
+
+    @staticmethod
+    def _build_send_kwargs(payload: dict) -> dict:
+        if "post" in payload:
+            return {"content": payload["post"].text}
+        if "content" in payload:
+            return {"content": payload["content"]}
+        embed = discord.Embed(
+            description=f"{CODE_FENCE}{payload['description']}{CODE_FENCE}"
+        )
+        embed.set_footer(text=payload["footer"])
+        return {"embed": embed}
+
+    async def _build_file(
+        self,
+        attachment: Attachment,
+    ) -> discord.File | None:
+        """Encode an attachment off the event loop, it may be large."""
+        loop = asyncio.get_running_loop()
+        encoded = await loop.run_in_executor(
+            None,
+            fit_attachment,
+            attachment.filename,
+            attachment.pieces,
+        )
+        if encoded is None:
+            return None
+        filename, buffer = encoded
+        return discord.File(buffer, filename=filename)
+
+    def _add_to_session_log(self, outbox: _Outbox, texts: list[str]) -> None:
+        """Append to the session log, starting a new segment if full."""
+        pieces = [f"{i}\n" for i in texts]
+        size = sum(len(i) for i in pieces)
+        if (
+            outbox.session_log
+            and outbox.session_log_size + size > SESSION_LOG_SEGMENT_CHARS
+        ):
+            # Leave the full segment's message be and start a new one.
+            outbox.session_log = []
+            outbox.session_log_size = 0
+            outbox.session_segment += 1
+            outbox.session_message = None
+        outbox.session_log.extend(pieces)
+        outbox.session_log_size += size
+
+    async def _deliver(self, outbox: _Outbox, payload: dict) -> None:
+        """Send a payload, retrying after being rate limited."""
+        if "session_log" in payload:
+            self._add_to_session_log(outbox, payload["session_log"])
+            segment = outbox.session_segment
+            attachment = Attachment(
+                f"session-log-{segment}.txt", list(outbox.session_log)
+            )
+            content = f"{payload['footer']} Session log part {segment}."
+        elif "attachment" in payload:
+            attachment = payload["attachment"]
+            content = None
+        else:
+            attachment = None
+        while True:
+            if attachment is None:
+                send_kwargs = self._build_send_kwargs(payload)
+            else:
+                # Files can't be reused, so build a new one on each try.
+                file = await self._build_file(attachment)
+                if file is None:
+                    send_kwargs = {"content": "Output too large to upload."}
+                else:
+                    send_kwargs = {"content": content, "file": file}
+            try:
+                post = payload.get("post")
+                if post is not None and post.message is not None:
+                    message = await post.message.edit(**send_kwargs)
+                else:
+                    message = await outbox.channel.send(**send_kwargs)
+                break
+            except discord.RateLimited as error:
+                retry_after = error.retry_after
+            except discord.HTTPException as error:
+                if error.status != 429:
+                    LOGGER.warning("Failed to send message.", exc_info=True)
+                    return
+                retry_after = 1.0
+            LOGGER.warning(f"Rate limited, retrying in {retry_after:.2f}s.")
+            outbox.bucket.block(retry_after)
+            await outbox.bucket.acquire()
+        created_at = payload.get("created_at")
+        if created_at is not None and self.on_delivered is not None:
+            latency = time.monotonic() - created_at
+            self.on_delivered(outbox.channel.id, latency)
+        if "post" in payload:
+            payload["post"].sent.set_result(message)
+        if "session_log" in payload:
+            # Only keep the latest copy of each segment in the channel.
+            previous_message = outbox.session_message
+            outbox.session_message = message
+            if previous_message is not None:
+                try:
+                    await previous_message.delete()
+                except discord.HTTPException:
+                    LOGGER.warning("Failed to delete old session log.")
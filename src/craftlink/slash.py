@@ -0,0 +1,245 @@
+from __future__ import annotations
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Literal, Optional
+
+import discord
+from discord import app_commands
+
+from craftlink.attachments import Attachment, fit_attachment
+from craftlink.constants import (
+    ADMIN_COMMANDS,
+    DISCORD_MESSAGE_LIMIT,
+    MAX_SPLIT_MESSAGES,
+    SERVER_PROPERTY_TYPES,
+)
+from craftlink.sender import split_lines
+
+if TYPE_CHECKING:
+    from craftlink.bot import CraftBot
+    from craftlink.command import CraftCommander
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Discord's limits on choices offered and on descriptions.
+MAX_CHOICES = 25
+DESCRIPTION_LIMIT = 100
+
+
+def build_command_tree(bot: CraftBot) -> app_commands.CommandTree:
+    """
+    Slash commands for the bot's admin commands and for sending commands to
+    the server, dispatched like prefixed commands to the server bound to
+    the channel they're used in. Player names and property keys are
+    autocompleted. Commands without typed arguments take them as a string.
+    """
+    tree = app_commands.CommandTree(bot)
+
+    def commander_for(
+        interaction: discord.Interaction,
+    ) -> CraftCommander | None:
+        return bot.commanders.get(interaction.channel_id)
+
+    async def player_names(
+        interaction: discord.Interaction,
+        current: str,
+    ) -> list[app_commands.Choice[str]]:
+        commander = commander_for(interaction)
+        if commander is None:
+            return []
+        presence = commander.presence
+        return _choices((*presence.online, *presence.players), current)
+
+    async def property_keys(
+        interaction: discord.Interaction,
+        current: str,
+    ) -> list[app_commands.Choice[str]]:
+        commander = commander_for(interaction)
+        if commander is None:
+            return []
+        await commander.properties.refresh()
+        keys = {
+            *commander.properties.keys,
+            *SERVER_PROPERTY_TYPES[commander.server_type],
+        }
+        return _choices(sorted(keys), current)
+
+    async def logs_query(
+        interaction: discord.Interaction,
+        current: str,
+    ) -> list[app_commands.Choice[str]]:
+        if interaction.namespace.search != "player":
+            return []
+        return await player_names(interaction, current)
+
+    async def server_commands(
+        interaction: discord.Interaction,
+        current: str,
+    ) -> list[app_commands.Choice[str]]:
+        commander = commander_for(interaction)
+        if commander is None or " " in current:
+            return []
+        return _choices(sorted(commander.commands.server_commands), current)
+
+    @tree.command(name="console")
+    @app_commands.describe(command="Command and its arguments, e.g. list.")
+    @app_commands.autocomplete(command=server_commands)
+    async def console(interaction: discord.Interaction, command: str) -> None:
+        """Send a command to the Minecraft server."""
+        await bot.run_slash_command(interaction, command)
+
+    @tree.command(name="seen")
+    @app_commands.autocomplete(player=player_names)
+    async def seen(interaction: discord.Interaction, player: str) -> None:
+        """Show whether a player is online or when they last were."""
+        await bot.run_slash_command(interaction, f"seen {player}")
+
+    @tree.command(name="playtime")
+    @app_commands.autocomplete(player=player_names)
+    async def playtime(
+        interaction: discord.Interaction,
+        player: Optional[str] = None,
+    ) -> None:
+        """Show a player's playtime, or the players who've played most."""
+        await bot.run_slash_command(interaction, f"playtime {player or ''}")
+
+    @tree.command(name="getprop")
+    @app_commands.autocomplete(key=property_keys)
+    async def getprop(interaction: discord.Interaction, key: str) -> None:
+        """Show the value of a server property."""
+        await bot.run_slash_command(interaction, f"getprop {key}")
+
+    @tree.command(name="changeprop")
+    @app_commands.autocomplete(key=property_keys)
+    async def changeprop(
+        interaction: discord.Interaction,
+        key: str,
+        value: str,
+    ) -> None:
+        """Change a server property, restart the server to apply."""
+        # As name and value, the value may contain spaces.
+        await bot.run_slash_command(interaction, f"changeprop {key} {value}")
+
+    @tree.command(name="logs")
+    @app_commands.describe(
+        search="since: a duration, e.g. 10m. grep: a pattern."
+        " player: a player's name.",
+    )
+    @app_commands.autocomplete(query=logs_query)
+    async def logs(
+        interaction: discord.Interaction,
+        search: Literal["since", "grep", "player"],
+        query: str,
+    ) -> None:
+        """Search all server output kept on disk."""
+        await bot.run_slash_command(interaction, f"logs {search} {query}")
+
+    @tree.command(name="listcommands")
+    async def listcommands(
+        interaction: discord.Interaction,
+        category: Optional[Literal["admin", "bedrock", "java"]] = None,
+    ) -> None:
+        """List the commands accepted by this bot."""
+        await bot.run_slash_command(
+            interaction, f"listcommands {category or ''}"
+        )
+
+    @tree.command(name="userrole")
+    @app_commands.describe(
+        role="Role to change, or none for the members without a mapped role.",
+        tier="Tier to give it, or remove to unmap the role.",
+    )
+    async def userrole(
+        interaction: discord.Interaction,
+        role: Optional[discord.Role] = None,
+        tier: Optional[
+            Literal["admin", "mod", "user", "none", "remove"]
+        ] = None,
+    ) -> None:
+        """List or change which Discord roles may use which commands."""
+        if tier is None:
+            command = "userrole"
+        elif role is None:
+            command = f"userrole default {tier}"
+        else:
+            command = f"userrole {role.id} {tier}"
+        await bot.run_slash_command(interaction, command)
+
+    # The rest take their arguments as given with prefixed commands.
+    server_types = {i.server_type for i in bot.commanders.values()}
+    for name, info in ADMIN_COMMANDS.items():
+        if tree.get_command(name) is not None:
+            continue
+        if server_types.isdisjoint(info.get("server_types", server_types)):
+            continue
+        tree.add_command(_text_command(bot, name, info))
+    return tree
+
+
+def _text_command(
+    bot: CraftBot,
+    name: str,
+    info: dict,
+) -> app_commands.Command:
+    """Slash command taking an admin command's arguments as one string."""
+    if info["args"]:
+        @app_commands.describe(arguments=info["args"][:DESCRIPTION_LIMIT])
+        async def callback(
+            interaction: discord.Interaction,
+            arguments: Optional[str] = None,
+        ) -> None:
+            await bot.run_slash_command(
+                interaction, f"{name} {arguments or ''}"
+            )
+    else:
+        async def callback(interaction: discord.Interaction) -> None:
+            await bot.run_slash_command(interaction, name)
+    return app_commands.Command(
+        name=name,
+        description=_truncate(info["help"], DESCRIPTION_LIMIT),
+        callback=callback,
+    )
+
+
+def _choices(names, current: str) -> list[app_commands.Choice[str]]:
+    """Choices for the names containing what's been typed so far."""
+    current = current.lower()
+    matches = [i for i in dict.fromkeys(names) if current in i.lower()]
+    # Prefer names starting with what's been typed.
+    matches.sort(key=lambda i: not i.lower().startswith(current))
+    return [
+        app_commands.Choice(name=i, value=i)
+        for i in matches[:MAX_CHOICES]
+    ]
+
+
+def _truncate(text: str, limit: int) -> str:
+    return text if len(text) <= limit else f"{text[:limit - 3]}..."
+
+
+async def send_reply(
+    interaction: discord.Interaction,
+    response: str | Attachment | None,
+) -> None:
+    """Answer a deferred interaction, as a file if the reply is large."""
+    if not response:
+        response = "Done."
+    if isinstance(response, str):
+        chunks = split_lines(response, DISCORD_MESSAGE_LIMIT)
+        if len(chunks) <= MAX_SPLIT_MESSAGES:
+            for chunk in chunks:
+                await interaction.followup.send(chunk)
+            return
+        response = Attachment("reply.txt", [response])
+    loop = asyncio.get_running_loop()
+    encoded = await loop.run_in_executor(
+        None, fit_attachment, response.filename, response.pieces
+    )
+    if encoded is None:
+        await interaction.followup.send("The reply is too large to upload.")
+        return
+    filename, buffer = encoded
+    await interaction.followup.send(
+        file=discord.File(buffer, filename=filename)
+    )
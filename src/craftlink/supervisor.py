@@ -0,0 +1,156 @@
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import TYPE_CHECKING
+
+from craftlink.constants import (
+    CRASH_LOOP_LIMIT,
+    CRASH_LOOP_WINDOW_SECONDS,
+    KILL_TIMEOUT_SECONDS,
+    RESTART_BACKOFF_MAX_SECONDS,
+    RESTART_BACKOFF_MIN_SECONDS,
+    STOP_TIMEOUT_SECONDS,
+    TERMINATE_TIMEOUT_SECONDS,
+)
+from craftlink.jobs import LIFECYCLE, report_progress
+
+if TYPE_CHECKING:
+    from craftlink.command import CraftCommander
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ServerSupervisor():
+    """
+    Watches the server process started by a `CraftCommander`.
+    Stops escalate from the `stop` command to SIGTERM to SIGKILL, each only
+    after the previous one times out, and finish as soon as the process
+    exits. Unexpected exits are restarted with exponential backoff, unless
+    the server has crashed `CRASH_LOOP_LIMIT` times in a short window.
+    """
+    def __init__(self, commander: CraftCommander, auto_restart: bool) -> None:
+        self.commander = commander
+        self.auto_restart = auto_restart
+        self.watch_task = None
+        self.stopping = False
+        self.crash_times = deque()
+
+    def watch(self, server_proc: asyncio.subprocess.Process) -> None:
+        """Start watching a newly started server process."""
+        self.stopping = False
+        self.watch_task = asyncio.create_task(self._watch(server_proc))
+
+    def expect_exit(self) -> None:
+        """Mark the next exit as intended, e.g. after sending `stop`."""
+        self.stopping = True
+
+    async def _watch(self, server_proc: asyncio.subprocess.Process) -> None:
+        started = time.monotonic()
+        returncode = await server_proc.wait()
+        uptime = time.monotonic() - started
+        name = self.commander.name
+        if self.stopping or returncode == 0:
+            LOGGER.info(f"{name} server exited with code {returncode}.")
+            await self.commander.notify(
+                f"{name} server stopped after {uptime:.0f}s."
+            )
+            return
+        LOGGER.warning(f"{name} server crashed with code {returncode}.")
+        now = time.monotonic()
+        self.crash_times.append(now)
+        while now - self.crash_times[0] > CRASH_LOOP_WINDOW_SECONDS:
+            self.crash_times.popleft()
+        message = (
+            f"{name} server crashed with exit code {returncode}"
+            f" after {uptime:.0f}s."
+        )
+        if not self.auto_restart:
+            await self.commander.notify(message)
+            return
+        if len(self.crash_times) >= CRASH_LOOP_LIMIT:
+            await self.commander.notify(
+                f"{message} It crashed {len(self.crash_times)} times in"
+                f" {CRASH_LOOP_WINDOW_SECONDS}s, not restarting it again."
+                " Check the logs, then use `startserver`."
+            )
+            self.crash_times.clear()
+            return
+        delay = min(
+            RESTART_BACKOFF_MIN_SECONDS * 2 ** (len(self.crash_times) - 1),
+            RESTART_BACKOFF_MAX_SECONDS,
+        )
+        await self.commander.notify(f"{message} Restarting in {delay}s.")
+        await asyncio.sleep(delay)
+        # Someone may have started or stopped it in the meantime.
+        if self.stopping or await self.commander.server_running:
+            return
+        self.commander.jobs.submit(
+            "restart after crash",
+            self.commander.start_server,
+            conflicts=LIFECYCLE,
+            user_name="supervisor",
+        )
+
+    async def stop(self) -> bool:
+        """
+        Stop the server, escalating until it exits.
+        Returns whether it had to be killed.
+        """
+        server_proc = self.commander.server_proc
+        self.expect_exit()
+        if server_proc is None or server_proc.returncode is not None:
+            # Nothing we started, try a graceful stop (e.g. over RCON).
+            if await self.commander.server_running:
+                await self.commander.send_server_command("stop")
+            return False
+        name = self.commander.name
+        report_progress("Asked the server to stop, waiting for it to exit.")
+        await self.commander.send_server_command("stop")
+        if await _wait_for_exit(server_proc, STOP_TIMEOUT_SECONDS):
+            return False
+        LOGGER.warning(f"{name} server did not stop, terminating it.")
+        report_progress("The server did not stop, terminating it.")
+        server_proc.terminate()
+        if await _wait_for_exit(server_proc, TERMINATE_TIMEOUT_SECONDS):
+            return False
+        await self.kill()
+        return True
+
+    async def kill(self) -> None:
+        """Kill the server and reap the process."""
+        server_proc = self.commander.server_proc
+        self.expect_exit()
+        if server_proc is None or server_proc.returncode is not None:
+            return
+        LOGGER.warning(f"Killing {self.commander.name} server.")
+        report_progress("Killing the server.")
+        server_proc.kill()
+        if not await _wait_for_exit(server_proc, KILL_TIMEOUT_SECONDS):
+            LOGGER.error(
+                f"{self.commander.name} server process {server_proc.pid}"
+                " did not exit after being killed."
+            )
+
+    async def close(self) -> None:
+        if self.watch_task is not None and not self.watch_task.done():
+            self.watch_task.cancel()
+            try:
+                await self.watch_task
+            except asyncio.CancelledError:
+                pass
+        self.watch_task = None
+
+
+async def _wait_for_exit(
+    server_proc: asyncio.subprocess.Process,
+    timeout: float,
+) -> bool:
+    """Wait for a process to exit, returning False if it timed out."""
+    try:
+        await asyncio.wait_for(server_proc.wait(), timeout)
+    except asyncio.TimeoutError:
+        return False
+    return True
@@ -0,0 +1,38 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from craftlink.command import CraftCommander
+
+
+@pytest.fixture
+def server_dir(tmp_path: Path) -> Path:
+    """A Bedrock server directory, without a runnable server."""
+    server_binary = tmp_path / "bedrock_server"
+    server_binary.write_text("")
+    server_binary.chmod(0o755)
+    (tmp_path / "server.properties").write_text(
+        "server-name=Dedicated Server\nserver-port=19132\n"
+    )
+    (tmp_path / "allowlist.json").write_text("[]")
+    return tmp_path
+
+
+@pytest.fixture
+def make_commander(server_dir: Path):
+    """Build commanders for the server directory, closing them after."""
+    commanders = []
+
+    def make(**kwargs) -> CraftCommander:
+        kwargs.setdefault("archive_days", 0)
+        commander = CraftCommander(
+            server_dir, asyncio.Queue(), "bedrock", (1024, 1024), False,
+            **kwargs,
+        )
+        commanders.append(commander)
+        return commander
+
+    yield make
+    for commander in commanders:
+        asyncio.run(commander.close())
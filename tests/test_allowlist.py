@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+from craftlink.allowlist import AllowlistStore
+
+
+def test_add_and_remove_are_saved(tmp_path):
+    allowlist_file = tmp_path / "allowlist.json"
+    allowlist_file.write_text(json.dumps([{"name": "alice", "xuid": "1"}]))
+
+    async def run():
+        allowlist = AllowlistStore(allowlist_file, "bedrock")
+        await allowlist.refresh()
+        assert "alice" in allowlist
+        assert not allowlist.add("alice", "2")
+        assert not allowlist.add("bob", "1")
+        assert allowlist.add("bob", "2")
+        assert allowlist.remove("alice")
+        assert not allowlist.remove("alice")
+        await allowlist.save()
+        return allowlist
+
+    allowlist = asyncio.run(run())
+    assert allowlist.names == ["bob"]
+    assert json.loads(allowlist_file.read_text()) == [
+        {"ignoresPlayerLimit": False, "name": "bob", "xuid": "2"}
+    ]
+
+
+def test_delayed_saves_are_batched(tmp_path, monkeypatch):
+    allowlist_file = tmp_path / "whitelist.json"
+    writes = []
+
+    async def run():
+        allowlist = AllowlistStore(allowlist_file, "java", write_delay=0.05)
+        await allowlist.refresh()
+        flush = allowlist.flush
+
+        async def counted_flush():
+            writes.append(len(allowlist.names))
+            await flush()
+
+        monkeypatch.setattr(allowlist, "flush", counted_flush)
+        for index in range(3):
+            allowlist.add(f"player{index}", f"uuid-{index}")
+            await allowlist.save()
+        assert not allowlist_file.exists()
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert writes == [3]
+    assert [i["name"] for i in json.loads(allowlist_file.read_text())] == [
+        "player0", "player1", "player2"
+    ]
+
+
+def test_changes_on_disk_are_picked_up(tmp_path):
+    allowlist_file = tmp_path / "allowlist.json"
+
+    async def run():
+        allowlist = AllowlistStore(allowlist_file, "bedrock")
+        await allowlist.refresh()
+        assert allowlist.names == []
+        allowlist_file.write_text(json.dumps([{"name": "carol"}]))
+        await allowlist.refresh()
+        return allowlist
+
+    assert asyncio.run(run()).names == ["carol"]
@@ -0,0 +1,105 @@
+import asyncio
+import re
+from types import SimpleNamespace
+
+import pytest
+
+from craftlink import archive
+from craftlink.archive import ConsoleArchive, parse_duration
+
+DAY = 86400
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A settable clock for the archive, starting a year in."""
+    clock = SimpleNamespace(now=365 * DAY)
+    monkeypatch.setattr(
+        archive, "time", SimpleNamespace(time=lambda: clock.now)
+    )
+    return clock
+
+
+def fill(console_archive, clock, lines, step=60):
+    """Archive lines `step` seconds apart, a block each."""
+    async def run():
+        for line in lines:
+            console_archive.append(line + b"\n")
+            await console_archive.flush()
+            clock.now += step
+    return run()
+
+
+def test_search_by_time_and_pattern(tmp_path, clock):
+    async def run():
+        console_archive = ConsoleArchive(tmp_path, keep_days=0)
+        start = clock.now
+        await fill(
+            console_archive,
+            clock,
+            [b"Steve joined", b"Saving", b"Alex joined", b"Saving"],
+        )
+        everything = await console_archive.search()
+        recent = await console_archive.search(since=start + 90)
+        joins = await console_archive.search(
+            pattern=re.compile(b"joined"), literal="joined"
+        )
+        limited = await console_archive.search(limit=1)
+        await console_archive.close()
+        return start, everything, recent, joins, limited
+
+    start, everything, recent, joins, limited = asyncio.run(run())
+    assert [i[1] for i in everything[0]] == [
+        b"Steve joined", b"Saving", b"Alex joined", b"Saving"
+    ]
+    assert everything[0][0][0] == start
+    assert [i[1] for i in recent[0]] == [b"Alex joined", b"Saving"]
+    assert [i[1] for i in joins[0]] == [b"Steve joined", b"Alex joined"]
+    assert limited == ([(start + 180, b"Saving")], True)
+
+
+def test_segments_rotate_and_skip_missing_text(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_SEGMENT_SIZE", 1)
+
+    async def run():
+        console_archive = ConsoleArchive(tmp_path, keep_days=0)
+        await fill(console_archive, clock, [b"creeper", b"zombie"])
+        segments = await console_archive.segments()
+        found = await console_archive.search(
+            pattern=re.compile(b"creeper"), literal="creeper"
+        )
+        return segments, found
+
+    segments, found = asyncio.run(run())
+    assert len(segments) == 2
+    assert all(i.with_suffix(".bloom").exists() for i in segments)
+    assert [i[1] for i in found[0]] == [b"creeper"]
+    # The bloom filter rules out the second segment without reading it.
+    trigrams = archive._trigrams(b"creeper")
+    args = (None, None, trigrams, None, 10)
+    assert archive.search_segment(segments[0], *args)
+    assert archive.search_segment(segments[1], *args) == []
+
+
+def test_old_segments_are_pruned(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_SEGMENT_SIZE", 1)
+
+    async def run():
+        console_archive = ConsoleArchive(tmp_path, keep_days=1)
+        await fill(console_archive, clock, [b"first", b"second"], step=DAY)
+        await fill(console_archive, clock, [b"third"])
+        await console_archive.prune()
+        return await console_archive.segments(), await console_archive.search()
+
+    segments, (found, _) = asyncio.run(run())
+    assert len(segments) == 2
+    assert [i[1] for i in found] == [b"second", b"third"]
+
+
+@pytest.mark.parametrize(
+    "text, seconds",
+    [("10m", 600), ("1h30m", 5400), ("2d", 2 * DAY), ("", None),
+     ("5x", None), ("m", None)],
+)
+def test_parse_duration(text, seconds):
+    assert parse_duration(text) == seconds
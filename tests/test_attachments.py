@@ -0,0 +1,34 @@
+import gzip
+import os
+
+from craftlink import attachments
+from craftlink.attachments import encode_attachment, fit_attachment
+
+
+def test_small_files_are_left_uncompressed():
+    filename, buffer = encode_attachment("log.txt", ["one\n", b"two\n"])
+    assert filename == "log.txt"
+    assert buffer.read() == b"one\ntwo\n"
+
+
+def test_large_files_are_gzipped_without_zstandard(monkeypatch):
+    monkeypatch.setattr(attachments, "zstandard", None)
+    monkeypatch.setattr(attachments, "COMPRESS_ATTACHMENTS_OVER", 10)
+    filename, buffer = encode_attachment("log.txt", ["line\n"] * 100)
+    assert filename == "log.txt.gz"
+    assert gzip.decompress(buffer.read()) == b"line\n" * 100
+
+
+def test_oldest_pieces_are_dropped_to_fit(monkeypatch):
+    monkeypatch.setattr(attachments, "COMPRESS_ATTACHMENTS_OVER", 10**9)
+    monkeypatch.setattr(attachments, "ATTACHMENT_SIZE_LIMIT", 25)
+    pieces = [f"line {i}\n" for i in range(8)]
+    filename, buffer = fit_attachment("log.txt", pieces)
+    assert filename == "log.txt"
+    assert buffer.read() == b"line 6\nline 7\n"
+
+
+def test_unfittable_attachment_gives_none(monkeypatch):
+    monkeypatch.setattr(attachments, "COMPRESS_ATTACHMENTS_OVER", 10**9)
+    monkeypatch.setattr(attachments, "ATTACHMENT_SIZE_LIMIT", 4)
+    assert fit_attachment("log.txt", [os.urandom(8)]) is None
@@ -0,0 +1,116 @@
+import asyncio
+from types import SimpleNamespace
+
+from craftlink import backup as backup_module
+
+WORLD = "worlds/Bedrock level"
+
+
+def make_world(server_dir):
+    world = server_dir / WORLD
+    (world / "db").mkdir(parents=True)
+    (world / "db" / "000001.log").write_bytes(b"chunk data")
+    (world / "level.dat").write_bytes(b"level")
+    return world
+
+
+def test_only_changed_files_are_copied(make_commander, server_dir):
+    world = make_world(server_dir)
+    backups = make_commander(backup_keep=2).backups
+
+    async def run():
+        first = await backups.backup()
+        unchanged = await backups.backup()
+        (world / "level.dat").write_bytes(b"level 2")
+        changed = await backups.backup()
+        return first, unchanged, changed, await backups.snapshots()
+
+    first, unchanged, changed, snapshots = asyncio.run(run())
+    assert "Backed up 2 files" in first and "2 changed" in first
+    assert "0 changed" in unchanged
+    assert "1 changed" in changed
+    assert "Pruned 1 old backup(s)." in changed
+    assert len(snapshots) == 2
+    # Objects only the pruned backup used are gone, shared ones are kept.
+    objects = list((server_dir / "backups" / "objects").glob("*/*"))
+    assert len(objects) == 3
+
+
+def test_restore_puts_the_world_back(make_commander, server_dir):
+    world = make_world(server_dir)
+    backups = make_commander().backups
+
+    async def run():
+        await backups.backup()
+        (snapshot_id,) = await backups.snapshots()
+        (world / "level.dat").write_bytes(b"griefed")
+        (world / "db" / "000002.log").write_bytes(b"new")
+        return await backups.restore(snapshot_id)
+
+    reply = asyncio.run(run())
+    assert reply.startswith("Restored backup")
+    assert (world / "level.dat").read_bytes() == b"level"
+    assert not (world / "db" / "000002.log").exists()
+    kept = server_dir / "worlds" / "Bedrock level.pre-restore"
+    assert (kept / "level.dat").read_bytes() == b"griefed"
+
+
+def test_bedrock_copies_what_save_query_lists(
+    make_commander, server_dir, monkeypatch
+):
+    make_world(server_dir)
+    monkeypatch.setattr(backup_module, "BACKUP_SAVE_QUERY_INTERVAL", 0)
+    commander = make_commander()
+    commander.server_proc = SimpleNamespace(returncode=None)
+    commands = []
+    replies = {
+        "save query": iter([
+            "A previous save has not been completed.",
+            "Data saved. Files are now ready to be copied.\n"
+            "Bedrock level/db/000001.log:5, Bedrock level/level.dat:5",
+        ]),
+    }
+
+    async def query_server(command):
+        commands.append(command)
+        return next(replies[command], None) if command in replies else None
+
+    async def run():
+        reply = await commander.backups.backup()
+        (snapshot_id,) = await commander.backups.snapshots()
+        return reply, await commander.backups.read_manifest(snapshot_id)
+
+    monkeypatch.setattr(commander, "query_server", query_server)
+    reply, manifest = asyncio.run(run())
+    assert "Saves were held" in reply
+    assert commands == [
+        "save hold", "save query", "save query", "save resume"
+    ]
+    # Only the lengths the server said were safe to copy.
+    assert manifest["files"][f"{WORLD}/db/000001.log"]["size"] == 5
+
+
+def test_only_changed_chunks_are_stored(make_commander, server_dir):
+    world = make_world(server_dir)
+    region = world / "db" / "000003.ldb"
+    chunk_size = backup_module.BACKUP_CHUNK_SIZE
+    data = bytearray(b"".join(bytes([i]) * chunk_size for i in range(3)))
+    region.write_bytes(data)
+    original = bytes(data)
+    backups = make_commander().backups
+    objects_dir = server_dir / "backups" / "objects"
+
+    async def run():
+        await backups.backup()
+        before = len(list(objects_dir.glob("*/*")))
+        data[chunk_size + 1] = 255
+        region.write_bytes(data)
+        reply = await backups.backup()
+        after = len(list(objects_dir.glob("*/*")))
+        await backups.restore((await backups.snapshots())[0])
+        return reply, before, after
+
+    reply, before, after = asyncio.run(run())
+    assert "1 changed" in reply and "1.0 MB new" in reply
+    assert after == before + 1
+    assert region.read_bytes() == original
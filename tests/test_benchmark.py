@@ -0,0 +1,62 @@
+import importlib.util
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BENCHMARKS = Path(__file__).parent.parent / "benchmarks"
+
+
+def load_benchmark():
+    spec = importlib.util.spec_from_file_location(
+        "bench_relay", BENCHMARKS / "bench_relay.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    bench_relay = load_benchmark()
+    baseline = {"lines_per_second": 1000, "latency_p99": 0.1}
+    assert bench_relay.compare(
+        {"lines_per_second": 800, "latency_p99": 0.12}, baseline, 0.25
+    ) == []
+    regressions = bench_relay.compare(
+        {"lines_per_second": 700, "latency_p99": 0.2}, baseline, 0.25
+    )
+    assert [i.split(":")[0] for i in regressions] == [
+        "lines_per_second", "latency_p99"
+    ]
+
+
+def run_benchmark(*args: str) -> subprocess.CompletedProcess:
+    src = str(BENCHMARKS.parent / "src")
+    env = {**os.environ, "PYTHONPATH": src}
+    return subprocess.run(
+        [
+            sys.executable, str(BENCHMARKS / "bench_relay.py"),
+            "--lines", "300", "--rate", "3000", "--send-delay", "0",
+            "--timeout", "30", *args,
+        ],
+        capture_output=True,
+        text=True,
+        env=env,
+        timeout=60,
+    )
+
+
+def test_benchmark_relays_every_line(tmp_path):
+    result = run_benchmark(
+        "--save-baseline", str(tmp_path / "baseline.json")
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert (tmp_path / "baseline.json").exists()
+
+
+def test_benchmark_survives_rejected_sends():
+    # Rejects the first send, before any have been counted.
+    result = run_benchmark("--reject-chance", "0.5", "--channel-period", "0.5")
+    output = result.stdout + result.stderr
+    assert result.returncode == 0, output
+    assert "Failed to send messages" not in output
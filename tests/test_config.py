@@ -0,0 +1,67 @@
+import asyncio
+import json
+
+import pytest
+
+from craftlink.bot import CraftBot
+from craftlink.config import build_server_config, load_server_configs
+
+
+def test_defaults_are_filled_in(server_dir):
+    server_config = build_server_config(server_dir=server_dir, channel_id="7")
+    assert server_config["channel_id"] == 7
+    assert server_config["name"] == "Bedrock"
+    assert server_config["transport"] == "stdin"
+
+
+@pytest.mark.parametrize(
+    "settings, message",
+    [
+        ({"channel_id": 1}, "missing server_dir"),
+        ({"server_dir": "x", "channel_id": 1, "colour": "red"}, "Unknown"),
+    ],
+)
+def test_invalid_server_config(settings, message):
+    with pytest.raises(ValueError, match=message):
+        build_server_config(**settings)
+
+
+def test_servers_need_their_own_channel(tmp_path):
+    config_file = tmp_path / "servers.json"
+    config_file.write_text(json.dumps({"servers": [
+        {"name": "A", "server_dir": "a", "channel_id": 1},
+        {"name": "B", "server_dir": "b", "channel_id": 1},
+    ]}))
+    with pytest.raises(ValueError, match="own channel"):
+        load_server_configs(config_file)
+
+
+def test_bot_passes_each_setting_to_its_commander(server_dir, tmp_path):
+    server_config = build_server_config(
+        server_dir=str(server_dir),
+        channel_id=7,
+        name="Survival",
+        response_timeout=9.0,
+        backup_keep=3,
+        idle_timeout=600,
+        wake_on_connect=False,
+        archive_days=0,
+        dedup_window=2.5,
+    )
+    bot = CraftBot(
+        "token",
+        [server_config],
+        permissions_file=str(tmp_path / "permissions.json"),
+    )
+    commander = bot.commanders[7]
+    try:
+        assert commander.name == "Survival"
+        assert commander.response_timeout == 9.0
+        assert commander.backups.keep == 3
+        assert commander.idle.idle_timeout == 600
+        assert commander.idle.wake_on_connect is False
+        assert commander.archive is None
+        assert commander.repeats.window == 2.5
+        assert commander.permissions is bot.permissions
+    finally:
+        asyncio.run(commander.close())
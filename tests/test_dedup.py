@@ -0,0 +1,73 @@
+from craftlink.dedup import RepeatCollapser
+
+MOVED = b"Steve moved too quickly! %.1f,0.0,-3.9\n"
+
+
+def test_repeats_are_collapsed_with_a_count():
+    collapser = RepeatCollapser(window=5)
+    assert collapser.offer(MOVED % 1.0, 0) == [MOVED % 1.0]
+    for now in range(1, 4):
+        assert collapser.offer(MOVED % (now + 1.5), now) == []
+    assert collapser.expired(4) == []
+    assert collapser.expired(9) == [
+        b"Steve moved too quickly! 4.5,0.0,-3.9 (\xc3\x973)\n"
+    ]
+    assert collapser.held == 0
+
+
+def test_single_repeat_is_relayed_as_is():
+    collapser = RepeatCollapser(window=5)
+    collapser.offer(b"Saved\n", 0)
+    collapser.offer(b"Saved\n", 1)
+    assert collapser.flush() == [b"Saved\n"]
+
+
+def test_lines_outside_the_window_start_a_new_run():
+    collapser = RepeatCollapser(window=5)
+    collapser.offer(b"Tick 1\n", 0)
+    collapser.offer(b"Tick 2\n", 1)
+    assert collapser.offer(b"Tick 3\n", 7) == [b"Tick 2\n", b"Tick 3\n"]
+
+
+def test_uuids_and_hex_are_ignored():
+    collapser = RepeatCollapser(window=5)
+    collapser.offer(b"Entity 0x1f 123e4567-e89b-12d3-a456-426614174000\n", 0)
+    assert collapser.offer(
+        b"Entity 0xff 00000000-0000-0000-0000-000000000000\n", 1
+    ) == []
+    assert collapser.offer(b"Other line\n", 2) == [b"Other line\n"]
+
+
+def test_long_runs_are_reported_while_still_going():
+    collapser = RepeatCollapser(window=5, max_hold=10)
+    for now in range(12):
+        collapser.offer(b"Lag\n", now)
+    assert collapser.expired(12) == [b"Lag (\xc3\x9711)\n"]
+    # The run carries on, counting from zero again.
+    collapser.offer(b"Lag\n", 13)
+    assert collapser.flush() == [b"Lag\n"]
+
+
+def test_least_recent_run_is_evicted():
+    collapser = RepeatCollapser(window=5, max_runs=2)
+    collapser.offer(b"A\n", 0)
+    collapser.offer(b"A\n", 0)
+    collapser.offer(b"A\n", 0)
+    collapser.offer(b"B\n", 1)
+    assert collapser.offer(b"C\n", 2) == [b"A (\xc3\x972)\n", b"C\n"]
+    assert len(collapser.runs) == 2
+
+
+def test_player_lines_must_match_exactly():
+    collapser = RepeatCollapser(window=5)
+    lines = [
+        b"[12:00:00] [Server thread/INFO]: <Steve> I have 3 diamonds\n",
+        b"[12:00:01] [Server thread/INFO]: <Steve> I have 5 diamonds\n",
+        b"[12:00:01] [Server thread/INFO]: Steve1 joined the game\n",
+        b"[12:00:01] [Server thread/INFO]: Steve2 joined the game\n",
+        b"[2024-05-01 12:00:01:001 INFO] Player connected: Alex1, xuid: 1\n",
+        b"[2024-05-01 12:00:01:002 INFO] Player connected: Alex2, xuid: 2\n",
+    ]
+    for now, line in enumerate(lines):
+        assert collapser.offer(line, now / 10) == [line]
+    assert collapser.offer(lines[0], 1) == []
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+
+import pytest
+
+from craftlink.files import AsyncFileIO, FileTooLargeError, atomic_write_text
+
+
+@pytest.fixture
+def file_io():
+    file_io = AsyncFileIO(max_workers=2, timeout=1)
+    yield file_io
+    file_io.close()
+
+
+def test_atomic_write_keeps_mode_and_newlines(tmp_path):
+    path = tmp_path / "server.properties"
+    path.write_text("old\n")
+    path.chmod(0o640)
+    atomic_write_text(path, "a=1\r\nb=2\r\n")
+    assert path.read_bytes() == b"a=1\r\nb=2\r\n"
+    assert path.stat().st_mode & 0o777 == 0o640
+    assert [i.name for i in tmp_path.iterdir()] == ["server.properties"]
+
+
+def test_reads_are_limited(tmp_path, file_io):
+    path = tmp_path / "big.txt"
+    path.write_text("x" * 100)
+
+    async def run():
+        assert await file_io.read_text(path, limit=100) == "x" * 100
+        chunks = [i async for i in file_io.read_chunks(path, chunk_size=40)]
+        assert [len(i) for i in chunks] == [40, 40, 20]
+        with pytest.raises(FileTooLargeError):
+            await file_io.read_bytes(path, limit=99)
+
+    asyncio.run(run())
+
+
+def test_operations_on_a_path_are_serialised(tmp_path, file_io):
+    path = tmp_path / "allowlist.json"
+    active = []
+    overlaps = []
+    lock = threading.Lock()
+
+    def work():
+        with lock:
+            active.append(1)
+            overlaps.append(len(active))
+        threading.Event().wait(0.02)
+        with lock:
+            active.pop()
+
+    async def run():
+        await asyncio.gather(*(file_io.run(path, work) for _ in range(4)))
+
+    asyncio.run(run())
+    assert overlaps == [1, 1, 1, 1]
+
+
+def test_slow_operations_time_out(tmp_path):
+    file_io = AsyncFileIO(max_workers=1, timeout=0.05)
+    release = threading.Event()
+
+    async def run():
+        with pytest.raises(TimeoutError, match="Timed out"):
+            await file_io.run(tmp_path, release.wait)
+
+    try:
+        asyncio.run(run())
+    finally:
+        release.set()
+        file_io.close()
@@ -0,0 +1,57 @@
+import pytest
+
+from craftlink.filters import MessageFilter
+
+
+def test_excluded_lines_unless_included():
+    message_filter = MessageFilter(["Saving", "Autosave"], ["Saving failed"])
+    assert message_filter.allow(b"Player joined")
+    assert not message_filter.allow(b"Saving chunks")
+    assert message_filter.allow(b"Saving failed: disk full")
+    assert message_filter.exclude_hits == {0: 1}
+    assert message_filter.include_hits == {0: 1}
+
+
+def test_hits_are_counted_per_rule_with_groups():
+    message_filter = MessageFilter(["(a)(b)c", "(x)?y", "z"])
+    for line in (b"abc", b"y", b"xy", b"z", b"z"):
+        assert not message_filter.allow(line)
+    assert message_filter.exclude_hits == {0: 1, 1: 2, 2: 2}
+
+
+def test_leading_flags_only_apply_to_their_rule():
+    message_filter = MessageFilter(["(?i)error", "Warn", "(?x) skip  # me"])
+    assert not message_filter.allow(b"ERROR: oops")
+    assert message_filter.allow(b"WARN: careful")
+    assert not message_filter.allow(b"skip")
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    [
+        "(",
+        "(?P<name>x)",
+        r"(a)\1",
+        r"(a)(?(1)b|c)",
+        "x(?i)",
+    ],
+)
+def test_invalid_rules_raise_value_error(pattern):
+    with pytest.raises(ValueError, match="Invalid pattern"):
+        MessageFilter([pattern])
+
+
+def test_escaped_backslash_isnt_a_backreference():
+    message_filter = MessageFilter([r"(a)\\1"])
+    assert not message_filter.allow(b"a\\1")
+
+
+def test_rules_file(tmp_path):
+    rules_file = tmp_path / "rules.txt"
+    rules_file.write_text("# Comment\n\nexclude ^Spam\ninclude Spam!$\n")
+    message_filter = MessageFilter.from_file(rules_file)
+    assert not message_filter.allow(b"Spam")
+    assert message_filter.allow(b"Spam!")
+    rules_file.write_text("block ^Spam\n")
+    with pytest.raises(ValueError, match="line 1"):
+        MessageFilter.from_file(rules_file)
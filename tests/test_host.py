@@ -0,0 +1,153 @@
+import asyncio
+import stat
+import sys
+
+from craftlink import host as host_module
+from craftlink.host import (
+    LOST_RETURNCODE,
+    HostClient,
+    HostedProcess,
+    ServerHost,
+)
+
+# Prints two lines, then keeps running so clients can attach to it.
+SERVER_ARGV = [
+    sys.executable,
+    "-c",
+    "import time; print('one'); print('two', flush=True); time.sleep(30)",
+]
+
+
+async def read_lines(process: HostedProcess, count: int) -> list[bytes]:
+    return [
+        await asyncio.wait_for(process.stdout.readline(), 5)
+        for _ in range(count)
+    ]
+
+
+def test_clients_resume_within_a_host_epoch(tmp_path):
+    socket_path = str(tmp_path / "host.sock")
+
+    async def run():
+        host = ServerHost(socket_path)
+        serve_task = asyncio.create_task(host.serve())
+        while not (tmp_path / "host.sock").exists():
+            await asyncio.sleep(0.01)
+        mode = stat.S_IMODE((tmp_path / "host.sock").stat().st_mode)
+        try:
+            client = HostClient(socket_path)
+            await client.connect()
+            process = await client.start(SERVER_ARGV, str(tmp_path), {})
+            first = await read_lines(process, 2)
+            epoch, last_offset = client.epoch, client.last_offset
+            await client.close()
+            # Same host, so only output after the last offset is replayed.
+            client = HostClient(socket_path)
+            await client.connect(epoch, last_offset - 1)
+            resumed = await read_lines(client.process, 1)
+            await client.close()
+            # Offsets from another host can't be trusted, replay it all.
+            client = HostClient(socket_path)
+            await client.connect(epoch + 1, last_offset)
+            replayed = await read_lines(client.process, 2)
+            await client.close()
+        finally:
+            if host.server_proc is not None:
+                host.server_proc.kill()
+                await host.server_proc.wait()
+            serve_task.cancel()
+        return mode, epoch, host, first, resumed, replayed
+
+    mode, epoch, host, first, resumed, replayed = asyncio.run(run())
+    assert mode == 0o600
+    assert epoch == host.epoch
+    assert first == [b"one\n", b"two\n"]
+    assert resumed == [b"two\n"]
+    assert replayed == [b"one\n", b"two\n"]
+
+
+def test_lost_host_isnt_a_crash():
+    async def run():
+        client = HostClient("unused.sock")
+        client.reader = asyncio.StreamReader()
+        client.reader.feed_eof()
+        client.process = HostedProcess(client, 1234)
+        await client._read_frames()
+        return await client.process.wait()
+
+    assert asyncio.run(run()) == LOST_RETURNCODE
+
+
+def test_reconnecting_forgets_the_previous_run(tmp_path):
+    socket_path = str(tmp_path / "host.sock")
+
+    async def run():
+        host = ServerHost(socket_path)
+        serve_task = asyncio.create_task(host.serve())
+        while not (tmp_path / "host.sock").exists():
+            await asyncio.sleep(0.01)
+        try:
+            client = HostClient(socket_path)
+            client.process = HostedProcess(client, 1234)
+            client.process._exit(0)
+            await client.connect()
+            process = client.process
+            await client.close()
+        finally:
+            serve_task.cancel()
+        return process
+
+    assert asyncio.run(run()) is None
+
+
+def test_starting_a_running_server_returns_its_run(tmp_path):
+    socket_path = str(tmp_path / "host.sock")
+
+    async def run():
+        host = ServerHost(socket_path)
+        serve_task = asyncio.create_task(host.serve())
+        while not (tmp_path / "host.sock").exists():
+            await asyncio.sleep(0.01)
+        try:
+            client = HostClient(socket_path)
+            await client.connect()
+            first = await client.start(SERVER_ARGV, str(tmp_path), {})
+            second = await client.start(
+                SERVER_ARGV, str(tmp_path), {}, timeout=2
+            )
+            await client.close()
+        finally:
+            if host.server_proc is not None:
+                host.server_proc.kill()
+                await host.server_proc.wait()
+            serve_task.cancel()
+        return host, first, second
+
+    host, first, second = asyncio.run(run())
+    assert first.pid == second.pid == host.server_proc.pid
+
+
+def test_lagging_clients_are_dropped(monkeypatch, tmp_path):
+    monkeypatch.setattr(host_module, "HOST_CLIENT_BUFFER_BYTES", 0)
+    socket_path = str(tmp_path / "host.sock")
+
+    async def run():
+        host = ServerHost(socket_path)
+        serve_task = asyncio.create_task(host.serve())
+        while not (tmp_path / "host.sock").exists():
+            await asyncio.sleep(0.01)
+        try:
+            client = HostClient(socket_path)
+            await client.connect()
+            (writer,) = host.clients
+            # As if the client had stopped reading what the host writes.
+            writer.transport.get_write_buffer_size = lambda: 1
+            host._buffer_output(b"line\n")
+            await asyncio.wait_for(client._read_task, 5)
+            clients = set(host.clients)
+            await client.close()
+        finally:
+            serve_task.cancel()
+        return clients
+
+    assert asyncio.run(run()) == set()
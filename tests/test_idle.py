@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from craftlink.parser import PlayerJoin, PlayerLeave
+from craftlink.presence import parse_player_list
+
+
+def join(player: str) -> PlayerJoin:
+    return PlayerJoin(
+        "12:00:00", "INFO", None, f"{player} joined the game",
+        player=player, player_id=None,
+    )
+
+
+def leave(player: str) -> PlayerLeave:
+    return PlayerLeave(
+        "12:00:00", "INFO", None, f"{player} left the game",
+        player=player, player_id=None,
+    )
+
+
+@pytest.mark.parametrize("reply, players", [
+    ("There are 2 of a max of 20 players online: Steve, Alex",
+     ["Steve", "Alex"]),
+    ("There are 0 of a max of 20 players online:", []),
+    ("There are 1/10 players online:\nSome Gamer", ["Some Gamer"]),
+    ("There are 0/10 players online:\nSaving...", []),
+    # The next line captured wasn't the player list.
+    ("There are 2/10 players online:\nSaving...", None),
+    ("Unknown command: list", None),
+])
+def test_parse_player_list(reply, players):
+    assert parse_player_list(reply) == players
+
+
+def test_presence_sync(make_commander):
+    presence = make_commander().presence
+
+    async def run() -> None:
+        presence.handle_event(join("Gone"))
+        presence.sync(["Steve", "Alex"])
+        await presence.flush()
+
+    asyncio.run(run())
+    assert set(presence.online) == {"Steve", "Alex"}
+    assert presence.players["Gone"].sessions == 1
+
+
+def test_idle_timer_not_armed_while_online_unknown(make_commander):
+    commander = make_commander(idle_timeout=60)
+    idle = commander.idle
+
+    async def run() -> list[bool]:
+        armed = []
+        idle.online_unknown()
+        commander.presence.handle_event(leave("Steve"))
+        idle.handle_event(leave("Steve"))
+        armed.append(idle.idle_task is not None)
+        # Listing finds someone still online.
+        commander.presence.sync(["Alex"])
+        idle.players_listed()
+        armed.append(idle.idle_task is not None)
+        commander.presence.handle_event(leave("Alex"))
+        idle.handle_event(leave("Alex"))
+        armed.append(idle.idle_task is not None)
+        idle._cancel_idle_timer()
+        return armed
+
+    assert asyncio.run(run()) == [False, False, True]
+
+
+def test_sync_presence_after_attaching(make_commander):
+    commander = make_commander(idle_timeout=60)
+    replies = iter([
+        "There are 1 of a max of 20 players online: Steve",
+        "Unknown command",
+    ])
+
+    async def query_server(command: str) -> str:
+        assert command == "list"
+        return next(replies)
+
+    commander.query_server = query_server
+
+    async def run() -> None:
+        commander.idle.online_unknown()
+        await commander.sync_presence()
+        assert set(commander.presence.online) == {"Steve"}
+        assert commander.console_parser.online_players == {"Steve"}
+        assert commander.idle.online_known
+        commander.idle.online_unknown()
+        await commander.sync_presence()
+        assert not commander.idle.online_known
+
+    asyncio.run(run())
+
+
+def test_failed_wake_is_logged_once(make_commander, caplog):
+    commander = make_commander(idle_timeout=60)
+    idle = commander.idle
+    calls = []
+
+    async def notify(message: str) -> None:
+        calls.append(message)
+        raise RuntimeError("Discord is down.")
+
+    commander.notify = notify
+
+    async def run() -> None:
+        idle.listener = object()
+        idle.stop_listening = lambda: asyncio.sleep(0)
+        # Clients send several join attempts in a row.
+        for _ in range(3):
+            idle._wake()
+        await asyncio.gather(*idle.tasks, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert len(calls) == 1
+    assert not commander.idle.tasks
+    assert "Failed to start the server for a player." in caplog.text
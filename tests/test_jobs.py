@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from craftlink import jobs
+from craftlink.jobs import CronExpression, JobManager, Schedule
+
+
+@pytest.mark.parametrize(
+    "expression, moment, expected",
+    [
+        ("0 4 * * *", datetime(2024, 5, 1, 4, 0), True),
+        ("0 4 * * *", datetime(2024, 5, 1, 4, 1), False),
+        ("*/15 * * * *", datetime(2024, 5, 1, 9, 45), True),
+        ("*/15 * * * *", datetime(2024, 5, 1, 9, 50), False),
+        ("0 0 * * 0", datetime(2024, 5, 5, 0, 0), True),
+        ("0 0 * * 7", datetime(2024, 5, 5, 0, 0), True),
+        ("0 0 * * 1-5", datetime(2024, 5, 5, 0, 0), False),
+        # Either day matching is enough when both are restricted.
+        ("0 0 1 * 1", datetime(2024, 5, 6, 0, 0), True),
+        ("0 0 1 * 1", datetime(2024, 5, 1, 0, 0), True),
+        ("0 0 1 * 1", datetime(2024, 5, 2, 0, 0), False),
+        ("@daily", datetime(2024, 5, 2, 0, 0), True),
+    ],
+)
+def test_cron_matches(expression, moment, expected):
+    assert CronExpression(expression).matches(moment) is expected
+
+
+@pytest.mark.parametrize(
+    "expression",
+    ["* * * *", "60 * * * *", "* 24 * * *", "*/0 * * * *", "a * * * *"],
+)
+def test_invalid_cron_raises(expression):
+    with pytest.raises(ValueError):
+        CronExpression(expression)
+
+
+def test_schedule_round_trips():
+    schedule = Schedule(CronExpression("@hourly"), "backup", "alice", "mod")
+    loaded = Schedule.from_dict(schedule.to_dict())
+    assert loaded.cron.expression == "@hourly"
+    assert (loaded.command, loaded.user_name, loaded.tier) == (
+        "backup", "alice", "mod"
+    )
+
+
+def test_early_wake_runs_a_minute_once(monkeypatch, tmp_path):
+    # Woken just short of 04:01, twice, then at 04:01 proper.
+    moments = [
+        datetime(2024, 5, 1, 4, 0, 59, 999000),
+        datetime(2024, 5, 1, 4, 0, 59, 999500),
+        datetime(2024, 5, 1, 4, 1, 0, 1000),
+    ]
+
+    def now():
+        # Stay at the last moment once through them.
+        return moments.pop(0) if len(moments) > 1 else moments[0]
+
+    monkeypatch.setattr(jobs, "time", SimpleNamespace(time=lambda: 59.999))
+    monkeypatch.setattr(jobs, "datetime", SimpleNamespace(now=now))
+    ran = []
+
+    async def run():
+        async def run_scheduled(schedule):
+            ran.append(schedule.command)
+
+        manager = JobManager("test", tmp_path / "jobs.json", run_scheduled)
+        manager.schedules[1] = Schedule(
+            CronExpression("* * * * *"), "list", "alice", "admin"
+        )
+        task = asyncio.create_task(manager._run_schedules())
+        await asyncio.sleep(0.1)
+        manager.schedules.clear()
+        await task
+
+    asyncio.run(run())
+    assert ran == ["list", "list"]
+
+
+def test_conflicting_jobs_wait_for_each_other(tmp_path):
+    async def run():
+        manager = JobManager("test", tmp_path / "jobs.json", None)
+        order = []
+
+        async def step(name):
+            order.append(f"{name} start")
+            await asyncio.sleep(0.01)
+            order.append(f"{name} end")
+            return name
+
+        first = manager.submit("a", step, "a", conflicts="server")
+        second = manager.submit("b", step, "b", conflicts="server")
+        await asyncio.gather(first.task, second.task)
+        return order, second
+
+    order, second = asyncio.run(run())
+    assert order == ["a start", "a end", "b start", "b end"]
+    assert second.state == "done"
+    assert second.result == "b"
+
+
+def test_cancel_job(tmp_path):
+    async def run():
+        manager = JobManager("test", tmp_path / "jobs.json", None)
+        job = manager.submit("wait", asyncio.sleep, 60)
+        await asyncio.sleep(0)
+        assert manager.cancel(job.id)
+        await asyncio.wait({job.task})
+        return manager, job
+
+    manager, job = asyncio.run(run())
+    assert job.state == "cancelled"
+    assert not manager.cancel(job.id)
@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+import pytest
+
+from craftlink import jvm
+from craftlink.jvm import GcPauseLog, JavaLauncher
+from craftlink.parser import ServerStarted
+
+
+def test_argv_uses_the_profile(tmp_path):
+    launcher = JavaLauncher(
+        tmp_path,
+        "zgc",
+        (1024, 4096),
+        java_path="/opt/java/bin/java",
+        java_args=["-Dlog4j2.formatMsgNoLookups=true"],
+        server_args=["--port", "25566"],
+    )
+    argv = launcher.argv()
+    # Pre-touching the heap commits all of it, so it starts at the max.
+    assert argv[:3] == ["/opt/java/bin/java", "-Xms4096M", "-Xmx4096M"]
+    assert "-XX:+UseZGC" in argv
+    assert "-Dlog4j2.formatMsgNoLookups=true" in argv
+    assert any(i.startswith("-Xlog:gc,gc+phases:file=") for i in argv)
+    assert argv[-5:] == ["-jar", "server.jar", "nogui", "--port", "25566"]
+
+
+def test_auto_heap_is_sized_from_memory(tmp_path, monkeypatch):
+    monkeypatch.setattr(jvm, "host_memory_mb", lambda: 8192)
+    launcher = JavaLauncher(tmp_path, mem_range=(1024, "auto"))
+    assert launcher.heap_sizes() == (1024, 6144)
+    monkeypatch.setattr(jvm, "host_memory_mb", lambda: 256)
+    assert launcher.heap_sizes() == (512, 512)
+
+
+def test_unknown_profile_raises(tmp_path):
+    with pytest.raises(ValueError, match="Invalid Java profile"):
+        JavaLauncher(tmp_path, "turbo")
+
+
+def test_gc_pauses_are_read_as_the_log_grows(tmp_path):
+    log_file = tmp_path / "gc.log"
+    gc_log = GcPauseLog(log_file)
+
+    async def run():
+        log_file.write_bytes(
+            b"[0.1s] GC(0) Pause Young (Normal) 24M->8M(256M) 3.5ms\n"
+            b"[0.2s] GC(1) Concurrent Mark Cycle"
+        )
+        await gc_log.update()
+        with log_file.open("ab") as log:
+            log.write(b" 12.0ms\n[0.3s] GC(2) Pause Remark 1.5ms\n")
+        await gc_log.update()
+        first = gc_log.summary()
+        # A new JVM truncates the log.
+        log_file.write_bytes(b"[0.1s] GC(0) Pause Young 2.0ms\n")
+        await gc_log.update()
+        return first, gc_log.summary()
+
+    first, second = asyncio.run(run())
+    assert first == {
+        "gc_pauses": 2,
+        "gc_pause_total_ms": 5.0,
+        "gc_pause_max_ms": 3.5,
+        "gc_pause_p99_ms": 3.5,
+    }
+    assert second["gc_pauses"] == 1
+
+
+def test_runs_are_recorded(tmp_path):
+    launcher = JavaLauncher(tmp_path, "g1")
+
+    async def run():
+        await launcher.start_run(launcher.argv())
+        (tmp_path / launcher.gc_log_name).write_bytes(
+            b"[1s] GC(0) Pause Young 4.0ms\n"
+        )
+        launcher.handle_event(ServerStarted(
+            "12:00:00", "INFO", None, "Done", startup_seconds=None
+        ))
+        await launcher.finish_run(0)
+
+    asyncio.run(run())
+    (recorded,) = json.loads(launcher.history_file.read_text())
+    assert recorded["profile"] == "g1"
+    assert recorded["exit_code"] == 0
+    assert recorded["gc_pauses"] == 1
+    assert recorded["startup_seconds"] is not None
@@ -0,0 +1,88 @@
+import asyncio
+import os
+
+import pytest
+
+from craftlink.metrics import (
+    MetricsServer,
+    ProcessSampler,
+    ServerMetrics,
+    render_prometheus,
+)
+from craftlink.parser import ConsoleEvent, LagWarning
+
+
+def test_events_and_latencies_are_counted():
+    metrics = ServerMetrics("Survival")
+    metrics.handle_event(LagWarning(
+        "12:00:00", "WARN", "Server thread", "Can't keep up!",
+        ms_behind=2500, ticks_behind=50,
+    ))
+    metrics.handle_event(ConsoleEvent(
+        "12:00:01", "INFO", "Server thread",
+        "TPS from last 1m, 5m, 15m: *20.0, 19.5, 19.8",
+    ))
+    for seconds in (0.1, 0.2, 0.3, 0.4, 5.0):
+        metrics.observe_relay_latency(seconds)
+    assert (metrics.lag_warnings, metrics.ticks_behind) == (1, 50)
+    assert metrics.tps == 20.0
+    assert metrics.latency_percentiles() == {
+        "0.5": 0.3, "0.9": 5.0, "0.99": 5.0
+    }
+    page = render_prometheus([(metrics, {"queue_depth": 3, "rss": None})])
+    assert "# TYPE craftlink_lag_warnings_total counter" in page
+    assert 'craftlink_tps{server="Survival"} 20.0' in page
+    assert (
+        'craftlink_relay_latency_seconds{server="Survival",quantile="0.5"}'
+        " 0.3"
+    ) in page
+    assert 'craftlink_queue_depth{server="Survival"} 3' in page
+    # Latency is a single summary family.
+    assert page.count("craftlink_relay_latency_seconds") == 6
+    assert "# TYPE craftlink_relay_latency_seconds summary" in page
+    assert 'craftlink_relay_latency_seconds_count{server="Survival"} 5' in page
+    # Gauges without a value are left out.
+    assert "craftlink_rss" not in page
+    assert "craftlink_startup_seconds" not in page
+
+
+@pytest.mark.skipif(
+    not os.path.exists("/proc/self/stat"), reason="Needs Linux's /proc."
+)
+def test_process_sampler_reads_our_own_process():
+    sampler = ProcessSampler()
+    first = sampler.sample(os.getpid())
+    second = sampler.sample(os.getpid())
+    assert first["cpu_percent"] is None
+    assert second["cpu_percent"] is not None
+    assert second["rss_bytes"] > 0
+    assert second["threads"] >= 1
+    assert sampler.sample(-1) is None
+
+
+def test_metrics_are_served_over_http():
+    async def get(port, path):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+        response = await reader.read()
+        writer.close()
+        return response
+
+    async def run():
+        server = MetricsServer(lambda: "craftlink_up 1\n", 0)
+        await server.start()
+        port = server.server.sockets[0].getsockname()[1]
+        try:
+            return await get(port, "/metrics"), await get(port, "/other")
+        finally:
+            await server.close()
+
+    found, missing = asyncio.run(run())
+    assert found.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert found.endswith(b"\r\n\r\ncraftlink_up 1\n")
+    assert missing.startswith(b"HTTP/1.1 404")
+
+
+def test_server_names_are_escaped():
+    page = render_prometheus([(ServerMetrics('My "Big"\\\nServer'), {})])
+    assert 'server="My \\"Big\\"\\\\\\nServer"' in page
@@ -0,0 +1,88 @@
+import pytest
+
+from craftlink.parser import (
+    ChatMessage,
+    ConsoleParser,
+    PlayerDeath,
+    PlayerJoin,
+    PlayerLeave,
+    ServerStarted,
+)
+
+VANILLA = b"[12:00:00] [Server thread/INFO]: "
+PAPER = b"[12:00:00 INFO]: "
+
+
+@pytest.mark.parametrize("prefix", [VANILLA, PAPER])
+def test_java_join_and_leave(prefix):
+    parser = ConsoleParser("java")
+    parser.parse(
+        b"[12:00:00] [User Authenticator #1/INFO]: UUID of player Steve is"
+        b" 069a79f4-44e9-4726-a5be-fca90e38aaf5\n"
+    )
+    join = parser.parse(prefix + b"Steve joined the game\n")
+    assert isinstance(join, PlayerJoin)
+    assert join.player == "Steve"
+    assert join.player_id == "069a79f4-44e9-4726-a5be-fca90e38aaf5"
+    assert parser.online_players == {"Steve"}
+    leave = parser.parse(prefix + b"Steve left the game\n")
+    assert isinstance(leave, PlayerLeave)
+    assert parser.online_players == set()
+
+
+@pytest.mark.parametrize("line", [
+    VANILLA + b"[Server] (bob@Discord) Fake joined the game",
+    VANILLA + b"* Steve joined the game",
+    PAPER + b"[Server] Fake joined the game",
+    PAPER + b"* Steve left the game",
+    b"[12:00:00] [Async Chat Thread - #0/INFO]: Steve joined the game",
+    VANILLA + b"ThisNameIsFarTooLong joined the game",
+])
+def test_java_spoofed_joins_and_leaves_are_ignored(line):
+    parser = ConsoleParser("java")
+    parser.online_players.add("Steve")
+    event = parser.parse(line)
+    assert not isinstance(event, (PlayerJoin, PlayerLeave))
+    assert parser.online_players == {"Steve"}
+
+
+def test_java_chat_is_not_a_join():
+    parser = ConsoleParser("java")
+    event = parser.parse(VANILLA + b"<Alex> Steve joined the game")
+    assert isinstance(event, ChatMessage)
+    assert event.player == "Alex"
+    assert event.text == "Steve joined the game"
+    assert parser.online_players == set()
+
+
+def test_java_death_only_for_online_players():
+    parser = ConsoleParser("java")
+    parser.parse(VANILLA + b"Steve joined the game")
+    assert isinstance(parser.parse(VANILLA + b"Steve drowned"), PlayerDeath)
+    assert not isinstance(parser.parse(VANILLA + b"Alex drowned"), PlayerDeath)
+
+
+def test_java_server_started():
+    parser = ConsoleParser("java")
+    parser.online_players.add("Steve")
+    event = parser.parse(VANILLA + b'Done (3.250s)! For help, type "help"')
+    assert isinstance(event, ServerStarted)
+    assert event.startup_seconds == 3.25
+    assert parser.online_players == set()
+
+
+def test_bedrock_connect_and_disconnect():
+    parser = ConsoleParser("bedrock")
+    prefix = b"[2024-01-01 12:00:00:000 INFO] "
+    join = parser.parse(prefix + b"Player connected: Some Gamer, xuid: 123\n")
+    assert isinstance(join, PlayerJoin)
+    assert (join.player, join.player_id) == ("Some Gamer", "123")
+    leave = parser.parse(
+        prefix + b"Player disconnected: Some Gamer, xuid: 123, pfid: abc\n"
+    )
+    assert isinstance(leave, PlayerLeave)
+    assert parser.online_players == set()
+
+
+def test_unprefixed_lines_are_rejected():
+    assert ConsoleParser("java").parse(b"Steve joined the game") is None
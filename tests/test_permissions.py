@@ -0,0 +1,141 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from craftlink.jobs import CronExpression, Schedule
+from craftlink.permissions import PermissionIndex, tier_allows
+
+
+def member(member_id: int, role_ids=(), administrator=False, owner_id=1):
+    return SimpleNamespace(
+        id=member_id,
+        guild=SimpleNamespace(id=10, owner_id=owner_id),
+        roles=[SimpleNamespace(id=i) for i in role_ids],
+        guild_permissions=SimpleNamespace(administrator=administrator),
+    )
+
+
+@pytest.fixture
+def permissions(tmp_path):
+    permissions = PermissionIndex(tmp_path / "permissions.json")
+    asyncio.run(permissions.load())
+    return permissions
+
+
+def test_tier_allows():
+    assert tier_allows("admin", "mod")
+    assert tier_allows("mod", "mod")
+    assert not tier_allows("user", "mod")
+    assert tier_allows("none", "none")
+    assert not tier_allows("none", "user")
+
+
+def test_highest_mapped_role_wins(permissions):
+    asyncio.run(permissions.set_role(500, "mod"))
+    asyncio.run(permissions.set_role(600, "user"))
+    assert permissions.tier_of(member(2, [600, 500])) == "mod"
+    assert permissions.tier_of(member(3, [700])) == "user"
+
+
+def test_owner_and_administrators_are_admins(permissions):
+    asyncio.run(permissions.set_default("none"))
+    assert permissions.tier_of(member(1)) == "admin"
+    assert permissions.tier_of(member(2, administrator=True)) == "admin"
+    assert permissions.tier_of(member(3)) == "none"
+
+
+def test_changing_mappings_clears_cached_tiers(permissions):
+    alice = member(2, [500])
+    assert permissions.tier_of(alice) == "user"
+    asyncio.run(permissions.set_role(500, "admin"))
+    assert permissions.tier_of(alice) == "admin"
+    asyncio.run(permissions.set_role(500, None))
+    assert permissions.tier_of(alice) == "user"
+
+
+def test_refresh_member_after_role_change(permissions):
+    asyncio.run(permissions.set_role(500, "mod"))
+    alice = member(2)
+    assert permissions.tier_of(alice) == "user"
+    alice.roles.append(SimpleNamespace(id=500))
+    permissions.refresh_member(alice)
+    assert permissions.tier_of(alice) == "mod"
+
+
+def test_mappings_are_saved_and_loaded(permissions, tmp_path):
+    asyncio.run(permissions.set_role(500, "mod"))
+    asyncio.run(permissions.set_default("none"))
+    saved = json.loads((tmp_path / "permissions.json").read_text())
+    assert saved == {"default": "none", "roles": {"500": "mod"}}
+    reloaded = PermissionIndex(tmp_path / "permissions.json")
+    asyncio.run(reloaded.load())
+    assert reloaded.roles == {500: "mod"}
+    assert reloaded.default_tier == "none"
+
+
+def test_unknown_tiers_are_rejected(tmp_path):
+    permissions_file = tmp_path / "permissions.json"
+    permissions_file.write_text('{"roles": {"500": "owner"}}')
+    with pytest.raises(ValueError):
+        asyncio.run(PermissionIndex(permissions_file).load())
+
+
+def test_dispatch_refuses_lower_tiers(make_commander):
+    commander = make_commander()
+    reply = asyncio.run(
+        commander.dispatch_command("killserver", "alice", "mod")
+    )
+    assert reply.startswith("Command `killserver` needs the admin tier")
+    reply = asyncio.run(commander.dispatch_command("op alice", "alice", "user"))
+    assert "needs the mod tier" in reply
+    reply = asyncio.run(commander.dispatch_command("jobs", "alice", "none"))
+    assert "needs the user tier" in reply
+
+
+def test_userrole_manages_mappings(make_commander, tmp_path):
+    permissions = PermissionIndex(tmp_path / "permissions.json")
+    commander = make_commander(permissions=permissions)
+
+    def userrole(arguments: str) -> str:
+        return asyncio.run(
+            commander.dispatch_command(f"userrole {arguments}", "o", "admin")
+        )
+
+    assert userrole("<@&500> mod") == "<@&500> now has the mod tier."
+    assert userrole("600 owner").startswith("Tier must be one of")
+    assert userrole("default none").endswith("the none tier.")
+    assert "- <@&500>: mod" in userrole("")
+    assert userrole("500 remove") == "Removed the tier of <@&500>."
+    assert permissions.roles == {}
+
+
+def test_scheduled_commands_keep_their_creators_tier(make_commander):
+    commander = make_commander()
+    notes = []
+
+    async def note(message: str) -> None:
+        notes.append(message)
+
+    commander.lifecycle_handlers.append(note)
+
+    async def run() -> tuple[str, str]:
+        refused = await commander.dispatch_command(
+            "cron add @daily filterstats", "bob", "mod"
+        )
+        added = await commander.dispatch_command(
+            "cron add @daily filterstats", "alice", "admin"
+        )
+        await commander.run_scheduled(
+            Schedule(CronExpression("@daily"), "killserver", "bob", "mod")
+        )
+        await commander.jobs.close()
+        return refused, added
+
+    refused, added = asyncio.run(run())
+    assert "needs the admin tier" in refused
+    assert added.endswith("as #1.")
+    assert commander.jobs.schedules[1].tier == "admin"
+    assert commander.jobs.schedules[1].user_name == "alice"
+    assert "needs the admin tier, you have the mod tier" in notes[-1]
@@ -0,0 +1,73 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from craftlink import presence as presence_module
+from craftlink.parser import PlayerJoin, PlayerLeave, ServerStarted
+from craftlink.presence import PresenceIndex, format_duration
+
+
+def event(event_type, player=None):
+    if event_type is ServerStarted:
+        return ServerStarted("12:00:00", "INFO", None, "Done",
+                             startup_seconds=None)
+    return event_type("12:00:00", "INFO", None, player,
+                      player=player, player_id=f"id-{player}")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(
+        presence_module, "time", SimpleNamespace(time=lambda: clock.now)
+    )
+    return clock
+
+
+def test_sessions_add_up_and_are_saved(tmp_path, clock):
+    history_file = tmp_path / "players.json"
+
+    async def run():
+        presence = PresenceIndex(history_file, write_delay=60)
+        presence.handle_event(event(PlayerJoin, "Steve"))
+        clock.now += 100
+        presence.handle_event(event(PlayerLeave, "Steve"))
+        presence.handle_event(event(PlayerJoin, "Steve"))
+        presence.handle_event(event(PlayerJoin, "Alex"))
+        clock.now += 50
+        # A restart ends everyone's session, their leaves weren't seen.
+        presence.handle_event(event(ServerStarted))
+        await presence.flush()
+        loaded = PresenceIndex(history_file, write_delay=60)
+        await loaded.load()
+        return presence, loaded
+
+    presence, loaded = asyncio.run(run())
+    assert presence.online == {}
+    steve = loaded.players["Steve"]
+    assert (steve.player_id, steve.sessions, steve.playtime) == (
+        "id-Steve", 2, 150
+    )
+    assert (steve.first_seen, steve.last_seen) == (1000, 1150)
+    assert loaded.players["Alex"].playtime == 50
+    assert set(json.loads(history_file.read_text())) == {"Steve", "Alex"}
+
+
+def test_playtime_includes_the_current_session(tmp_path, clock):
+    presence = PresenceIndex(tmp_path / "players.json", write_delay=60)
+    presence.handle_event(event(PlayerJoin, "Steve"))
+    assert presence.playtime("Steve", clock.now + 30) == 30
+    assert presence.playtime("Nobody", clock.now) == 0
+    assert presence.find("steve") == "Steve"
+    assert presence.find("alex") is None
+
+
+@pytest.mark.parametrize(
+    "seconds, text",
+    [(0, "0s"), (59, "59s"), (61, "1m 1s"), (3600, "1h"),
+     (90061, "1d 1h"), (7200 + 59, "2h 59s")],
+)
+def test_format_duration(seconds, text):
+    assert format_duration(seconds) == text
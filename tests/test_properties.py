@@ -0,0 +1,71 @@
+import asyncio
+import os
+
+import pytest
+
+from craftlink.properties import ServerProperties
+
+PROPERTIES = (
+    "# Minecraft server properties\r\n"
+    "server-name=Dedicated Server\r\n"
+    "\r\n"
+    "! Legacy comment\r\n"
+    "max-players=10\r\n"
+    "custom-setting=on\r\n"
+)
+
+
+@pytest.fixture
+def properties_file(tmp_path):
+    properties_file = tmp_path / "server.properties"
+    properties_file.write_bytes(PROPERTIES.encode())
+    return properties_file
+
+
+def test_edits_only_touch_changed_lines(properties_file):
+    properties = ServerProperties(properties_file, "bedrock")
+    properties.load()
+    assert properties.keys == ["server-name", "max-players", "custom-setting"]
+    errors = asyncio.run(properties.set_many({
+        "max-players": "20",
+        "custom-setting": "off",
+        "difficulty": "hard",
+    }))
+    assert errors == []
+    assert properties_file.read_bytes().decode() == (
+        PROPERTIES.replace("max-players=10", "max-players=20")
+        .replace("custom-setting=on", "custom-setting=off")
+        + "difficulty=hard\r\n"
+    )
+
+
+@pytest.mark.parametrize(
+    "key, value, error",
+    [
+        ("max-players", "lots", "whole number"),
+        ("online-mode", "yes", "true or false"),
+        ("difficulty", "extreme", "one of"),
+        ("made-up", "1", "Unknown property"),
+        ("server-name", "Two\nLines", "line breaks"),
+    ],
+)
+def test_invalid_changes_change_nothing(properties_file, key, value, error):
+    properties = ServerProperties(properties_file, "bedrock")
+    properties.load()
+    errors = asyncio.run(properties.set_many({
+        "server-name": "Valid", key: value,
+    }))
+    assert len(errors) == 1 and error in errors[0]
+    assert properties_file.read_bytes().decode() == PROPERTIES
+
+
+def test_changes_on_disk_are_picked_up(properties_file):
+    properties = ServerProperties(properties_file, "bedrock")
+    properties.load()
+    properties_file.write_text("server-name=Renamed\n")
+    # Make sure the change shows, however coarse the file system's clock.
+    stat = properties_file.stat()
+    os.utime(properties_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    asyncio.run(properties.refresh())
+    assert properties.get("server-name") == "Renamed"
+    assert properties.get("max-players") is None
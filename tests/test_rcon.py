@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+from craftlink.rcon import (
+    MAX_RESPONSE_FRAGMENT,
+    SERVERDATA_AUTH,
+    SERVERDATA_RESPONSE_VALUE,
+    RconClient,
+    RconError,
+    encode_packet,
+    read_packet,
+)
+
+PASSWORD = "hunter2"
+
+
+class FakeRconServer():
+    """Answers RCON commands, holding replies until `release` is called."""
+    def __init__(self) -> None:
+        self.connections = []
+        self.held = []
+        self.commands = []
+        self.server = None
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(
+            self._handle, "127.0.0.1", 0
+        )
+        return self.server.sockets[0].getsockname()[1]
+
+    async def _handle(self, reader, writer) -> None:
+        self.connections.append(writer)
+        try:
+            while True:
+                request_id, packet_type, payload = await read_packet(reader)
+                payload = payload.decode()
+                if packet_type == SERVERDATA_AUTH:
+                    writer.write(
+                        encode_packet(0, SERVERDATA_RESPONSE_VALUE, "")
+                    )
+                    reply_id = request_id if payload == PASSWORD else -1
+                    writer.write(encode_packet(reply_id, 2, ""))
+                elif payload == "hold":
+                    self.commands.append(payload)
+                    self.held.append((writer, request_id))
+                elif payload == "big":
+                    for text in ("x" * MAX_RESPONSE_FRAGMENT, "tail"):
+                        writer.write(encode_packet(request_id, 0, text))
+                else:
+                    writer.write(
+                        encode_packet(request_id, 0, f"Ran {payload}")
+                    )
+        except asyncio.IncompleteReadError:
+            writer.close()
+
+    def release(self) -> None:
+        for writer, request_id in self.held:
+            writer.write(encode_packet(request_id, 0, "Released"))
+        self.held.clear()
+
+    def drop_connections(self) -> None:
+        for writer in self.connections:
+            writer.close()
+
+    async def close(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+
+def run_with_server(test):
+    async def run():
+        server = FakeRconServer()
+        port = await server.start()
+        try:
+            return await test(server, port)
+        finally:
+            await server.close()
+    return asyncio.run(run())
+
+
+def test_replies_are_matched_to_their_commands():
+    async def test(server, port):
+        client = RconClient("127.0.0.1", port, PASSWORD, timeout=2)
+        held = asyncio.create_task(client.command("hold"))
+        while not server.held:
+            await asyncio.sleep(0.01)
+        quick = await client.command("list")
+        server.release()
+        replies = quick, await held, await client.command("big")
+        await client.close()
+        return replies, len(server.connections)
+
+    (quick, held, big), connections = run_with_server(test)
+    assert quick == "Ran list"
+    assert held == "Released"
+    assert big == "x" * MAX_RESPONSE_FRAGMENT + "tail"
+    assert connections == 1
+
+
+def test_wrong_password_is_refused():
+    async def test(server, port):
+        client = RconClient("127.0.0.1", port, "wrong", timeout=2)
+        with pytest.raises(RconError, match="authentication failed"):
+            await client.command("list")
+
+    run_with_server(test)
+
+
+def test_reconnects_after_the_connection_drops():
+    async def test(server, port):
+        client = RconClient("127.0.0.1", port, PASSWORD, timeout=2)
+        await client.command("list")
+        server.drop_connections()
+        while client.connected:
+            await asyncio.sleep(0.01)
+        reply = await client.command("list")
+        await client.close()
+        return reply, len(server.connections)
+
+    assert run_with_server(test) == ("Ran list", 2)
+
+
+def test_commands_arent_resent_once_written():
+    async def test(server, port):
+        client = RconClient("127.0.0.1", port, PASSWORD, timeout=2)
+        held = asyncio.create_task(client.command("hold"))
+        while not server.held:
+            await asyncio.sleep(0.01)
+        server.drop_connections()
+        with pytest.raises(RconError):
+            await held
+        await client.close()
+        return server.commands, len(server.connections)
+
+    assert run_with_server(test) == (["hold"], 1)
@@ -0,0 +1,39 @@
+import asyncio
+from types import SimpleNamespace
+
+
+def fake_process(output: bytes, limit: int = 2 ** 16) -> SimpleNamespace:
+    """A finished server process with the given output."""
+    stdout = asyncio.StreamReader(limit=limit)
+    stdout.feed_data(output)
+    stdout.feed_eof()
+
+    async def wait():
+        return 0
+
+    return SimpleNamespace(stdout=stdout, wait=wait)
+
+
+def read(commander, output: bytes, **kwargs) -> list[bytes]:
+    async def run():
+        await commander.read_server_messages(fake_process(output, **kwargs))
+        queue = commander.server_message_queue
+        return [queue.get_nowait()[1] for _ in range(queue.qsize())]
+
+    return asyncio.run(run())
+
+
+def test_reads_each_line(make_commander):
+    commander = make_commander()
+    lines = read(commander, b"one\ntwo\nthree")
+    # The partial last line is kept, with a line ending added.
+    assert lines == [b"one\n", b"two\n", b"three\n"]
+    assert commander.metrics.lines_read == 3
+
+
+def test_long_lines_are_read_in_pieces(make_commander):
+    commander = make_commander()
+    lines = read(commander, b"x" * 40 + b"\nshort\n", limit=16)
+    assert b"".join(lines) == b"x" * 40 + b"\nshort\n"
+    assert lines[-1] == b"short\n"
+    assert len(lines) > 2
@@ -0,0 +1,53 @@
+import asyncio
+
+from craftlink import bot as bot_module
+from craftlink.bot import CraftBot
+
+
+def make_bot(tmp_path) -> CraftBot:
+    return CraftBot(
+        "token", [], permissions_file=str(tmp_path / "permissions.json")
+    )
+
+
+def test_batch_lingers_for_late_lines(monkeypatch, tmp_path):
+    monkeypatch.setattr(bot_module, "RELAY_LINGER_SECONDS", 0.1)
+    bot = make_bot(tmp_path)
+
+    async def run():
+        queue = asyncio.Queue()
+        await queue.put((0.0, b"first\n"))
+
+        async def late():
+            await asyncio.sleep(0.02)
+            await queue.put((0.0, b"second\n"))
+            await asyncio.sleep(0.2)
+            await queue.put((0.0, b"third\n"))
+
+        task = asyncio.create_task(late())
+        batch = await bot.next_server_message_batch(queue)
+        await task
+        return batch, queue.qsize()
+
+    batch, left = asyncio.run(run())
+    assert [i[1] for i in batch] == [b"first\n", b"second\n"]
+    assert left == 1
+
+
+def test_batch_stops_once_full(monkeypatch, tmp_path):
+    monkeypatch.setattr(bot_module, "RELAY_BATCH_SIZE", 10)
+    bot = make_bot(tmp_path)
+
+    async def run():
+        queue = asyncio.Queue()
+        for _ in range(5):
+            queue.put_nowait((0.0, b"line\n"))
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        batch = await bot.next_server_message_batch(queue)
+        return batch, queue.qsize(), loop.time() - start
+
+    batch, left, waited = asyncio.run(run())
+    assert len(batch) == 2
+    assert left == 3
+    assert waited < bot_module.RELAY_LINGER_SECONDS
@@ -0,0 +1,58 @@
+import asyncio
+from types import SimpleNamespace
+
+from craftlink.parser import BEDROCK_PREFIX
+from craftlink.responses import ResponseCapture, compile_signatures
+
+PREFIX = b"[2024-05-01 12:00:00:123 INFO] "
+
+
+def capture(command: str) -> ResponseCapture:
+    signature, max_lines = compile_signatures("bedrock")[command]
+    return ResponseCapture(signature, max_lines, BEDROCK_PREFIX)
+
+
+def test_reply_continues_on_unprefixed_lines():
+    response = capture("list")
+    assert not response.offer(PREFIX + b"Player connected: Steve\n")
+    assert response.offer(PREFIX + b"There are 1/10 players online:\n")
+    assert not response.finished.is_set()
+    assert response.offer(b"Steve\n")
+    assert response.finished.is_set()
+    assert not response.offer(b"Alex\n")
+
+
+def test_other_output_doesnt_continue_a_reply():
+    response = capture("list")
+    response.offer(PREFIX + b"There are 0/10 players online:\n")
+    assert not response.offer(PREFIX + b"Saving...\n")
+
+
+def test_errors_are_captured_as_the_reply():
+    response = capture("kick")
+    assert response.offer(PREFIX + b"No targets matched selector\n")
+
+
+def test_wait_gives_up_without_a_reply():
+    async def run():
+        return await capture("list").wait(timeout=0.01, settle_time=0.01)
+
+    assert asyncio.run(run()) == []
+
+
+def test_query_server_returns_the_reply(make_commander):
+    commander = make_commander()
+    written = []
+
+    def write(command):
+        written.append(command)
+        reply = (PREFIX + b"There are 1/10 players online:\n", b"Steve\n")
+        for line in reply:
+            asyncio.get_running_loop().call_soon(
+                commander.response_capture.offer, line
+            )
+
+    commander.server_proc = SimpleNamespace(stdin=SimpleNamespace(write=write))
+    reply = asyncio.run(commander.query_server("list"))
+    assert written == [b"list\n"]
+    assert reply == "There are 1/10 players online:\nSteve"
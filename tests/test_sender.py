@@ -0,0 +1,185 @@
+import asyncio
+from types import SimpleNamespace
+
+from craftlink import sender as sender_module
+from craftlink.sender import MessageSender, RateLimitBucket, split_lines
+
+
+class FakeMessage():
+    def __init__(self, channel, **kwargs) -> None:
+        self.channel = channel
+        self.kwargs = kwargs
+
+    async def edit(self, **kwargs) -> "FakeMessage":
+        self.channel.log.append(("edit", kwargs["content"]))
+        self.kwargs = kwargs
+        return self
+
+    async def delete(self) -> None:
+        self.channel.log.append(("delete", self.kwargs["file"].filename))
+
+
+class FakeChannel(SimpleNamespace):
+    def __init__(self) -> None:
+        super().__init__(id=1, log=[])
+
+    async def send(self, **kwargs) -> FakeMessage:
+        if "file" in kwargs:
+            self.log.append(("send", kwargs["file"].filename))
+        else:
+            self.log.append(("send", kwargs.get("content")))
+        return FakeMessage(self, **kwargs)
+
+
+def test_split_lines():
+    assert split_lines("a\nbb\nccc", 5) == ["a\nbb", "ccc"]
+    assert split_lines("abcdefg", 3) == ["abc", "def", "g"]
+    assert split_lines("", 3) == [""]
+
+
+def test_bucket_waits_once_empty():
+    async def run():
+        bucket = RateLimitBucket(2, 0.2)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(3):
+            await bucket.acquire()
+        return loop.time() - start
+
+    assert 0.09 <= asyncio.run(run()) < 0.5
+
+
+def test_session_log_is_uploaded_in_segments(monkeypatch):
+    monkeypatch.setattr(sender_module, "SESSION_LOG_SEGMENT_CHARS", 30000)
+    line = "x" * 99
+
+    async def run():
+        sender = MessageSender()
+        channel = FakeChannel()
+        sender.outboxes[channel.id] = outbox = sender_module._Outbox(channel)
+        for _ in range(3):
+            payload = {"session_log": [line] * 140, "footer": "Console."}
+            await sender._deliver(outbox, payload)
+        return channel.log, outbox
+
+    log, outbox = asyncio.run(run())
+    assert log == [
+        ("send", "session-log-1.txt"),
+        ("send", "session-log-1.txt"),
+        ("delete", "session-log-1.txt"),
+        ("send", "session-log-2.txt"),
+    ]
+    assert outbox.session_log_size == 140 * len(f"{line}\n")
+
+
+def test_worker_survives_unexpected_errors():
+    async def run():
+        sender = MessageSender()
+        channel = FakeChannel()
+        send = channel.send
+        calls = []
+
+        async def flaky_send(**kwargs):
+            calls.append(kwargs)
+            if len(calls) == 1:
+                raise OSError("Connection reset.")
+            return await send(**kwargs)
+
+        channel.send = flaky_send
+        await sender.send(channel, "Lost")
+        while not calls:
+            await asyncio.sleep(0)
+        message = await sender.post(channel, "Delivered")
+        await sender.close()
+        return channel.log, message
+
+    log, message = asyncio.run(run())
+    assert log == [("send", "Delivered")]
+    assert message is not None
+
+
+def test_posts_are_sent_in_turn_and_edited():
+    async def run():
+        sender = MessageSender()
+        channel = FakeChannel()
+        await sender.send(channel, "See its progress below.")
+        message = await sender.post(channel, "Job #1 running")
+        edited = await sender.post(channel, "Job #1 done", message)
+        await sender.close()
+        return channel.log, message, edited
+
+    log, message, edited = asyncio.run(run())
+    assert log == [
+        ("send", "See its progress below."),
+        ("send", "Job #1 running"),
+        ("edit", "Job #1 done"),
+    ]
+    assert edited is message
+
+
+def test_post_edits_wait_for_the_rate_limit():
+    async def run():
+        sender = MessageSender()
+        channel = FakeChannel()
+        message = await sender.post(channel, "Job #1")
+        bucket = sender.outboxes[channel.id].bucket
+        bucket.tokens = 0.0
+        bucket.updated = asyncio.get_running_loop().time()
+        start = asyncio.get_running_loop().time()
+        await sender.post(channel, "Job #1 done", message)
+        waited = asyncio.get_running_loop().time() - start
+        await sender.close()
+        return waited, bucket
+
+    waited, bucket = asyncio.run(run())
+    assert waited >= 0.9 * bucket.period / bucket.capacity
+
+
+def test_close_releases_pending_posts():
+    async def run():
+        sender = MessageSender()
+        channel = FakeChannel()
+        message = await sender.post(channel, "Job #1")
+        bucket = sender.outboxes[channel.id].bucket
+        bucket.block(60)
+        post = asyncio.create_task(sender.post(channel, "Job #1", message))
+        await asyncio.sleep(0)
+        await sender.close()
+        return await post
+
+    assert asyncio.run(run()) is None
+
+
+def test_coalesce_merges_texts_with_the_same_footer():
+    async def run():
+        sender = MessageSender()
+        return sender._coalesce([
+            ("Console.", "a", 1.0),
+            ("Console.", "b", 2.0),
+            (None, "c", None),
+            ("Console.", "d", 3.0),
+        ])
+
+    payloads = asyncio.run(run())
+    assert payloads == [
+        {"description": "a\nb", "footer": "Console.", "created_at": 1.0},
+        {"content": "c", "created_at": None},
+        {"description": "d", "footer": "Console.", "created_at": 3.0},
+    ]
+
+
+def test_long_text_falls_back_to_an_attachment(monkeypatch):
+    monkeypatch.setattr(sender_module, "DISCORD_MESSAGE_LIMIT", 10)
+    # Leaves the same 10 characters once fenced in a code block.
+    monkeypatch.setattr(sender_module, "DISCORD_EMBED_LIMIT", 16)
+    texts = ["line"] * 4
+    sender = MessageSender()
+    assert sender._group_payloads(None, texts[:3]) == [
+        {"content": "line\nline"}, {"content": "line"}
+    ]
+    monkeypatch.setattr(sender_module, "MAX_SPLIT_MESSAGES", 1)
+    (payload,) = sender._group_payloads(None, texts)
+    assert payload["attachment"].pieces == ["line\n"] * 4
+    assert sender._group_payloads("Console.", texts) == [
+        {"session_log": texts, "footer": "Console."}
+    ]
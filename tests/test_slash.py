@@ -0,0 +1,46 @@
+import asyncio
+from types import SimpleNamespace
+
+from craftlink.slash import build_command_tree
+
+
+class FakeBot(SimpleNamespace):
+    async def run_slash_command(self, interaction, command: str) -> None:
+        self.commands.append(command)
+
+
+def make_tree(commander=None):
+    bot = FakeBot(
+        commands=[],
+        commanders={},
+        http=None,
+        _connection=SimpleNamespace(_command_tree=None),
+    )
+    bot.commanders[1] = commander or SimpleNamespace(server_type="bedrock")
+    return bot, build_command_tree(bot)
+
+
+def test_changeprop_value_with_spaces(make_commander, server_dir):
+    commander = make_commander()
+    bot, tree = make_tree(commander)
+    changeprop = tree.get_command("changeprop")
+
+    async def run() -> str:
+        await changeprop.callback(None, "server-name", "My Cool Server")
+        return await commander.dispatch_command(
+            bot.commands[-1], "alice", "admin"
+        )
+
+    reply = asyncio.run(run())
+    assert bot.commands == ["changeprop server-name My Cool Server"]
+    assert reply.startswith("Changed `server-name=My Cool Server`")
+    properties = (server_dir / "server.properties").read_text()
+    assert "server-name=My Cool Server\n" in properties
+
+
+def test_text_commands_take_arguments_as_given():
+    bot, tree = make_tree()
+    backup = tree.get_command("backup")
+    asyncio.run(backup.callback(None, "restore 20240101-000000"))
+    asyncio.run(backup.callback(None, None))
+    assert bot.commands == ["backup restore 20240101-000000", "backup "]
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+from craftlink import supervisor as supervisor_module
+from craftlink.supervisor import ServerSupervisor
+
+
+class FakeProcess():
+    """A server process, exiting with `exit_on` signals or `exit()`."""
+    def __init__(self, exit_on: tuple[str] = ()) -> None:
+        self.pid = 1234
+        self.returncode = None
+        self.exit_on = exit_on
+        self.signals = []
+        self._exited = asyncio.Event()
+
+    def exit(self, returncode: int) -> None:
+        self.returncode = returncode
+        self._exited.set()
+
+    async def wait(self) -> int:
+        await self._exited.wait()
+        return self.returncode
+
+    def terminate(self) -> None:
+        self.signals.append("terminate")
+        if "terminate" in self.exit_on:
+            self.exit(-15)
+
+    def kill(self) -> None:
+        self.signals.append("kill")
+        self.exit(-9)
+
+
+class FakeCommander():
+    def __init__(self, server_proc: FakeProcess) -> None:
+        self.name = "Test"
+        self.server_proc = server_proc
+        self.notices = []
+        self.commands = []
+        self.restarts = []
+        self.jobs = self
+
+    @property
+    async def server_running(self) -> bool:
+        return self.server_proc.returncode is None
+
+    async def notify(self, message: str) -> None:
+        self.notices.append(message)
+
+    async def send_server_command(self, command: str) -> None:
+        self.commands.append(command)
+        if "stop" in self.server_proc.exit_on:
+            self.server_proc.exit(0)
+
+    async def start_server(self) -> None:
+        pass
+
+    def submit(self, name, function, **kwargs) -> None:
+        self.restarts.append(name)
+
+
+@pytest.fixture(autouse=True)
+def short_timeouts(monkeypatch):
+    monkeypatch.setattr(supervisor_module, "RESTART_BACKOFF_MIN_SECONDS", 0)
+    monkeypatch.setattr(supervisor_module, "STOP_TIMEOUT_SECONDS", 0.01)
+    monkeypatch.setattr(supervisor_module, "TERMINATE_TIMEOUT_SECONDS", 0.01)
+
+
+def watch_exit(commander, supervisor, returncode):
+    async def run():
+        commander.server_proc = FakeProcess()
+        supervisor.watch(commander.server_proc)
+        commander.server_proc.exit(returncode)
+        await supervisor.watch_task
+    asyncio.run(run())
+
+
+def test_clean_exit_isnt_restarted():
+    commander = FakeCommander(None)
+    supervisor = ServerSupervisor(commander, auto_restart=True)
+    watch_exit(commander, supervisor, 0)
+    assert commander.notices[0].startswith("Test server stopped")
+    assert commander.restarts == []
+
+
+def test_crashes_restart_until_crash_looping():
+    commander = FakeCommander(None)
+    supervisor = ServerSupervisor(commander, auto_restart=True)
+    for _ in range(supervisor_module.CRASH_LOOP_LIMIT):
+        watch_exit(commander, supervisor, 1)
+    assert len(commander.restarts) == supervisor_module.CRASH_LOOP_LIMIT - 1
+    assert "not restarting it again" in commander.notices[-1]
+
+
+def test_crashes_arent_restarted_without_auto_restart():
+    commander = FakeCommander(None)
+    supervisor = ServerSupervisor(commander, auto_restart=False)
+    watch_exit(commander, supervisor, 1)
+    assert commander.notices == [
+        "Test server crashed with exit code 1 after 0s."
+    ]
+    assert commander.restarts == []
+
+
+@pytest.mark.parametrize(
+    "exit_on, signals, killed",
+    [
+        (("stop",), [], False),
+        (("terminate",), ["terminate"], False),
+        ((), ["terminate", "kill"], True),
+    ],
+)
+def test_stop_escalates_until_the_server_exits(exit_on, signals, killed):
+    async def run():
+        commander = FakeCommander(FakeProcess(exit_on))
+        supervisor = ServerSupervisor(commander, auto_restart=True)
+        was_killed = await supervisor.stop()
+        return commander, was_killed
+
+    commander, was_killed = asyncio.run(run())
+    assert commander.commands == ["stop"]
+    assert commander.server_proc.signals == signals
+    assert was_killed is killed